@@ -0,0 +1,597 @@
+"""
+main.py の処理性能を計測するベンチマーク。
+実機のカメラファイルを使わずに、合成したメディアファイルのツリーを生成して計測する(オフラインで実行可能)。
+
+使い方:
+    python benchmark.py generate OUT_DIR --count 500 --depth 3
+    python benchmark.py run --count 500 --repeat 3 --output report.json
+    python benchmark.py run --baseline baseline.json            # 基準値と比較し、劣化があれば終了コード1
+    python benchmark.py run --save-baseline baseline.json       # 今回の結果を基準値として保存
+    python benchmark.py run --scenario startup                  # import main の時間が予算内かを確認
+    python benchmark.py run --scenario manifest                 # 走査結果の1ファイルあたりのメモリ量
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# 生成するファイル種別ごとの既定の割合
+DEFAULT_MIX = {
+    "jpeg": 40,      # EXIF付きJPEG
+    "png": 8,        # メタデータなしPNG
+    "raw": 8,        # TIFFベースのRAWスタブ(.dng/.arw)
+    "mp4": 12,       # mvhd に作成日時を持つMP4
+    "nometa": 8,     # EXIFのないJPEG
+    "duplicate": 10, # 既存ファイルの完全な複製
+    "burst": 14,     # 同じ撮影日時を持つ連写(ファイル名が衝突する)
+    "avi": 0,        # hdrl に IDIT を持つAVI(--mix avi=5 などで有効にする)
+    "mkv": 0,        # Info に DateUTC を持つMatroska(--mix mkv=5 などで有効にする)
+}
+# 基準値と比較する際の許容劣化率
+DEFAULT_TOLERANCE = 0.15
+# MP4 の時刻の基準(1904-01-01 UTC)
+MP4_EPOCH = datetime(1904, 1, 1)
+# Matroska の時刻の基準(2001-01-01 UTC)
+MATROSKA_EPOCH = datetime(2001, 1, 1)
+# import main にかけてよい時間の上限(ミリ秒、-X importtime の累積値)
+STARTUP_IMPORT_BUDGET_MS = 100.0
+# import main の時点で読み込まれていてはいけない重い依存モジュール
+LAZY_MODULES = ("PIL", "PIL.Image", "pytz", "ffmpeg", "exiftool", "tkinter", "multiprocessing", "tempfile")
+# 1つのシナリオにかけてよい時間の既定値(秒)と、子プロセスの生存を確認する間隔(秒)
+DEFAULT_SCENARIO_TIMEOUT = 3600.0
+RESULT_POLL_SECONDS = 1.0
+# manifest シナリオで記録する合成エントリの数
+MANIFEST_BENCH_FILES = 200000
+
+
+# --- 合成コーパスの生成 ---
+def _exif_bytes(dt, model="BenchCam"):
+    """撮影日時と機種名を持つEXIFを作成する"""
+    from PIL import Image
+    exif = Image.Exif()
+    exif[0x0110] = model
+    exif[0x0132] = dt.strftime("%Y:%m:%d %H:%M:%S")
+    exif_ifd = exif.get_ifd(0x8769)
+    exif_ifd[0x9003] = dt.strftime("%Y:%m:%d %H:%M:%S")
+    exif_ifd[0x9004] = dt.strftime("%Y:%m:%d %H:%M:%S")
+    return exif
+
+
+def _write_image(path, rng, fmt, dt=None, size=(64, 48)):
+    from PIL import Image
+    color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+    im = Image.new("RGB", size, color)
+    # 同じ色でも内容が異なるよう数ピクセルを乱数で塗る
+    for _ in range(8):
+        im.putpixel((rng.randrange(size[0]), rng.randrange(size[1])), (rng.randrange(256), 0, 0))
+    kwargs = {}
+    if dt is not None:
+        kwargs["exif"] = _exif_bytes(dt)
+    im.save(path, format=fmt, **kwargs)
+
+
+def _box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def _mp4_bytes(dt, rng, moov_at_end=False, model=None):
+    """
+    ftyp / moov(mvhd, trak/tkhd, trak/mdia/mdhd) / mdat からなる最小限のMP4を作る。
+    model を指定すると moov/udta/©mod に機種名を入れる。
+    """
+    seconds = int((dt - MP4_EPOCH).total_seconds())
+    mvhd = _box(b"mvhd", struct.pack(">B3xIIII", 0, seconds, seconds, 1000, 5000) + bytes(80))
+    tkhd = _box(b"tkhd", struct.pack(">B3xIIII", 0, seconds, seconds, 1, 0) + bytes(64))
+    mdhd = _box(b"mdhd", struct.pack(">B3xIIII", 0, seconds, seconds, 1000, 5000) + bytes(4))
+    trak = _box(b"trak", tkhd + _box(b"mdia", mdhd))
+    udta = b""
+    if model:
+        text = model.encode("utf-8")
+        udta = _box(b"udta", _box(b"\xa9mod", struct.pack(">HH", len(text), 0x55C4) + text))
+    moov = _box(b"moov", mvhd + trak + udta)
+    ftyp = _box(b"ftyp", b"isom" + struct.pack(">I", 512) + b"isomiso2mp41")
+    mdat = _box(b"mdat", rng.randbytes(rng.randrange(4096, 65536)))
+    return ftyp + (mdat + moov if moov_at_end else moov + mdat)
+
+
+def _idit_text(dt):
+    # ロケールによらず英語の曜日・月名で書く
+    days = ("MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN")
+    months = ("JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC")
+    return f"{days[dt.weekday()]} {months[dt.month - 1]} {dt.day:02d} {dt:%H:%M:%S} {dt.year}"
+
+
+def _riff_chunk(chunk_id, payload):
+    return struct.pack("<4sI", chunk_id, len(payload)) + payload + (b"\0" if len(payload) % 2 else b"")
+
+
+def _avi_bytes(dt, rng, model=None):
+    """
+    hdrl に IDIT(カメラのローカル時刻)を持ち、movi の後ろに LIST/INFO を置く最小限のAVIを作る。
+    model を指定すると hdrl/strl/strd に機種名を持つ EXIF を入れる。
+    """
+    idit = _riff_chunk(b"IDIT", _idit_text(dt).encode("ascii") + b"\n\0")
+    strl = b""
+    if model:
+        from PIL import Image
+        exif = Image.Exif()
+        exif[0x0110] = model
+        strl = _riff_chunk(b"LIST", b"strl" + _riff_chunk(b"strh", bytes(56)) + _riff_chunk(b"strd", b"AVIF" + exif.tobytes()))
+    hdrl = _riff_chunk(b"LIST", b"hdrl" + _riff_chunk(b"avih", bytes(56)) + strl + idit)
+    movi = _riff_chunk(b"LIST", b"movi" + rng.randbytes(rng.randrange(4096, 65536)))
+    info = _riff_chunk(b"LIST", b"INFO" + _riff_chunk(b"ISFT", b"BenchCam\0"))
+    return _riff_chunk(b"RIFF", b"AVI " + hdrl + movi + info)
+
+
+def _ebml(element_id, payload):
+    # サイズは常に8バイトの可変長整数で書く
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, "big") + b"\x01" + len(payload).to_bytes(7, "big") + payload
+
+
+def _mkv_bytes(dt, rng):
+    """EBML ヘッダー / Segment(Info/DateUTC, Cluster) からなる最小限のMatroskaを作る"""
+    nanoseconds = int((dt - MATROSKA_EPOCH).total_seconds()) * 1_000_000_000
+    info = _ebml(0x1549A966, _ebml(0x4461, struct.pack(">q", nanoseconds)))
+    cluster = _ebml(0x1F43B675, rng.randbytes(rng.randrange(4096, 65536)))
+    return _ebml(0x1A45DFA3, _ebml(0x4282, b"matroska")) + _ebml(0x18538067, info + cluster)
+
+
+def generate_corpus(root, count=500, mix=None, depth=3, seed=0):
+    """
+    root 以下に count 個のメディアファイル(とサイドカー)を生成する。
+    戻り値は種別ごとの生成数の辞書。
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    os.makedirs(root, exist_ok=True)
+    dirs = [root]
+    for i in range(max(depth, 1) * 3):
+        parent = rng.choice(dirs)
+        if parent.count(os.sep) - root.count(os.sep) < depth:
+            new_dir = os.path.join(parent, f"DCIM{i:03d}")
+            os.makedirs(new_dir, exist_ok=True)
+            dirs.append(new_dir)
+    base_date = datetime(2015, 1, 1)
+    created = {k: 0 for k in kinds}
+    created["sidecar"] = 0
+    written = []
+    burst_dt = None
+    for i in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "duplicate" and not written:
+            kind = "jpeg"
+        directory = rng.choice(dirs)
+        dt = base_date + timedelta(seconds=rng.randrange(10 * 365 * 86400))
+        if kind == "jpeg":
+            path = os.path.join(directory, f"IMG_{i:06d}.JPG")
+            _write_image(path, rng, "JPEG", dt)
+        elif kind == "png":
+            path = os.path.join(directory, f"Screenshot_{i:06d}.png")
+            _write_image(path, rng, "PNG")
+        elif kind == "raw":
+            path = os.path.join(directory, f"DSC{i:05d}.{rng.choice(['ARW', 'DNG'])}")
+            tmp_path = path + ".tif"
+            _write_image(tmp_path, rng, "TIFF", dt)
+            os.replace(tmp_path, path)
+        elif kind == "mp4":
+            stem = f"C{i:04d}"
+            path = os.path.join(directory, f"{stem}.MP4")
+            with open(path, "wb") as f:
+                f.write(_mp4_bytes(dt, rng, moov_at_end=rng.random() < 0.3, model="BenchCam"))
+            # カメラが書き出すサイドカー(XML/THM)
+            with open(os.path.join(directory, f"{stem}M01.XML"), "w", encoding="utf-8") as f:
+                f.write(f'<?xml version="1.0"?><NonRealTimeMeta><CreationDate value="{dt.isoformat()}"/></NonRealTimeMeta>')
+            _write_image(os.path.join(directory, f"{stem}.THM"), rng, "JPEG", size=(16, 12))
+            created["sidecar"] += 2
+        elif kind == "avi":
+            path = os.path.join(directory, f"DSCF{i:04d}.AVI")
+            with open(path, "wb") as f:
+                f.write(_avi_bytes(dt, rng, model="BenchCam"))
+        elif kind == "mkv":
+            path = os.path.join(directory, f"REC_{i:06d}.mkv")
+            with open(path, "wb") as f:
+                f.write(_mkv_bytes(dt, rng))
+        elif kind == "nometa":
+            path = os.path.join(directory, f"IMG_{i:06d}_edit.jpg")
+            _write_image(path, rng, "JPEG")
+        elif kind == "duplicate":
+            source = rng.choice(written)
+            path = os.path.join(directory, f"copy_{i:06d}{os.path.splitext(source)[1]}")
+            shutil.copyfile(source, path)
+        else: # burst
+            if burst_dt is None or rng.random() < 0.25:
+                burst_dt = dt
+            path = os.path.join(directory, f"BURST_{i:06d}.JPG")
+            _write_image(path, rng, "JPEG", burst_dt)
+        created[kind] += 1
+        if kind != "duplicate":
+            written.append(path)
+    return created
+
+
+def _copy_corpus(corpus, work_dir):
+    source = os.path.join(work_dir, "source")
+    shutil.copytree(corpus, source)
+    return source
+
+
+def _list_media(root):
+    import main
+    return list(main.scan_source_files(root).paths())
+
+
+# --- シナリオ ---
+def scenario_parse(corpus, repeat):
+    """validate_and_parse_datetime の単体性能。キャッシュなし(seconds)と、同じ値を再度流したキャッシュありの両方を測る"""
+    import main
+    rng = random.Random(1)
+    base = datetime(2015, 1, 1)
+    samples = []
+    for _ in range(20000):
+        dt = base + timedelta(seconds=rng.randrange(10 * 365 * 86400))
+        samples.append(rng.choice([
+            dt.strftime("%Y:%m:%d %H:%M:%S"),
+            dt.strftime("%Y-%m-%dT%H:%M:%S.000000Z"),
+            dt.strftime("%Y:%m:%d %H:%M:%S+09:00"),
+        ]))
+    main._parse_datetime_str.cache_clear()
+    start = time.perf_counter()
+    for value in samples:
+        main.validate_and_parse_datetime(value)
+    uncached = time.perf_counter() - start
+    # 同じ文字列をもう一度流し、すべてキャッシュに当たる場合を測る
+    start = time.perf_counter()
+    for value in samples:
+        main.validate_and_parse_datetime(value)
+    cached = time.perf_counter() - start
+    return {"items": len(samples), "seconds": uncached, "uncached_seconds": uncached, "cached_seconds": cached}
+
+
+def _extract(files):
+    import main
+    policy = main.TimezonePolicy()
+    with ThreadPoolExecutor(max_workers=main.thread_count()) as executor:
+        list(executor.map(lambda p: main.get_file_date(p, policy), files))
+
+
+def scenario_extract_image(corpus, repeat):
+    """画像の日時抽出(get_image_date 経由)のみ。ファイルは移動しない"""
+    import main
+    files = [p for p in _list_media(corpus) if os.path.splitext(p)[1].lower() in main.IMAGE_EXTS]
+    start = time.perf_counter()
+    _extract(files)
+    return {"items": len(files), "seconds": time.perf_counter() - start}
+
+
+def scenario_extract_video(corpus, repeat):
+    """動画の日時抽出(get_video_date 経由)のみ。ファイルは移動しない"""
+    import main
+    files = [p for p in _list_media(corpus) if os.path.splitext(p)[1].lower() in main.VIDEO_EXTS]
+    start = time.perf_counter()
+    _extract(files)
+    return {"items": len(files), "seconds": time.perf_counter() - start}
+
+
+def scenario_pipeline(corpus, repeat):
+    """コーパスの複製に対して async_main を実行する(複製にかかる時間は含めない)"""
+    import main
+    with tempfile.TemporaryDirectory(prefix="organizer-bench-") as work_dir:
+        source = _copy_corpus(corpus, work_dir)
+        dest = os.path.join(work_dir, "dest")
+        os.makedirs(dest)
+        start = time.perf_counter()
+        moved, duplicate, failed, skipped, total = asyncio.run(main.async_main(source, dest))
+        elapsed = time.perf_counter() - start
+    return {
+        "items": total, "seconds": elapsed,
+        "moved": moved, "duplicate": duplicate, "failed": failed, "skipped": skipped,
+    }
+
+
+def measure_import_main(runs=5):
+    """
+    別プロセスで import main を runs 回実行し、-X importtime による main の累積読み込み時間(ミリ秒)の最小値と、
+    読み込み時点で既に読み込まれていた重い依存モジュールの一覧を返す。
+    """
+    import subprocess
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    code = (
+        "import json, sys; import main; "
+        f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    )
+    # 実際の起動と同じくバイトコードのキャッシュを使うため、PYTHONDONTWRITEBYTECODE を外して1回目で .pyc を作る
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+    subprocess.run([sys.executable, "-c", "import main"], cwd=repo_dir, env=env, check=True)
+    timings = []
+    loaded = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=repo_dir, env=env, capture_output=True, text=True, check=True,
+        )
+        for line in proc.stderr.splitlines():
+            parts = [part.strip() for part in line.split("|")]
+            if len(parts) == 3 and parts[2] == "main":
+                timings.append(int(parts[1]) / 1000)
+        loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return min(timings), loaded
+
+
+def scenario_startup(corpus, repeat):
+    """import main の所要時間と、重い依存モジュールが遅延読み込みされているかを確認する"""
+    import_ms, loaded = measure_import_main()
+    return {"items": 1, "seconds": import_ms / 1000, "import_ms": import_ms, "eager_modules": loaded}
+
+
+def scenario_manifest(corpus, repeat):
+    """
+    走査結果(FileManifest)の1ファイルあたりのメモリ量を、パスの文字列のリストと比べる。
+    実際のファイルは作らず、MANIFEST_BENCH_FILES 件の合成エントリを記録する。
+    """
+    import tracemalloc
+    import main
+    rng = random.Random(2)
+    dirs = [os.path.join(corpus, f"DCIM{i:03d}", f"{100 + i % 7}MSDCF") for i in range(MANIFEST_BENCH_FILES // 500)]
+    names = [(rng.randrange(len(dirs)), f"DSC{i:06d}.{rng.choice(['JPG', 'ARW', 'MP4'])}")
+             for i in range(MANIFEST_BENCH_FILES)]
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        paths = [os.path.join(dirs[d], name) for d, name in names]
+        list_bytes = tracemalloc.get_traced_memory()[0] - base
+        del paths
+        base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        manifest = main.FileManifest(spill_after=0)
+        for d, name in names:
+            manifest.add(manifest.add_dir(dirs[d]), name, 1 << 20, 1.6e9, main.ext_class(name))
+        elapsed = time.perf_counter() - start
+        manifest_bytes = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+    return {
+        "items": MANIFEST_BENCH_FILES, "seconds": elapsed,
+        "manifest_bytes_per_file": manifest_bytes / MANIFEST_BENCH_FILES,
+        "path_list_bytes_per_file": list_bytes / MANIFEST_BENCH_FILES,
+    }
+
+
+SCENARIOS = {
+    "startup": scenario_startup,
+    "parse": scenario_parse,
+    "extract_image": scenario_extract_image,
+    "extract_video": scenario_extract_video,
+    "pipeline": scenario_pipeline,
+    "manifest": scenario_manifest,
+}
+
+
+def _peak_rss_mb():
+    """プロセスのピークRSS(MB)。取得できない環境では None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_scenario_child(name, corpus, repeat, result_queue):
+    """シナリオを子プロセスで実行し、ピークRSSを他のシナリオから分離して計測する"""
+    import main
+    # ファイルごとの詳細ログは計測を歪めるため警告以上のみ出力する
+    main.setup_logging("WARNING")
+    try:
+        runs = []
+        stages = {}
+        for _ in range(repeat):
+            main.stage_metrics.reset()
+            run = SCENARIOS[name](corpus, repeat)
+            runs.append(run)
+            stages = main.stage_metrics.to_dict()["stages"]
+        best = min(runs, key=lambda r: r["seconds"])
+        result = dict(best)
+        result["files_per_sec"] = best["items"] / best["seconds"] if best["seconds"] else 0.0
+        result["peak_rss_mb"] = _peak_rss_mb()
+        result["stages"] = {
+            stage: {"count": s["count"], "total_seconds": s["total_seconds"], "mean_seconds": s["mean_seconds"]}
+            for stage, s in stages.items()
+        }
+        result_queue.put((name, result, None))
+    except Exception as e:
+        result_queue.put((name, None, repr(e)))
+    finally:
+        main.shutdown_logging()
+
+
+def _wait_for_result(proc, result_queue, timeout):
+    """
+    子プロセスの結果 (シナリオ名, 結果, エラー) を待つ。子プロセスが結果を返さずに終了した場合
+    (クラッシュ・OOM による強制終了など)や timeout 秒を過ぎた場合は、エラーの説明を返す。
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        try:
+            return result_queue.get(timeout=RESULT_POLL_SECONDS)
+        except queue.Empty:
+            pass
+        if not proc.is_alive():
+            # 終了の直前に書かれた結果が届いていないことがあるため、もう一度だけ確認する
+            try:
+                return result_queue.get(timeout=RESULT_POLL_SECONDS)
+            except queue.Empty:
+                return None, None, f"子プロセスが結果を返さずに終了しました(終了コード {proc.exitcode})"
+        if deadline is not None and time.monotonic() > deadline:
+            proc.terminate()
+            return None, None, f"{timeout:.0f} 秒以内に終了しませんでした"
+
+
+def run_benchmarks(corpus, scenarios, repeat=3, timeout=DEFAULT_SCENARIO_TIMEOUT, target=None):
+    """
+    各シナリオを子プロセスで実行し、(結果の辞書, 失敗したシナリオと理由の辞書) を返す。
+    target は子プロセスで実行する関数(省略時は _run_scenario_child)。
+    """
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    failures = {}
+    for name in scenarios:
+        result_queue = ctx.Queue()
+        proc = ctx.Process(target=target or _run_scenario_child, args=(name, corpus, repeat, result_queue))
+        proc.start()
+        _, result, error = _wait_for_result(proc, result_queue, timeout)
+        proc.join()
+        if error:
+            print(f"シナリオ {name} が失敗しました: {error}", file=sys.stderr)
+            failures[name] = error
+            continue
+        results[name] = result
+    return results, failures
+
+
+def check_startup_budget(results, budget_ms=STARTUP_IMPORT_BUDGET_MS):
+    """startup シナリオが予算を超えた場合や重い依存を即時読み込みしている場合の説明のリストを返す"""
+    startup = results.get("startup")
+    if startup is None:
+        return []
+    problems = []
+    if startup["import_ms"] > budget_ms:
+        problems.append(f"startup: import main {startup['import_ms']:.1f} ms > 予算 {budget_ms:.1f} ms")
+    if startup["eager_modules"]:
+        problems.append(f"startup: import main で読み込まれた重いモジュール: {', '.join(startup['eager_modules'])}")
+    return problems
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    基準値と比較して劣化したシナリオの説明のリストを返す。
+    files_per_sec の低下と peak_rss_mb の増加が tolerance を超えた場合を劣化とみなす。
+    """
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if name == "startup":
+            if current["import_ms"] > base["import_ms"] * (1 + tolerance):
+                regressions.append(f"startup: import main {current['import_ms']:.1f} ms > 基準 {base['import_ms']:.1f} ms")
+            continue
+        if base.get("files_per_sec") and current["files_per_sec"] < base["files_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: files/sec {current['files_per_sec']:.1f} < 基準 {base['files_per_sec']:.1f}"
+            )
+        if base.get("peak_rss_mb") and current.get("peak_rss_mb") and current["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: peak RSS {current['peak_rss_mb']:.1f} MB > 基準 {base['peak_rss_mb']:.1f} MB"
+            )
+    return regressions
+
+
+def format_results(results):
+    lines = [f"{'scenario':<16}{'items':>8}{'seconds':>10}{'files/s':>12}{'peakRSS(MB)':>14}"]
+    for name, r in results.items():
+        rss = f"{r['peak_rss_mb']:.1f}" if r.get("peak_rss_mb") is not None else "-"
+        lines.append(f"{name:<16}{r['items']:>8}{r['seconds']:>10.3f}{r['files_per_sec']:>12.1f}{rss:>14}")
+        if "cached_seconds" in r:
+            lines.append(f"    {'(cached)':<24}{r['items']:>8}{r['cached_seconds']:>10.3f}s")
+        for stage, s in sorted(r["stages"].items(), key=lambda item: item[1]["total_seconds"], reverse=True):
+            lines.append(f"    {stage:<24}{s['count']:>8}{s['total_seconds']:>10.3f}s{s['mean_seconds'] * 1000:>10.2f}ms")
+    return "\n".join(lines)
+
+
+def _parse_mix(text):
+    mix = dict(DEFAULT_MIX)
+    if text:
+        for item in text.split(","):
+            kind, _, weight = item.partition("=")
+            if kind not in DEFAULT_MIX:
+                raise argparse.ArgumentTypeError(f"不明な種別です: {kind}")
+            mix[kind] = int(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image organizer のベンチマーク")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="合成コーパスを生成する")
+    gen.add_argument("output")
+    run = sub.add_parser("run", help="ベンチマークを実行する")
+    run.add_argument("--corpus", help="既存のコーパス(省略時は一時ディレクトリに生成)")
+    run.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="実行するシナリオ(複数指定可)")
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--output", help="結果をJSONで保存するパス")
+    run.add_argument("--baseline", help="比較する基準値のJSON")
+    run.add_argument("--save-baseline", help="結果を基準値として保存するパス")
+    run.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    run.add_argument("--startup-budget", type=float, default=STARTUP_IMPORT_BUDGET_MS, help="import main の上限(ミリ秒)")
+    run.add_argument("--scenario-timeout", type=float, default=DEFAULT_SCENARIO_TIMEOUT,
+                     help="1つのシナリオの上限(秒、0 で無制限)")
+    for p in (gen, run):
+        p.add_argument("--count", type=int, default=500)
+        p.add_argument("--depth", type=int, default=3)
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--mix", type=_parse_mix, default=None, help="例: jpeg=50,mp4=20,duplicate=5")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        created = generate_corpus(args.output, args.count, args.mix, args.depth, args.seed)
+        print(json.dumps(created, indent=2))
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="organizer-corpus-") as tmp:
+        corpus = args.corpus
+        if not corpus:
+            corpus = os.path.join(tmp, "corpus")
+            created = generate_corpus(corpus, args.count, args.mix, args.depth, args.seed)
+            print(f"合成コーパスを生成しました: {created}")
+        results, failures = run_benchmarks(corpus, args.scenario or list(SCENARIOS), args.repeat, args.scenario_timeout)
+    print(format_results(results))
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "params": {"count": args.count, "depth": args.depth, "seed": args.seed, "repeat": args.repeat},
+        "results": results,
+        "failures": failures,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    regressions = check_startup_budget(results, args.startup_budget)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions += compare_to_baseline(results, baseline, args.tolerance)
+    if failures:
+        print("失敗したシナリオがあります:")
+        for name, error in failures.items():
+            print(f"  {name}: {error}")
+    if regressions:
+        print("性能の劣化を検出しました:")
+        for line in regressions:
+            print(f"  {line}")
+    if failures or regressions:
+        return 1
+    if args.baseline:
+        print("基準値からの劣化はありません。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+整理済みライブラリのカタログ(移動先の .image_organizer/catalog.sqlite)を検索する。
+フォルダーを走査し直したり日時を取得し直したりせずに、撮影日時・取得元・機種名で絞り込める。
+
+使い方:
+    python catalog.py DEST_DIR [--from 2024-03-01] [--to 2024-03-31] [--source file_timestamp]
+                               [--camera "ILCE-7M3"] [--kind video] [--format table|jsonl|paths] [--limit N]
+    python catalog.py DEST_DIR --count-by source|camera|month|kind    # 件数の集計
+    python catalog.py DEST_DIR --duplicates                            # 同じハッシュを持つファイル
+"""
+import argparse
+import json
+import os
+import pathlib
+import sqlite3
+import sys
+
+import main
+
+# --count-by で指定できる集計単位と対応する式
+GROUP_COLUMNS = {
+    "source": "source",
+    "camera": "camera_model",
+    "month": "substr(taken_at, 1, 7)",
+    "kind": "kind",
+}
+
+
+def catalog_path(dest_root):
+    return os.path.join(dest_root, main.ORGANIZER_STATE_DIR, main.CATALOG_FILE_NAME)
+
+
+def open_readonly(path):
+    """
+    カタログを読み取り専用で開く。パスに ? # % などが含まれても別のファイルを開かないよう、
+    エスケープ済みの file: URI にしてから mode=ro を付ける
+    """
+    return sqlite3.connect(pathlib.Path(path).resolve().as_uri() + "?mode=ro", uri=True)
+
+
+def build_filters(date_from=None, date_to=None, source=None, camera=None, kind=None):
+    """絞り込み条件から WHERE 句とパラメーターを作る。日付は taken_at の索引が使える範囲条件にする"""
+    clauses = []
+    params = []
+    if date_from:
+        clauses.append("taken_at >= ?")
+        params.append(date_from)
+    if date_to:
+        # 日付だけが指定された場合はその日の終わりまでを含める
+        clauses.append("taken_at <= ?")
+        params.append(date_to if len(date_to) > 10 else date_to + " 23:59:59")
+    if source:
+        clauses.append("source = ?")
+        params.append(source)
+    if camera:
+        clauses.append("camera_model = ? COLLATE NOCASE")
+        params.append(camera)
+    if kind:
+        clauses.append("kind = ?")
+        params.append(kind)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, params
+
+
+def query_files(conn, where, params, limit=None):
+    sql = f"SELECT path, taken_at, source, size, sha256, camera_model, kind, original_path FROM files{where} ORDER BY taken_at"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    columns = ("path", "taken_at", "source", "size", "sha256", "camera_model", "kind", "original_path")
+    for row in conn.execute(sql, params):
+        yield dict(zip(columns, row))
+
+
+def count_by(conn, group, where, params):
+    expr = GROUP_COLUMNS[group]
+    return conn.execute(
+        f"SELECT {expr} AS key, COUNT(*), SUM(size) FROM files{where} GROUP BY key ORDER BY key", params
+    ).fetchall()
+
+
+def find_duplicates(conn, where, params):
+    """同じハッシュを持つファイルの組を返す(ハッシュを計算していない行は対象外)"""
+    extra = " AND " if where else " WHERE "
+    rows = conn.execute(
+        f"SELECT sha256, path FROM files{where}{extra}sha256 IN "
+        f"(SELECT sha256 FROM files WHERE sha256 IS NOT NULL GROUP BY sha256 HAVING COUNT(*) > 1) "
+        f"ORDER BY sha256, path",
+        params,
+    ).fetchall()
+    groups = {}
+    for digest, path in rows:
+        groups.setdefault(digest, []).append(path)
+    return groups
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="整理済みライブラリのカタログを検索する")
+    parser.add_argument("dest")
+    parser.add_argument("--from", dest="date_from", help="撮影日時の下限 (YYYY-MM-DD または 'YYYY-MM-DD HH:MM:SS')")
+    parser.add_argument("--to", dest="date_to", help="撮影日時の上限 (日付のみの場合はその日を含む)")
+    parser.add_argument("--source", help="日時の取得元 (pil / exiftool / mp4_header / riff_header / ebml_header / ffprobe / file_timestamp など)")
+    parser.add_argument("--camera", help="機種名 (大文字小文字は区別しない)")
+    parser.add_argument("--kind", choices=["image", "video"])
+    parser.add_argument("--format", choices=["table", "jsonl", "paths"], default="table")
+    parser.add_argument("--limit", type=int)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--count-by", choices=list(GROUP_COLUMNS), help="件数を集計する")
+    mode.add_argument("--duplicates", action="store_true", help="同じハッシュを持つファイルを表示する")
+    args = parser.parse_args()
+
+    path = catalog_path(args.dest)
+    if not os.path.exists(path):
+        print(f"カタログが見つかりません: {path}", file=sys.stderr)
+        return 1
+    conn = open_readonly(path)
+    where, params = build_filters(args.date_from, args.date_to, args.source, args.camera, args.kind)
+    try:
+        if args.count_by:
+            for key, count, size in count_by(conn, args.count_by, where, params):
+                print(f"{str(key):<32}{count:>10}{(size or 0) / (1024 * 1024):>12.1f} MB")
+        elif args.duplicates:
+            for digest, paths in find_duplicates(conn, where, params).items():
+                print(digest)
+                for p in paths:
+                    print(f"  {p}")
+        else:
+            for row in query_files(conn, where, params, args.limit):
+                if args.format == "jsonl":
+                    print(json.dumps(row, ensure_ascii=False))
+                elif args.format == "paths":
+                    print(os.path.join(args.dest, row["path"]))
+                else:
+                    print(f"{row['taken_at']}  {row['source'] or '-':<15}{row['camera_model'] or '-':<20}{row['path']}")
+    except BrokenPipeError:
+        pass # head などにパイプした場合
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,179 @@
+"""
+メタデータの一括調査ツール。
+フォルダー(またはファイルの一覧)内のメディアファイルに対して main.py と同じ日時抽出処理を並列に実行し、
+1ファイル1行のJSON(JSONL)として、すべての日時の候補(取得元・タグ・元の値・解釈した日時)と採用された値を出力する。
+ExifTool はスレッドごとに常駐するプロセスを使い回す。
+
+使い方:
+    python inspect_metadata.py PATH [PATH ...] [--files-from LIST] [--jobs 8] [--all] [--raw] [--output out.jsonl]
+
+    PATH にはフォルダーまたはファイルを指定する(フォルダーは再帰的に調べる)。
+    --files-from に - を指定すると標準入力からパスを1行ずつ読む。
+    --all を付けると、通常の処理では省略される後段(ExifTool・ファイルのタイムスタンプ)の候補も記録する。
+    --raw を付けると、PIL の EXIF・ffprobe・ExifTool の全タグも出力する。
+"""
+import argparse
+import collections
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+from main import logger
+
+# 同時に処理中にしておくファイル数(スレッド数に対する倍率)
+IN_FLIGHT_PER_THREAD = 4
+# GPS IFD
+EXIF_GPS_IFD_POINTER = 0x8825
+
+
+def iter_paths(paths, files_from=None):
+    """指定されたファイル・フォルダー・一覧ファイルからメディアファイルのパスを順に返す"""
+    def expand(path):
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    ext = os.path.splitext(filename)[1].lower()
+                    if ext in main.IMAGE_EXTS or ext in main.VIDEO_EXTS:
+                        yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+    for path in paths:
+        yield from expand(path)
+    if files_from:
+        stream = sys.stdin if files_from == "-" else open(files_from, encoding="utf-8")
+        try:
+            for line in stream:
+                line = line.strip()
+                if line:
+                    yield from expand(line)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def raw_pil_exif(file_path):
+    """PIL で読める EXIF(IFD0・Exif IFD・GPS IFD)をタグ名と文字列の辞書で返す"""
+    from PIL.ExifTags import GPSTAGS, TAGS
+    with main.Image.open(file_path) as im:
+        exif = im.getexif()
+    result = {}
+    for name, tags, names in (
+        ("Zeroth", exif, TAGS),
+        ("Exif", exif.get_ifd(main.EXIF_IFD_POINTER), TAGS),
+        ("GPSInfo", exif.get_ifd(EXIF_GPS_IFD_POINTER), GPSTAGS),
+    ):
+        decoded = {}
+        for tag_id, value in tags.items():
+            if isinstance(value, dict):
+                continue # 入れ子のIFDは個別に出力する
+            value = main.decode_value(value)
+            if value is not None:
+                decoded[names.get(tag_id, hex(tag_id))] = value
+        if decoded:
+            result[name] = decoded
+    return result
+
+
+def raw_metadata(file_path):
+    """--raw 用に、各ツールが返すメタデータをそのまま集める(失敗したものはエラー文字列にする)"""
+    ext = os.path.splitext(file_path)[1].lower()
+    raw = {}
+    if ext in main.IMAGE_EXTS:
+        try:
+            raw["pil"] = raw_pil_exif(file_path)
+        except Exception as e:
+            raw["pil"] = {"error": str(e)}
+    else:
+        try:
+            probe = main.ffmpeg.probe(file_path)
+            raw["ffprobe"] = {"format": probe.get("format", {}), "streams": probe.get("streams", [])}
+        except Exception as e:
+            raw["ffprobe"] = {"error": str(e)}
+    try:
+        metadata = main.exiftool_get_metadata([str(file_path)], ["-G", "-api", "largefilesupport=1"])
+        raw["exiftool"] = metadata[0] if metadata else {}
+    except Exception as e:
+        raw["exiftool"] = {"error": str(e)}
+    return raw
+
+
+def inspect_file(file_path, tz_policy, exhaustive=False, include_raw=False):
+    """1ファイルの日時抽出を実行し、JSONLの1行分の辞書を返す"""
+    ext = os.path.splitext(file_path)[1].lower()
+    kind = "image" if ext in main.IMAGE_EXTS else "video" if ext in main.VIDEO_EXTS else "other"
+    record = {"path": file_path, "kind": kind}
+    if kind == "other":
+        record["error"] = "対象外の拡張子です"
+        return record
+    trace = main.DateTrace(exhaustive=exhaustive)
+    try:
+        main.get_file_date(file_path, tz_policy, trace)
+    except Exception as e:
+        trace.error("get_file_date", e)
+    record.update(trace.to_dict())
+    if include_raw:
+        record["raw"] = raw_metadata(file_path)
+    return record
+
+
+def inspect_files(paths, jobs=None, tz_policy=None, exhaustive=False, include_raw=False):
+    """
+    paths を並列に調べ、結果の辞書を入力と同じ順に返すジェネレーター。
+    同時に処理中にするファイル数を制限するため、大量のパスを渡してもメモリを使い過ぎない。
+    """
+    tz_policy = tz_policy or main.TimezonePolicy.load_default()
+    jobs = jobs or main.thread_count()
+    in_flight = collections.deque()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        try:
+            for path in paths:
+                in_flight.append(executor.submit(inspect_file, path, tz_policy, exhaustive, include_raw))
+                if len(in_flight) >= jobs * IN_FLIGHT_PER_THREAD:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            for future in in_flight:
+                future.cancel()
+            main.close_exiftool_workers()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="メディアファイルの日時の候補と採用値をJSONLで出力する")
+    parser.add_argument("paths", nargs="*", help="調べるファイルまたはフォルダー")
+    parser.add_argument("--files-from", help="調べるパスを1行ずつ書いたファイル(- で標準入力)")
+    parser.add_argument("--jobs", type=int, help="並列数(省略時は main.thread_count())")
+    parser.add_argument("--all", action="store_true", help="通常は省略される後段の候補も記録する")
+    parser.add_argument("--raw", action="store_true", help="PIL / ffprobe / ExifTool の全タグも出力する")
+    parser.add_argument("--output", help="出力先(省略時は標準出力)")
+    args = parser.parse_args()
+    if not args.paths and not args.files_from:
+        parser.error("PATH または --files-from を指定してください")
+
+    # 標準出力をJSONLに使うため、ログは警告以上のみ標準エラーに出す(環境変数で変更可)
+    main.setup_logging(os.environ.get(main.LOG_LEVEL_ENV, "WARNING"))
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    count = 0
+    try:
+        for record in inspect_files(
+            iter_paths(args.paths, args.files_from), args.jobs, exhaustive=args.all, include_raw=args.raw,
+        ):
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+            count += 1
+    except KeyboardInterrupt:
+        logger.warning("中断しました。")
+        return 130
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        logger.info("%d 個のファイルを調べました。", count)
+        main.shutdown_logging()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
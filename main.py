@@ -1,32 +1,410 @@
 import os
 import shutil
 import base64
-import tkinter as tk
-from tkinter import filedialog, messagebox
-from datetime import datetime, timedelta
-from PIL import Image
-from PIL.ExifTags import TAGS
-import pytz
-import ffmpeg
-import exiftool
+from datetime import datetime, timedelta, timezone
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
-import platform
-import multiprocessing
 import filecmp
-import locale
+import importlib
 import re
+import functools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+import threading
+import bisect
+import zlib
+import io
+import struct
+import hashlib
+import array
+import heapq
+
+class _LazyModule:
+    """
+    属性に初めてアクセスしたときにモジュールを読み込む代理オブジェクト。
+    Pillow・ffmpeg・ExifTool・pytz・tkinter は読み込みが重いため、実際にその処理が必要になるまで読み込まない。
+    """
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+# 重い依存モジュールは遅延読み込みする(import main だけでは読み込まれない)
+Image = _LazyModule('PIL.Image')
+pytz = _LazyModule('pytz')
+ffmpeg = _LazyModule('ffmpeg')
+exiftool = _LazyModule('exiftool')
+tk = _LazyModule('tkinter')
+ttk = _LazyModule('tkinter.ttk')
+filedialog = _LazyModule('tkinter.filedialog')
+messagebox = _LazyModule('tkinter.messagebox')
+locale = _LazyModule('locale')
+platform = _LazyModule('platform')
+sqlite3 = _LazyModule('sqlite3')
+tempfile = _LazyModule('tempfile')
 
 # --- 各種設定 ---
 # 画像・動画の拡張子リスト
 IMAGE_EXTS = ['.jpg', '.jpeg', '.png', '.tif', '.tiff', '.heic', '.dng', '.arw']
 VIDEO_EXTS = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.mts', '.mpg']
 METADATA_EXTS = ['.xml', '.thm']
+# 走査結果(FileManifest)に記録する拡張子の分類
+EXT_CLASS_OTHER = 0
+EXT_CLASS_IMAGE = 1
+EXT_CLASS_VIDEO = 2
+EXT_CLASS_METADATA = 3
+# 走査結果を何件ごとにまとめて保持するか。IMAGE_ORGANIZER_MANIFEST_SPILL に件数を指定すると、
+# それを超えた分はまとまりごとに一時ファイルへ書き出してメモリを解放する(既定の 0 では書き出さない)
+MANIFEST_CHUNK_SIZE = 65536
+MANIFEST_SPILL_ENV = 'IMAGE_ORGANIZER_MANIFEST_SPILL'
+# 移動処理を振り分けるシャード数(移動先ディレクトリのハッシュで決まる)
+DEST_SHARD_COUNT = 32
+# 同時に処理中にしておくファイル数(スレッド数に対する倍率)
+IN_FLIGHT_PER_THREAD = 2
+# 進捗ウィンドウの更新間隔(ミリ秒)
+PROGRESS_POLL_MS = 200
+# 日時抽出のために1回で読み込むファイル先頭の大きさと、それより後ろを読む場合の読み込み単位(バイト)
+HEADER_BUFFER_SIZE = 256 * 1024
+TAIL_WINDOW_SIZE = 64 * 1024
+# ffprobe を使わずにヘッダーを直接読む動画の拡張子
+MP4_LIKE_EXTS = ['.mp4', '.mov'] # ISO BMFF / QuickTime
+RIFF_EXTS = ['.avi']             # RIFF AVI
+EBML_EXTS = ['.mkv', '.webm']    # Matroska / WebM
+# 類似画像の検出モード: 'off'(検出しない) / 'report'(報告のみ) / 'quarantine'(隔離フォルダーへ移動)
+# 環境変数 IMAGE_ORGANIZER_NEAR_DUPLICATES で上書きできる
+NEAR_DUP_MODE_ENV = 'IMAGE_ORGANIZER_NEAR_DUPLICATES'
+NEAR_DUP_MODES = ('off', 'report', 'quarantine')
+# dHash の一辺の大きさ(8 なら 64 ビット)と、類似とみなすハミング距離の上限
+NEAR_DUP_HASH_SIZE = 8
+NEAR_DUP_MAX_DISTANCE = 6
+# 移動前の重複判定で、ファイルの先頭と末尾からハッシュを取る大きさ(バイト)
+SOURCE_DUP_BLOCK_SIZE = 64 * 1024
+# 移動先に置く索引・カタログ・報告のフォルダー
+ORGANIZER_STATE_DIR = '.image_organizer'
+# 類似画像の隔離先のフォルダー
+NEAR_DUP_QUARANTINE_DIR = '_near_duplicates'
+# 整理済みファイルのカタログ(移動先の ORGANIZER_STATE_DIR に作る SQLite)
+# IMAGE_ORGANIZER_CATALOG=0 で無効、IMAGE_ORGANIZER_CATALOG_HASH=0 でハッシュの計算を省略する
+CATALOG_ENV = 'IMAGE_ORGANIZER_CATALOG'
+CATALOG_HASH_ENV = 'IMAGE_ORGANIZER_CATALOG_HASH'
+CATALOG_FILE_NAME = 'catalog.sqlite'
+# カタログへの書き込みをまとめる行数
+CATALOG_FLUSH_ROWS = 200
+
+
+# --- ログ設定 ---
+# 環境変数で上書き可能な既定値
+# IMAGE_ORGANIZER_LOG_LEVEL: DEBUG にするとファイルごとの詳細(候補タグ・採用日時・移動)も出力する
+# IMAGE_ORGANIZER_LOG_FILE: 指定するとコンソールに加えてファイルにも出力する
+# IMAGE_ORGANIZER_LOG_JSON: 1 にすると1行1レコードのJSON形式で出力する(ログ収集向け)
+LOG_LEVEL_ENV = 'IMAGE_ORGANIZER_LOG_LEVEL'
+LOG_FILE_ENV = 'IMAGE_ORGANIZER_LOG_FILE'
+LOG_JSON_ENV = 'IMAGE_ORGANIZER_LOG_JSON'
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(threadName)s] %(message)s'
+
+logger = logging.getLogger('image_organizer')
+
+class JsonLinesFormatter(logging.Formatter):
+    """ログレコードを1行のJSONに変換するフォーマッター"""
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+# ワーカースレッドからのログを受け取り、別スレッドで実際の出力を行うリスナー
+_log_listener = None
+
+def setup_logging(level=None, log_file=None, json_lines=None):
+    """
+    ログ出力を初期化する。
+    ワーカースレッドは QueueHandler でキューに積むだけで、コンソール/ファイルへの書き込みは
+    QueueListener のスレッドがまとめて行うため、端末やパイプの遅さで処理が止まらない。
+    引数を省略した場合は環境変数の値(なければ INFO・コンソールのみ・テキスト形式)を使う。
+    """
+    global _log_listener
+    if level is None:
+        level = os.environ.get(LOG_LEVEL_ENV, 'INFO')
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            level = logging.INFO
+    if log_file is None:
+        log_file = os.environ.get(LOG_FILE_ENV) or None
+    if json_lines is None:
+        json_lines = os.environ.get(LOG_JSON_ENV, '').lower() in ('1', 'true', 'yes')
+    shutdown_logging()
+    formatter = JsonLinesFormatter() if json_lines else logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    logger.handlers.clear()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+
+def shutdown_logging():
+    """キューに残ったログを書き出してリスナーを停止する"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+        _log_listener = None
+
+# --- 処理段階ごとの計測 ---
+# 環境変数で指定された場合、実行終了時にレポートをファイルへ書き出す
+# IMAGE_ORGANIZER_METRICS_JSON: JSON形式のレポート
+# IMAGE_ORGANIZER_METRICS_PROM: Prometheus node_exporter の textfile collector 形式
+METRICS_JSON_ENV = 'IMAGE_ORGANIZER_METRICS_JSON'
+METRICS_PROM_ENV = 'IMAGE_ORGANIZER_METRICS_PROM'
+# レイテンシヒストグラムのバケット上限(秒)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class _StageTimer:
+    """StageMetrics.stage() が返すコンテキストマネージャー"""
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, failed=exc_type is not None)
+        return False
+
+class StageMetrics:
+    """
+    処理段階(PIL, ffprobe, ExifTool, filecmp, move など)ごとの呼び出し回数・所要時間ヒストグラム、
+    移動バイト数、日時の取得元をスレッドセーフに集計する。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}      # 段階名 -> {"count", "errors", "total", "max", "buckets"}
+            self.byte_counts = {} # 種別 -> バイト数
+            self.sources = {}     # 日時の取得元 -> 件数
+            self.started_at = time.time()
+
+    def stage(self, name):
+        """with文で囲んだ区間の所要時間を name の段階として記録する。例外で抜けた場合はエラーとして数える"""
+        return _StageTimer(self, name)
+
+    def timed(self, name):
+        """関数全体を name の段階として計測するデコレーター"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with _StageTimer(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe(self, name, seconds, failed=False):
+        bucket_index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = {"count": 0, "errors": 0, "total": 0.0, "max": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+                self.stages[name] = stats
+            stats["count"] += 1
+            stats["total"] += seconds
+            if seconds > stats["max"]:
+                stats["max"] = seconds
+            if failed:
+                stats["errors"] += 1
+            stats["buckets"][bucket_index] += 1
+
+    def add_bytes(self, kind, nbytes):
+        with self._lock:
+            self.byte_counts[kind] = self.byte_counts.get(kind, 0) + nbytes
 
+    def record_source(self, source):
+        """最終的に採用された日時の取得元(pil, ffprobe, exiftool, file_timestamp, none)を記録する"""
+        with self._lock:
+            self.sources[source] = self.sources.get(source, 0) + 1
+
+    def to_dict(self):
+        with self._lock:
+            stages = {}
+            for name, stats in self.stages.items():
+                stages[name] = {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "total_seconds": stats["total"],
+                    "mean_seconds": stats["total"] / stats["count"] if stats["count"] else 0.0,
+                    "max_seconds": stats["max"],
+                    "histogram": {
+                        **{str(le): n for le, n in zip(LATENCY_BUCKETS, stats["buckets"])},
+                        "+Inf": stats["buckets"][-1],
+                    },
+                }
+            return {
+                "elapsed_seconds": time.time() - self.started_at,
+                "stages": stages,
+                "bytes": dict(self.byte_counts),
+                "sources": dict(self.sources),
+            }
+
+    def summary_table(self):
+        """コンソール表示用の集計表を返す"""
+        report = self.to_dict()
+        lines = [
+            f"{'段階':<24}{'回数':>8}{'エラー':>8}{'合計(s)':>12}{'平均(ms)':>12}{'最大(ms)':>12}",
+        ]
+        for name, s in sorted(report["stages"].items(), key=lambda item: item[1]["total_seconds"], reverse=True):
+            lines.append(
+                f"{name:<24}{s['count']:>8}{s['errors']:>8}{s['total_seconds']:>12.3f}"
+                f"{s['mean_seconds'] * 1000:>12.2f}{s['max_seconds'] * 1000:>12.2f}"
+            )
+        for kind, nbytes in sorted(report["bytes"].items()):
+            lines.append(f"bytes[{kind}]: {nbytes / (1024 * 1024):.1f} MB")
+        if report["sources"]:
+            lines.append("日時の取得元: " + ", ".join(f"{k}={v}" for k, v in sorted(report["sources"].items())))
+        lines.append(f"経過時間: {report['elapsed_seconds']:.1f} 秒")
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.to_dict(), ensure_ascii=False, indent=2))
+
+    def write_prometheus(self, path):
+        """node_exporter の textfile collector で読み込める形式で書き出す"""
+        report = self.to_dict()
+        lines = [
+            "# HELP image_organizer_stage_seconds Latency of each organizer stage.",
+            "# TYPE image_organizer_stage_seconds histogram",
+        ]
+        for name, s in sorted(report["stages"].items()):
+            cumulative = 0
+            for le, n in s["histogram"].items():
+                cumulative += n
+                lines.append(f'image_organizer_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'image_organizer_stage_seconds_sum{{stage="{name}"}} {s["total_seconds"]}')
+            lines.append(f'image_organizer_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+        lines.append("# HELP image_organizer_stage_errors_total Stage calls that raised.")
+        lines.append("# TYPE image_organizer_stage_errors_total counter")
+        for name, s in sorted(report["stages"].items()):
+            lines.append(f'image_organizer_stage_errors_total{{stage="{name}"}} {s["errors"]}')
+        lines.append("# HELP image_organizer_bytes_total Bytes processed by kind.")
+        lines.append("# TYPE image_organizer_bytes_total counter")
+        for kind, nbytes in sorted(report["bytes"].items()):
+            lines.append(f'image_organizer_bytes_total{{kind="{kind}"}} {nbytes}')
+        lines.append("# HELP image_organizer_date_source_total Files by the source their date came from.")
+        lines.append("# TYPE image_organizer_date_source_total counter")
+        for source, n in sorted(report["sources"].items()):
+            lines.append(f'image_organizer_date_source_total{{source="{source}"}} {n}')
+        lines.append("# HELP image_organizer_run_seconds Wall time of the last run.")
+        lines.append("# TYPE image_organizer_run_seconds gauge")
+        lines.append(f"image_organizer_run_seconds {report['elapsed_seconds']}")
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+    def write_reports(self, json_path=None, prom_path=None):
+        """サマリーをログに出し、指定があればJSON/Prometheus形式でも書き出す"""
+        logger.info("処理段階ごとの計測結果:\n%s", self.summary_table())
+        json_path = json_path or os.environ.get(METRICS_JSON_ENV)
+        prom_path = prom_path or os.environ.get(METRICS_PROM_ENV)
+        try:
+            if json_path:
+                self.write_json(json_path)
+            if prom_path:
+                self.write_prometheus(prom_path)
+        except OSError as e:
+            logger.warning("計測レポートの書き出しに失敗しました: %s", e)
+
+def _write_atomic(path, text):
+    """読み手が書きかけの内容を見ないよう、一時ファイルに書いてから置き換える"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+# 実行全体で共有する計測オブジェクト(async_main の開始時にリセットされる)
+stage_metrics = StageMetrics()
+
+# --- 常駐ExifToolワーカー ---
+# ExifToolは起動コストが大きいため、スレッドごとに1プロセスを常駐させて使い回す
+_exiftool_local = threading.local()
+_exiftool_workers = []
+_exiftool_workers_lock = threading.Lock()
+
+def get_exiftool():
+    """呼び出しスレッド専用の常駐ExifToolプロセスを返す。未起動または終了していれば起動する"""
+    et = getattr(_exiftool_local, 'helper', None)
+    if et is None or not et.running:
+        et = exiftool.ExifToolHelper()
+        _exiftool_local.helper = et
+        with _exiftool_workers_lock:
+            _exiftool_workers.append(et)
+    return et
+
+def exiftool_get_metadata(files, params):
+    """
+    常駐ExifToolでメタデータを取得する。
+    ExifTool自体がエラーを返した場合以外(パイプ切断など)は、プロセスを破棄して次回に再起動させる。
+    """
+    et = get_exiftool()
+    try:
+        return et.get_metadata(files, params=params)
+    except exiftool.exceptions.ExifToolExecuteError:
+        raise
+    except Exception:
+        _discard_exiftool(et)
+        raise
+
+def _discard_exiftool(et):
+    with _exiftool_workers_lock:
+        if et in _exiftool_workers:
+            _exiftool_workers.remove(et)
+    if getattr(_exiftool_local, 'helper', None) is et:
+        _exiftool_local.helper = None
+    try:
+        if et.running:
+            et.terminate()
+    except Exception:
+        pass
+
+def close_exiftool_workers():
+    """常駐しているすべてのExifToolプロセスを終了する(実行の終了時に呼ぶ)"""
+    with _exiftool_workers_lock:
+        workers = list(_exiftool_workers)
+        _exiftool_workers.clear()
+    for et in workers:
+        try:
+            if et.running:
+                et.terminate()
+        except Exception as e:
+            logger.debug("ExifToolの終了に失敗しました: %s", e)
 
-# グローバルでディレクトリごとの asyncio.Lock を管理する辞書
-dir_locks = {}
-dir_locks_lock = asyncio.Lock() # この辞書へのアクセス用ロック
 
 # --- 同期処理(ブロッキング関数群) ---
 def decode_value(value):
@@ -69,57 +447,692 @@ def decode_value(value):
     # 他の型の値をそのまま返す
     return str(value)
 
-def get_image_date(file_path):
+# --- ファイル先頭の共有バッファ ---
+class HeaderBuffer:
+    """
+    1ファイルの先頭 size バイトを一度だけ読み込み、同じファイルを調べるすべての処理(PIL・MP4のボックス読み取りなど)で共有する。
+    NAS などでは開くたびに先頭を読み直すとその都度ネットワーク越しの読み込みになるため、
+    読み込み前に posix_fadvise で先読みを指示し、以降は memoryview の切り出し(コピーなし)で渡す。
+    先頭に収まらない位置(moov が末尾にある MP4 など)だけ、開いたままのファイルから追加で読み込む。
+    """
+    def __init__(self, file_path, size=HEADER_BUFFER_SIZE):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb', buffering=0)
+        try:
+            self.file_size = os.fstat(self._file.fileno()).st_size
+            length = min(size, self.file_size)
+            if hasattr(os, 'posix_fadvise'):
+                try:
+                    os.posix_fadvise(self._file.fileno(), 0, length, os.POSIX_FADV_WILLNEED)
+                except OSError:
+                    pass
+            data = bytearray(length)
+            view = memoryview(data)
+            filled = 0
+            while filled < length:
+                n = self._file.readinto(view[filled:])
+                if not n:
+                    break
+                filled += n
+            self._head = memoryview(data)[:filled]
+        except BaseException:
+            self._file.close()
+            raise
+        stage_metrics.add_bytes('header_read', filled)
+        # 先頭より後ろを読んだ直近の範囲(位置, memoryview)
+        self._window_offset = 0
+        self._window = memoryview(b'')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def view(self, offset, length):
+        """
+        offset から length バイトの memoryview を返す(ファイル末尾では短くなる)。
+        先頭のバッファか直近の読み込み範囲に収まればコピーせずに切り出し、収まらなければ
+        offset から max(length, TAIL_WINDOW_SIZE) バイトを追加で読み込む。
+        """
+        end = offset + length
+        if end <= len(self._head):
+            return self._head[offset:end]
+        window_end = self._window_offset + len(self._window)
+        if self._window_offset <= offset and (end <= window_end or window_end >= self.file_size):
+            return self._window[offset - self._window_offset:end - self._window_offset]
+        if offset >= self.file_size:
+            return memoryview(b'')
+        self._file.seek(offset)
+        data = self._file.read(max(length, TAIL_WINDOW_SIZE))
+        stage_metrics.add_bytes('tail_read', len(data))
+        self._window_offset = offset
+        self._window = memoryview(data)
+        return self._window[:length]
+
+    def stream(self):
+        """PIL など、ファイルオブジェクトを受け取る処理に渡すための読み取り専用ストリーム"""
+        return _HeaderStream(self)
+
+class _HeaderStream(io.RawIOBase):
+    """HeaderBuffer の内容をファイルとして読ませるストリーム。範囲外の読み込みは HeaderBuffer.view に任せる"""
+    def __init__(self, header):
+        self.header = header
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.header.file_size
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        data = self.header.view(self.position, len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.position += n
+        return n
+
+# MP4 の時刻の基準(1904-01-01 UTC)
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+_BOX_HEADER = struct.Struct('>I4s')
+
+def _iter_boxes(header, start, end):
+    """start から end までに並ぶ ISO BMFF のボックスを (種類, 中身の開始位置, 終了位置) で順に返す"""
+    offset = start
+    while offset + 8 <= end:
+        box = header.view(offset, 16)
+        if len(box) < 8:
+            return
+        size, box_type = _BOX_HEADER.unpack_from(box)
+        header_len = 8
+        if size == 1: # 64ビットのサイズ
+            if len(box) < 16:
+                return
+            size = struct.unpack_from('>Q', box, 8)[0]
+            header_len = 16
+        elif size == 0: # ファイル末尾まで
+            size = end - offset
+        if size < header_len:
+            return
+        yield box_type, offset + header_len, min(offset + size, end)
+        offset += size
+
+def _full_box_creation_time(header, start, end):
+    """mvhd / tkhd / mdhd の creation_time(UTCの aware datetime)を返す。0 や壊れた値は None"""
+    body = header.view(start, 12)
+    if len(body) < 8:
+        return None
+    if body[0] == 1:
+        if len(body) < 12:
+            return None
+        seconds = struct.unpack_from('>Q', body, 4)[0]
+    else:
+        seconds = struct.unpack_from('>I', body, 4)[0]
+    if seconds == 0:
+        return None
+    try:
+        return MP4_EPOCH + timedelta(seconds=seconds)
+    except OverflowError:
+        return None
+
+@stage_metrics.timed('mp4_header')
+def read_mp4_creation_times(header):
+    """
+    MP4 / MOV の moov にある mvhd・tkhd・mdhd の作成日時を (ボックスのパス, UTCの aware datetime) のリストで返す。
+    mdat を読み飛ばしてボックスの見出しだけをたどるため、moov が末尾にあっても読み込みは数回で済む。
+    """
+    results = []
+    for box_type, start, end in _iter_boxes(header, 0, header.file_size):
+        if box_type != b'moov':
+            continue
+        for child_type, child_start, child_end in _iter_boxes(header, start, end):
+            if child_type == b'mvhd':
+                dt = _full_box_creation_time(header, child_start, child_end)
+                if dt:
+                    results.append(('moov/mvhd', dt))
+            elif child_type == b'trak':
+                for trak_type, trak_start, trak_end in _iter_boxes(header, child_start, child_end):
+                    if trak_type == b'tkhd':
+                        dt = _full_box_creation_time(header, trak_start, trak_end)
+                        if dt:
+                            results.append(('moov/trak/tkhd', dt))
+                    elif trak_type == b'mdia':
+                        for mdia_type, mdia_start, mdia_end in _iter_boxes(header, trak_start, trak_end):
+                            if mdia_type == b'mdhd':
+                                dt = _full_box_creation_time(header, mdia_start, mdia_end)
+                                if dt:
+                                    results.append(('moov/trak/mdia/mdhd', dt))
+        break
+    return results
+
+# MP4 の機種名のキー(QuickTime の meta/keys)とボックスの種類(udta・ilst)
+_MP4_MODEL_KEY = 'com.apple.quicktime.model'
+_MP4_MODEL_BOX = b'\xa9mod'
+
+def _mp4_text(header, start, end):
+    """udta の文字列(長さ・言語コード・本文)または ilst の data ボックスの文字列を返す"""
+    data = bytes(header.view(start, min(end - start, 1024)))
+    if len(data) >= 16 and data[4:8] == b'data':
+        text = data[16:int.from_bytes(data[0:4], 'big')]
+    elif len(data) >= 4:
+        text = data[4:4 + int.from_bytes(data[0:2], 'big')]
+    else:
+        return None
+    return text.decode('utf-8', 'replace').strip('\0 ') or None
+
+def _mp4_meta_model(header, start, end):
+    """meta(keys + ilst)から機種名を探す"""
+    # QuickTime の meta は中身がすぐに子ボックスで、ISO の meta はバージョン・フラグの4バイトの後に子ボックスが続く
+    if bytes(header.view(start + 4, 4)) != b'hdlr':
+        start += 4
+    keys = {}
+    items = {}
+    for box_type, box_start, box_end in _iter_boxes(header, start, end):
+        if box_type == b'keys':
+            data = bytes(header.view(box_start, box_end - box_start))
+            pos = 8
+            for index in range(1, int.from_bytes(data[4:8], 'big') + 1):
+                size = int.from_bytes(data[pos:pos + 4], 'big')
+                if size < 8 or pos + size > len(data):
+                    break
+                keys[data[pos + 8:pos + size].decode('utf-8', 'replace')] = index
+                pos += size
+        elif box_type == b'ilst':
+            for item_type, item_start, item_end in _iter_boxes(header, box_start, box_end):
+                items[item_type] = (item_start, item_end)
+    if _MP4_MODEL_KEY in keys:
+        span = items.get(keys[_MP4_MODEL_KEY].to_bytes(4, 'big'))
+        if span:
+            return _mp4_text(header, *span)
+    span = items.get(_MP4_MODEL_BOX)
+    return _mp4_text(header, *span) if span else None
+
+def read_mp4_camera_model(header):
+    """MP4 / MOV の moov/udta の ©mod、または moov/meta・udta/meta の機種名を返す(なければ None)"""
+    for box_type, start, end in _iter_boxes(header, 0, header.file_size):
+        if box_type != b'moov':
+            continue
+        for child_type, child_start, child_end in _iter_boxes(header, start, end):
+            model = None
+            if child_type == b'udta':
+                for udta_type, udta_start, udta_end in _iter_boxes(header, child_start, child_end):
+                    if udta_type == _MP4_MODEL_BOX:
+                        model = _mp4_text(header, udta_start, udta_end)
+                    elif udta_type == b'meta':
+                        model = _mp4_meta_model(header, udta_start, udta_end)
+                    if model:
+                        return model
+            elif child_type == b'meta':
+                model = _mp4_meta_model(header, child_start, child_end)
+            if model:
+                return model
+        break
+    return None
+
+# RIFF のチャンクの見出し(種類とリトルエンディアンのサイズ)
+_RIFF_CHUNK_HEADER = struct.Struct('<4sI')
+# RIFF の IDIT で一般的な形式(例: "THU OCT 26 16:46:04 2006")。
+# 曜日・月名は常に英語のため、ロケールに依存する strptime(%a %b)は使わずに月名の表で読む
+_IDIT_RE = re.compile(r'(?:[A-Za-z]{3},?\s+)?([A-Za-z]{3})\s+(\d{1,2})\s+(\d{1,2}):(\d{2}):(\d{2})\s+(\d{4})$')
+_MONTHS = {name: number for number, name in enumerate(
+    ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC'), start=1)}
+_DATE_ONLY_RE = re.compile(r'(\d{4})[-:/](\d{2})[-:/](\d{2})$')
+
+def _iter_riff_chunks(header, start, end):
+    """start から end までの RIFF チャンクを (種類, 中身の開始位置, 中身の終了位置) で順に返す"""
+    offset = start
+    while offset + 8 <= end:
+        chunk = header.view(offset, 8)
+        if len(chunk) < 8:
+            return
+        chunk_id, size = _RIFF_CHUNK_HEADER.unpack_from(chunk)
+        body_start = offset + 8
+        yield chunk_id, body_start, min(body_start + size, end)
+        # チャンクは2バイト境界に揃えられる
+        offset = body_start + size + (size & 1)
+
+def _riff_text(header, start, end):
+    return bytes(header.view(start, end - start)).split(b'\0', 1)[0].decode('latin-1').strip()
+
+def _parse_riff_date(text):
+    """
+    IDIT / ICRD の文字列を (値, 時刻を含むか) にする。IDIT の一般的な形式と日付だけの形式は naive な datetime にし、
+    それ以外("2005:08:17 11:42:43" など)は validate_and_parse_datetime で解釈させるため文字列のまま返す。
+    """
+    normalized = ' '.join(text.split())
+    m = _IDIT_RE.match(normalized)
+    if m and m.group(1).upper() in _MONTHS:
+        try:
+            return datetime(int(m.group(6)), _MONTHS[m.group(1).upper()], int(m.group(2)),
+                            int(m.group(3)), int(m.group(4)), int(m.group(5))), True
+        except ValueError:
+            pass
+    m = _DATE_ONLY_RE.match(normalized)
+    if m:
+        try:
+            return datetime(int(m.group(1)), int(m.group(2)), int(m.group(3))), False
+        except ValueError:
+            pass
+    return normalized, True
+
+def _strd_exif(header, start, end):
+    """strd チャンク(Fujifilm・Casio などの 'AVIF' + EXIF)に含まれる EXIF を返す(なければ None)"""
+    data = bytes(header.view(start, end - start))
+    for marker in (b'II*\0', b'MM\0*'):
+        pos = data.find(marker)
+        if pos >= 0:
+            exif = Image.Exif()
+            exif.load(data[pos:])
+            return exif
+    return None
+
+def _strd_exif_dates(header, start, end):
+    """strd の EXIF の撮影日時を探す"""
+    exif = _strd_exif(header, start, end)
+    if exif is None:
+        return []
+    exif_ifd = exif.get_ifd(EXIF_IFD_POINTER)
+    results = []
+    for tag_id in PIL_DATE_TAG_IDS:
+        value = decode_value(exif_ifd.get(tag_id) or exif.get(tag_id))
+        if value:
+            results.append((f'strd/{hex(tag_id)}', value))
+    return results
+
+@stage_metrics.timed('riff_header')
+def read_riff_dates(header):
+    """
+    AVI の hdrl・LIST/INFO にある IDIT / ICRD と、strd に埋め込まれた EXIF の日時を (タグ, 値) のリストで返す。
+    値は naive な datetime(カメラのローカル時刻)または日時の文字列。movi などの大きな LIST は読み飛ばす。
+    ICRD が日付だけの場合は、時刻まで分かる候補がなければ候補にする(時刻 00:00 が最も古い候補になるのを避けるため)。
+    """
+    head = header.view(0, 12)
+    if len(head) < 12 or bytes(head[0:4]) != b'RIFF':
+        return []
+    results = []
+    date_only = []
+
+    def walk(start, end, path):
+        for chunk_id, body_start, body_end in _iter_riff_chunks(header, start, end):
+            if chunk_id == b'LIST':
+                list_type = bytes(header.view(body_start, 4))
+                if list_type in (b'hdrl', b'strl', b'INFO'):
+                    walk(body_start + 4, body_end, f"{path}{list_type.decode('latin-1')}/")
+            elif chunk_id in (b'IDIT', b'ICRD'):
+                value, has_time = _parse_riff_date(_riff_text(header, body_start, body_end))
+                if value:
+                    (results if has_time else date_only).append((path + chunk_id.decode('latin-1'), value))
+            elif chunk_id == b'strd':
+                results.extend(_strd_exif_dates(header, body_start, body_end))
+
+    walk(12, header.file_size, '')
+    return results or date_only
+
+def read_riff_camera_model(header):
+    """AVI の strd に埋め込まれた EXIF の機種名を返す(なければ None)"""
+    head = header.view(0, 12)
+    if len(head) < 12 or bytes(head[0:4]) != b'RIFF':
+        return None
+
+    def walk(start, end):
+        for chunk_id, body_start, body_end in _iter_riff_chunks(header, start, end):
+            if chunk_id == b'LIST':
+                if bytes(header.view(body_start, 4)) in (b'hdrl', b'strl'):
+                    model = walk(body_start + 4, body_end)
+                    if model:
+                        return model
+            elif chunk_id == b'strd':
+                exif = _strd_exif(header, body_start, body_end)
+                model = decode_value(exif.get(EXIF_TAG_MODEL)) if exif is not None else None
+                if model:
+                    return model.strip('\0 ')
+        return None
+
+    return walk(12, header.file_size)
+
+# EBML の要素ID
+EBML_ID_HEADER = 0x1A45DFA3
+EBML_ID_SEGMENT = 0x18538067
+EBML_ID_SEEK_HEAD = 0x114D9B74
+EBML_ID_SEEK = 0x4DBB
+EBML_ID_SEEK_ID = 0x53AB
+EBML_ID_SEEK_POSITION = 0x53AC
+EBML_ID_INFO = 0x1549A966
+EBML_ID_DATE_UTC = 0x4461
+EBML_ID_CLUSTER = 0x1F43B675
+# Matroska の DateUTC の基準(2001-01-01 UTC からのナノ秒)
+MATROSKA_EPOCH = datetime(2001, 1, 1, tzinfo=timezone.utc)
+
+def _read_vint(data, pos, keep_marker):
+    """EBML の可変長整数を読み、(値, 次の位置, すべて1か) を返す。要素IDは keep_marker=True で読む"""
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8 or pos + length > len(data):
+        raise ValueError("EBML の可変長整数が不正です")
+    value = first if keep_marker else first & (mask - 1)
+    all_ones = (first & (mask - 1)) == mask - 1
+    for b in data[pos + 1:pos + length]:
+        value = (value << 8) | b
+        all_ones = all_ones and b == 0xFF
+    return value, pos + length, all_ones
+
+def _iter_ebml_elements(header, start, end):
+    """
+    start から end までの EBML 要素を (ID, 中身の開始位置, 中身の終了位置) で順に返す。サイズ不明の要素は end まで。
+    途中で切れたファイルや不正な可変長整数があれば、そこで終わる。
+    """
+    offset = start
+    while offset < end:
+        head = header.view(offset, 12)
+        if len(head) < 2:
+            return
+        try:
+            element_id, pos, _ = _read_vint(head, 0, True)
+            size, pos, unknown = _read_vint(head, pos, False)
+        except (ValueError, IndexError):
+            return
+        body_start = offset + pos
+        body_end = end if unknown else min(body_start + size, end)
+        yield element_id, body_start, body_end
+        if unknown:
+            return
+        offset = body_end
+
+def _ebml_date_utc(header, start, end):
+    data = header.view(start, end - start)
+    if len(data) != 8:
+        return None
+    nanoseconds = struct.unpack('>q', data)[0]
+    return MATROSKA_EPOCH + timedelta(microseconds=nanoseconds // 1000)
+
+def _ebml_info_date(header, start, end):
+    """Info 要素の中の DateUTC を探す"""
+    for element_id, value_start, value_end in _iter_ebml_elements(header, start, end):
+        if element_id == EBML_ID_DATE_UTC:
+            dt = _ebml_date_utc(header, value_start, value_end)
+            return [('Segment/Info/DateUTC', dt)] if dt else []
+    return []
+
+def _ebml_seek_position(header, start, end, target_id):
+    """SeekHead から target_id の要素の位置(Segment の中身の先頭からの相対位置)を探す"""
+    for seek_id, seek_start, seek_end in _iter_ebml_elements(header, start, end):
+        if seek_id != EBML_ID_SEEK:
+            continue
+        target = position = None
+        for field_id, field_start, field_end in _iter_ebml_elements(header, seek_start, seek_end):
+            data = bytes(header.view(field_start, field_end - field_start))
+            if field_id == EBML_ID_SEEK_ID:
+                target = int.from_bytes(data, 'big')
+            elif field_id == EBML_ID_SEEK_POSITION:
+                position = int.from_bytes(data, 'big')
+        if target == target_id and position is not None:
+            return position
+    return None
+
+@stage_metrics.timed('ebml_header')
+def read_ebml_dates(header):
+    """
+    Matroska / WebM の Segment/Info/DateUTC を (タグ, UTCの aware datetime) のリストで返す。
+    Segment の子要素を最初の Cluster までたどり、Info がそれより後ろにある場合は SeekHead が示す位置を直接読む。
+    """
+    elements = _iter_ebml_elements(header, 0, header.file_size)
+    first = next(elements, None)
+    if first is None or first[0] != EBML_ID_HEADER:
+        return []
+    for element_id, segment_start, segment_end in elements:
+        if element_id != EBML_ID_SEGMENT:
+            continue
+        info_position = None
+        for child_id, child_start, child_end in _iter_ebml_elements(header, segment_start, segment_end):
+            if child_id == EBML_ID_INFO:
+                return _ebml_info_date(header, child_start, child_end)
+            if child_id == EBML_ID_SEEK_HEAD:
+                info_position = _ebml_seek_position(header, child_start, child_end, EBML_ID_INFO)
+            elif child_id == EBML_ID_CLUSTER:
+                break # ここから先はメディアデータ
+        if info_position is not None:
+            for child_id, child_start, child_end in _iter_ebml_elements(header, segment_start + info_position, segment_end):
+                if child_id == EBML_ID_INFO:
+                    return _ebml_info_date(header, child_start, child_end)
+                break
+        return []
+    return []
+
+# ヘッダーを直接読む動画の (日時の読み取り関数, 機種名の読み取り関数, 候補の取得元の名前, 日時がUTCか)
+# UTC の日時はローカル時刻への変換に機種ごとのタイムゾーン設定を使うことがあり、RIFF の日時はカメラのローカル時刻
+NATIVE_VIDEO_READERS = {ext: (read_mp4_creation_times, read_mp4_camera_model, 'mp4_header', True) for ext in MP4_LIKE_EXTS}
+NATIVE_VIDEO_READERS.update({ext: (read_riff_dates, read_riff_camera_model, 'riff_header', False) for ext in RIFF_EXTS})
+NATIVE_VIDEO_READERS.update({ext: (read_ebml_dates, None, 'ebml_header', True) for ext in EBML_EXTS})
+
+# EXIF タグID
+EXIF_IFD_POINTER = 0x8769
+EXIF_TAG_MODEL = 0x0110
+EXIF_TAG_OFFSET_TIME_ORIGINAL = 0x9011
+# DateTimeOriginal (0x9003), DateTimeDigitized (0x9004), DateTime (0x0132)
+# これらは撮影日時やデジタル化日時を示唆するため候補とする。
+PIL_DATE_TAG_IDS = [0x9003, 0x9004, 0x0132]
+
+def _lookup_exiftool_tag(d, key):
+    """
+    ExifToolの結果から 'Group:Tag' 形式のキーで値を取得する。
+    グループ名付き(-G)の結果とタグ名のみの結果のどちらにも対応する。
+    """
+    if key in d:
+        return d[key]
+    tag_name_only = key.split(':')[-1]
+    if tag_name_only in d:
+        return d[tag_name_only]
+    return None
+
+def _exiftool_camera_model(d):
+    """ExifToolの結果からカメラ機種名を取得する"""
+    for key in ("EXIF:Model", "QuickTime:Model", "XMP:Model", "MakerNotes:Model"):
+        val = _lookup_exiftool_tag(d, key)
+        if val:
+            return str(val)
+    return None
+
+class DateTrace:
+    """
+    日時抽出の過程を記録する。get_file_date などに trace として渡すと、見つかったすべての候補
+    (取得元・タグ・元の値・解釈した日時)と採用された値が記録される。
+    exhaustive が真の場合は、通常なら省略される後段(ExifTool・ファイルのタイムスタンプ)も実行して候補を記録する。
+    その候補は used=False となり、採用値の決定には使われない(通常の処理と同じ値が採用される)。
+    """
+    def __init__(self, exhaustive=False):
+        self.exhaustive = exhaustive
+        self.candidates = []
+        self.errors = []
+        self.chosen = None
+        self.source = None
+        self.camera_model = None
+
+    def add(self, source, tag, raw, value, tz, used=True):
+        self.candidates.append({
+            "source": source,
+            "tag": tag,
+            "raw": raw if isinstance(raw, (str, int, float)) or raw is None else str(raw),
+            "value": value.isoformat(sep=' ') if value else None,
+            "timezone": str(tz) if tz is not None else None,
+            "used": used,
+        })
+
+    def error(self, stage, e):
+        self.errors.append({"stage": stage, "error": str(e)})
+
+    def choose(self, dt, source):
+        self.chosen = dt.strftime('%Y_%m_%d_%H_%M_%S')
+        self.source = source
+
+    def to_dict(self):
+        return {
+            "chosen": self.chosen,
+            "source": self.source,
+            "camera_model": self.camera_model,
+            "candidates": self.candidates,
+            "errors": self.errors,
+        }
+
+def get_file_timestamp_date(file_path, tz_policy, kind_label, trace=None, used=True):
+    """
+    メタデータ日時が見つからなかった場合の代替として、
+    ExifToolでファイルのタイムスタンプ(更新日時、アクセス日時、作成/inode変更日時)の中で最も古いものを取得する。
+    成功時は 'YYYY_MM_DD_HH_MM_SS' 形式の文字列を返す。取得できなければ、Noneを返す。
+    used が偽の場合は trace に候補を記録するだけで、採用した取得元としては数えない。
+    """
+    logger.debug("有効なメタデータ日時が見つかりませんでした。ExifToolでファイルのタイムスタンプを確認します: %s", os.path.basename(file_path))
+    # メタデータを持たないファイルなので、フォルダー指定または既定のタイムゾーンを使う
+    tz = tz_policy.resolve(file_path)
+    file_timestamps_from_exif = []
+    try:
+        files = [str(file_path)]
+        # Fileグループのタイムスタンプのみを取得
+        params = [
+            "-G", # グループ名を取得
+            "-File:FileModifyDate",
+            "-File:FileAccessDate",
+            "-File:FileInodeChangeDate", # Linux/macOSでのinode変更日時
+            "-File:FileCreateDate",    # Windowsでの作成日時 (ExifToolバージョン依存)
+            "-fast", "-api", "largefilesupport=1"
+        ]
+        with stage_metrics.stage('exiftool_file'):
+            metadata = exiftool_get_metadata(files, params)
+        if metadata:
+            d = metadata[0]
+            file_tags_to_check = [
+                "File:FileModifyDate",
+                "File:FileAccessDate",
+                "File:FileInodeChangeDate",
+                "File:FileCreateDate",
+            ]
+            present_tags = [tag for tag in file_tags_to_check if tag in d]
+            # タイムゾーン対応のパース関数でまとめて正規化
+            parsed = parse_datetime_batch([d[tag] for tag in present_tags], tz)
+            for tag, dt_candidate in zip(present_tags, parsed):
+                if trace is not None:
+                    trace.add('file_timestamp', tag, d[tag], dt_candidate, tz, used)
+                if dt_candidate:
+                    logger.debug(" [ExifTool File] %s -> 候補: %s", tag, dt_candidate)
+                    file_timestamps_from_exif.append(dt_candidate)
+        else:
+            logger.debug("ファイルタイムスタンプ取得結果なし [ExifTool File]: %s", os.path.basename(file_path))
+    except FileNotFoundError as e:
+        logger.warning("ファイルが見つかりません [ExifTool File]: %s", file_path)
+        if trace is not None:
+            trace.error('exiftool_file', e)
+        return None
+    except Exception as e:
+        logger.warning("ファイルタイムスタンプ取得中に予期せぬエラー [ExifTool File]: %s (%s)", os.path.basename(file_path), e)
+        if trace is not None:
+            trace.error('exiftool_file', e)
+        return None
+    if file_timestamps_from_exif:
+        oldest_file_time = min(file_timestamps_from_exif)
+        if not used:
+            return oldest_file_time.strftime('%Y_%m_%d_%H_%M_%S')
+        stage_metrics.record_source('file_timestamp')
+        if trace is not None:
+            trace.choose(oldest_file_time, 'file_timestamp')
+        logger.debug("-> %s %s: ExifToolのファイルタイムスタンプから最も古い日時 %s を代替として採用します。", kind_label, os.path.basename(file_path), oldest_file_time)
+        return oldest_file_time.strftime('%Y_%m_%d_%H_%M_%S')
+    logger.debug("有効な日時データを取得できませんでした: %s", os.path.basename(file_path))
+    return None
+
+@stage_metrics.timed('get_image_date')
+def get_image_date(file_path, tz_policy=None, trace=None, header=None):
     """
     PILまたはExifToolを使い、画像ファイルから最も古い有効な撮影日時を取得。
+    タイムゾーンは tz_policy(省略時は既定のポリシー)でファイルごとに決定する。
+    trace(DateTrace)を渡すと、候補と採用値を記録する。
+    header(HeaderBuffer)を渡すと、PIL はファイルを開き直さずにその内容を読む。
     成功時は 'YYYY_MM_DD_HH_MM_SS' 形式の文字列を返す。
     取得できなければ、Noneを返す。
     """
-    valid_datetimes = [] # 有効な日時(datetimeオブジェクト)を格納するリスト
-    print(f"画像 {os.path.basename(file_path)}: 日時情報収集開始...")
+    if tz_policy is None:
+        tz_policy = default_timezone_policy()
+    valid_datetimes = [] # 有効な日時(datetimeオブジェクト)と取得元の組を格納するリスト
+    logger.debug("画像 %s: 日時情報収集開始...", os.path.basename(file_path))
     # 1. PILで日時タグを検索し、リストに追加
     try:
-        with Image.open(file_path) as im:
+        with stage_metrics.stage('pil'), Image.open(header.stream() if header is not None else file_path) as im:
             exif = im.getexif()
             if exif:
-                # DateTimeOriginal (0x9003), DateTimeDigitized (0x9004), DateTime (0x0132) のタグ情報で試す。
-                # これらは撮影日時やデジタル化日時を示唆するため候補とする。
-                pil_tag_ids = [0x9003, 0x9004, 0x0132]
-                for tag_id in pil_tag_ids:
-                    if tag_id in exif:
-                        datetime_raw = exif.get(tag_id)
-                        if datetime_raw:
-                            datetime_str = decode_value(datetime_raw)
-                            if datetime_str:
-                                pil_dt = validate_and_parse_datetime(datetime_str)
-                                if pil_dt:
-                                    print(f" [PIL] Tag {hex(tag_id)} -> 候補: {pil_dt.strftime('%Y:%m:%d %H:%M:%S')}")
-                                    valid_datetimes.append(pil_dt)
-    except FileNotFoundError:
-        print(f"ファイルが見つかりません [PIL]: {file_path}")
+                # 撮影日時系のタグはExif IFDにあるため、IFD0とあわせて参照する
+                exif_ifd = exif.get_ifd(EXIF_IFD_POINTER)
+                camera_model = decode_value(exif.get(EXIF_TAG_MODEL))
+                offset = decode_value(exif_ifd.get(EXIF_TAG_OFFSET_TIME_ORIGINAL))
+                tz = tz_policy.resolve(file_path, camera_model, offset)
+                if trace is not None:
+                    trace.camera_model = camera_model
+                for tag_id in PIL_DATE_TAG_IDS:
+                    datetime_raw = exif_ifd.get(tag_id) or exif.get(tag_id)
+                    if datetime_raw:
+                        datetime_str = decode_value(datetime_raw)
+                        if datetime_str:
+                            pil_dt = validate_and_parse_datetime(datetime_str, tz)
+                            if trace is not None:
+                                trace.add('pil', hex(tag_id), datetime_str, pil_dt, tz)
+                            if pil_dt:
+                                logger.debug(" [PIL] Tag %s -> 候補: %s", hex(tag_id), pil_dt)
+                                valid_datetimes.append((pil_dt, 'pil'))
+    except FileNotFoundError as e:
+        logger.warning("ファイルが見つかりません [PIL]: %s", file_path)
+        if trace is not None:
+            trace.error('pil', e)
         return None
-    except Image.UnidentifiedImageError:
-        print(f"認識できない画像形式 [PIL]: {os.path.basename(file_path)}")
+    except Image.UnidentifiedImageError as e:
+        logger.debug("認識できない画像形式 [PIL]: %s", os.path.basename(file_path))
+        if trace is not None:
+            trace.error('pil', e)
     except Exception as e:
         # OSError: broken data stream などPILが扱えない場合でもログは出す。
-        print(f"EXIF取得エラー [PIL]: {os.path.basename(file_path)} ({e})")
-    
+        logger.debug("EXIF取得エラー [PIL]: %s (%s)", os.path.basename(file_path), e)
+        if trace is not None:
+            trace.error('pil', e)
+
     # 2. ExifToolで日時タグを検索し、リストに追加
-    if not valid_datetimes:
+    # (trace.exhaustive の場合は PIL で見つかっていても候補の記録のために実行する)
+    exiftool_used = not valid_datetimes
+    if exiftool_used or (trace is not None and trace.exhaustive):
         try:
             files = [str(file_path)]
-            with exiftool.ExifToolHelper() as et:
-                # 主要な作成日時系のタグを指定(-FileModifyDateは含めない)
-                # ModifyDateも、他に何もなければ候補になりうるが、今回は除外
-                params = [
-                    "-DateTimeOriginal", "-CreateDate", "-DateCreated", # 標準的な作成日時タグ
-                    "-SubSecDateTimeOriginal", "-SubSecCreateDate", # サブ秒含むタグ
-                    "-MakerNotes:DateTimeOriginal", # メーカー独自タグも試す
-                    "-fast", "-api", "largefilesupport=1"
-                ]
-                metadata = et.get_metadata(files, params=params)
+            # 主要な作成日時系のタグを指定(-FileModifyDateは含めない)
+            # ModifyDateも、他に何もなければ候補になりうるが、今回は除外
+            params = [
+                "-DateTimeOriginal", "-CreateDate", "-DateCreated", # 標準的な作成日時タグ
+                "-SubSecDateTimeOriginal", "-SubSecCreateDate", # サブ秒含むタグ
+                "-MakerNotes:DateTimeOriginal", # メーカー独自タグも試す
+                "-Model", "-OffsetTimeOriginal", # タイムゾーン決定用
+                "-fast", "-api", "largefilesupport=1"
+            ]
+            with stage_metrics.stage('exiftool'):
+                metadata = exiftool_get_metadata(files, params)
             if metadata:
                 d = metadata[0]
+                tz = tz_policy.resolve(
+                    file_path, _exiftool_camera_model(d), _lookup_exiftool_tag(d, "EXIF:OffsetTimeOriginal")
+                )
                 # 収集対象とするExifToolのタグ名リスト
                 # FileMofidyDate は最も古い日時を求める意図から除外
                 exiftool_tags_to_check = [
@@ -128,134 +1141,161 @@ def get_image_date(file_path):
                     "MakerNotes:DateTimeOriginal",
                     "Composite:SubSecDateTimeOriginal", "Composite:SubSecCreateDate",
                 ]
+                if trace is not None and trace.camera_model is None:
+                    trace.camera_model = _exiftool_camera_model(d)
                 for key in exiftool_tags_to_check:
-                    tag_name_only = key.split(':')[-1]
-                    if tag_name_only in d:
-                        val = d[tag_name_only]
-                        dt_candidate = None
-                        if isinstance(val, str) and val.strip():
-                            dt_candidate = validate_and_parse_datetime(val)
-                        elif isinstance(val, datetime):
-                            if val.tzinfo:
-                                tokyo_tz = pytz.timezone('Asia/Tokyo')
-                                val = val.astimezone(tokyo_tz).replace(tzinfo=None)
-                            if validate_and_parse_datetime(val.strftime("%Y:%m:%d %H:%M:%S")):
-                                dt_candidate = val
-                        if dt_candidate:
-                            print(f" [ExifTool] Tag {key} -> 候補: {dt_candidate.strftime('%Y:%m:%d %H:%M:%S')}")
-                            valid_datetimes.append(dt_candidate)
+                    val = _lookup_exiftool_tag(d, key)
+                    if val is not None:
+                        # 文字列・datetimeのどちらもそのまま正規化できる
+                        dt_candidate = validate_and_parse_datetime(val, tz)
+                        if trace is not None:
+                            trace.add('exiftool', key, val, dt_candidate, tz, exiftool_used)
+                        if dt_candidate and exiftool_used:
+                            logger.debug(" [ExifTool] Tag %s -> 候補: %s", key, dt_candidate)
+                            valid_datetimes.append((dt_candidate, 'exiftool'))
             else:
-                print(f"メタデータ取得エラー [ExifTool]: {os.path.basename(file_path)}")
+                logger.debug("メタデータ取得エラー [ExifTool]: %s", os.path.basename(file_path))
         except Exception as e:
-            print(f"メタデータ取得中に予期せぬエラー [ExifTool]: {os.path.basename(file_path)} ({e})")
-    
+            logger.warning("メタデータ取得中に予期せぬエラー [ExifTool]: %s (%s)", os.path.basename(file_path), e)
+            if trace is not None:
+                trace.error('exiftool', e)
+
     # 3. 収集した有効な日時の中から最も古いものを選択
     if valid_datetimes:
-        # 重複を除去してソートし、最小値(最も古い日時)を取得
-        oldest_datetime = min(list(set(valid_datetimes)))
-        print(f"-> 画像 {os.path.basename(file_path)}: 最も古い日時 {oldest_datetime.strftime('%Y:%m:%d %H:%M:%S')} を採用")
+        oldest_datetime, source = min(valid_datetimes, key=lambda candidate: candidate[0])
+        stage_metrics.record_source(source)
+        logger.debug("-> 画像 %s: 最も古い日時 %s を採用", os.path.basename(file_path), oldest_datetime)
+        if trace is not None:
+            trace.choose(oldest_datetime, source)
+            if trace.exhaustive:
+                get_file_timestamp_date(file_path, tz_policy, "画像", trace, used=False)
         # 最も古いdatetimeオブジェクトを期待する文字列形式に変換して返す
         return oldest_datetime.strftime('%Y_%m_%d_%H_%M_%S')
     # ––– メタデータ日時が見つからなかった場合の処理 –––
-    if not valid_datetimes:
-        print(f"有効なメタデータ日時が見つかりませんでした。ExifToolでファイルのタイムスタンプを確認します: {os.path.basename}")
-        file_timestamps_from_exif = []
-        try:
-            files = [str(file_path)]
-            with exiftool.ExifToolHelper() as et:
-                # Fileグループのタイムスタンプのみを取得
-                params = [
-                    "-G", # グループ名を取得
-                    "-File:FileModifyDate",
-                    "-File:FileAccessDate",
-                    "-File:FileInodeChangeDate", # Linux/macOSでのinode変更日時
-                    "-File:FileCreateDate",    # Windowsでの作成日時 (ExifToolバージョン依存)
-                    "-fast", "-api", "largefilesupport=1"
-                ]
-                metadata = et.get_metadata(files, params=params)
-            if metadata:
-                d = metadata[0]
-                file_tags_to_check = [
-                "File:FileModifyDate",
-                "File:FileAccessDate",
-                "File:FileInodeChangeDate",
-                "File:FileCreateDate",
-                ]
-                for tag in file_tags_to_check:
-                    if tag in d:
-                        val = d[tag]
-                        # タイムゾーン対応のパース関数を使用
-                        dt_candidate = validate_and_parse_datetime(val)
-                        if dt_candidate:
-                            print(f" [ExifTool File] {tag} -> 候補: {dt_candidate.strftime('%Y:%m:%d %H:%M:%S')}")
-                            file_timestamps_from_exif.append(dt_candidate)
-            else:
-                print(f"ファイルタイムスタンプ取得結果なし [ExifTool File]:{os.path.basename(file_path)}")
-        except FileNotFoundError:
-            print(f"ファイルが見つかりません [ExifTool File]: {file_path}")
-            return None
-        except Exception as e:
-            print(f"ファイルタイムスタンプ取得中に予期せぬエラー [ExifTool File]: {os.path.basename(file_path)}")
-            return None
-        if file_timestamps_from_exif:
-            unique_file_timestamps = list(set(file_timestamps_from_exif))
-            oldest_file_time = min(unique_file_timestamps)
-            print(f"-> 動画 {os.path.basename(file_path)}: ExifToolのファイルタイムスタンプから最も古い日時 {oldest_file_time.strftime('%Y:%m:%d %H:%M:%S')} を代替として採用します。")
-            return oldest_file_time.strftime('%Y_%m_%d_%H_%M_%S')
-        else:
-            print(f"有効な日時データを取得できませんでした: {os.path.basename(file_path)}")
-            return None
+    return get_file_timestamp_date(file_path, tz_policy, "画像", trace)
 
-def get_video_date(file_path, local_timezone='Asia/Tokyo'):
+def _ffprobe_camera_model(probe):
+    """ffprobeの結果のタグからカメラ機種名を取得する(com.apple.quicktime.model など)"""
+    for tags in [probe.get('format', {}).get('tags', {})] + [s.get('tags', {}) for s in probe.get('streams', [])]:
+        for key, val in tags.items():
+            if key.lower().endswith('model') and val:
+                return str(val)
+    return None
+
+@stage_metrics.timed('get_video_date')
+def get_video_date(file_path, tz_policy=None, trace=None, header=None):
     """
     ffmpegまたはExifToolを使用し、動画ファイルから最も古い有効な撮影日時を取得。
+    UTCで記録された日時は tz_policy(省略時は既定のポリシー)で決めたタイムゾーンに変換する。
+    trace(DateTrace)を渡すと、候補と採用値を記録する。
+    MP4 / MOV・AVI・Matroska / WebM は header(HeaderBuffer、省略時はここで開く)から日時と機種名を直接読み
+    (NATIVE_VIDEO_READERS)、見つかれば ffprobe を起動しない。
+    ただし機種名でタイムゾーンを決める設定があり、UTC の日時しかなく機種名をヘッダーから読めない場合は、
+    機種名を得るため ffprobe / ExifTool を使う。
     成功時は 'YYYY_MM_DD_HH_MM_SS' 形式の文字列を返す。
     取得できない場合は、ファイルのタイムスタンプ(更新日時、アクセス日時、作成/inode変更日時)の中で最も古いものを代替として使用する。
     """
-    valid_datetimes = [] # 有効な日時(datetimeオブジェクト)を格納するリスト
-    print(f"動画 {os.path.basename(file_path)}: 日時情報収集開始...")
-    # 1. ffmpegで日時情報を収集し、リストに追加(MP4の場合)
-    print(f" [ffmpeg] 日時情報を検索...")
-    try:
-        probe = ffmpeg.probe(file_path)
-        format_info = probe.get('format', {})
-        creation_time_str = format_info.get('tags', {}).get('creation_time')
-        if creation_time_str:
-            ffmpeg_dt = validate_and_parse_datetime(creation_time_str)
-            if ffmpeg_dt:
-                print(f" [ffmpeg] format:tags:creatiem_time -> 候補: {ffmpeg_dt.strftime('%Y:%m:%d %H:%M:%S')}")
-                valid_datetimes.append(ffmpeg_dt)
-        # stream タグの creation_time(動画/音声トラックにある場合)
-        for stream in probe.get('streams', []):
-            stream_creation_time = stream.get('tags', {}).get('creation_time')
-            if stream_creation_time:
-                stream_dt = validate_and_parse_datetime(stream_creation_time)
-                if stream_dt:
-                    print(f" [ffmpeg] stream[{stream.get('index', '?')}]:tags:creation_time -> 候補: {stream_dt.strftime('%Y:%m:%d %H:%M:%S')}")
-                    valid_datetimes.append(stream_dt)
-    except ffmpeg.Error as e:
-        print(f"ffmpeg probeエラー: {os.path.basename(file_path)} ({e})")
-    except Exception as e:
-        print(f"ffmpeg処理中の予期せぬエラー: {os.path.basename(file_path)} ({e})")
+    if tz_policy is None:
+        tz_policy = default_timezone_policy()
+    valid_datetimes = [] # 有効な日時(datetimeオブジェクト)と取得元の組を格納するリスト
+    logger.debug("動画 %s: 日時情報収集開始...", os.path.basename(file_path))
+    # 0. MP4 / MOV・AVI・Matroska / WebM はヘッダーを直接読む(外部プロセスを起動しないため ffprobe より大幅に軽い)
+    native = NATIVE_VIDEO_READERS.get(os.path.splitext(file_path)[1].lower())
+    if native is not None:
+        reader, model_reader, source, utc_based = native
+        own_header = None
+        try:
+            if header is None:
+                header = own_header = HeaderBuffer(file_path)
+            native_dates = reader(header)
+            # 機種名はカタログへの記録(trace)か、機種ごとのタイムゾーンの決定に必要な場合だけ読む
+            camera_model = None
+            if model_reader is not None and native_dates and (trace is not None or tz_policy.camera_models):
+                camera_model = model_reader(header)
+            if trace is not None:
+                trace.camera_model = camera_model
+            # UTC の日時を機種ごとのタイムゾーンで変換すべきなのに機種名が分からない場合は、ffprobe / ExifTool に任せる
+            native_used = not (utc_based and tz_policy.camera_models and camera_model is None)
+            tz = tz_policy.resolve(file_path, camera_model)
+            for tag, value in native_dates:
+                native_dt = validate_and_parse_datetime(value, tz)
+                if trace is not None:
+                    trace.add(source, tag, value.isoformat() if isinstance(value, datetime) else value, native_dt, tz,
+                              native_used)
+                if native_dt and native_used:
+                    logger.debug(" [%s] %s -> 候補: %s", source, tag, native_dt)
+                    valid_datetimes.append((native_dt, source))
+        except Exception as e:
+            logger.debug("動画ヘッダーの読み取りエラー: %s (%s)", os.path.basename(file_path), e)
+            if trace is not None:
+                trace.error(source, e)
+        finally:
+            if own_header is not None:
+                own_header.close()
+    # 1. ffmpegで日時情報を収集し、リストに追加(ヘッダーから見つからなかった場合)
+    # (trace.exhaustive の場合はヘッダーで見つかっていても候補の記録のために実行する)
+    ffprobe_used = not valid_datetimes
+    if ffprobe_used or (trace is not None and trace.exhaustive):
+        try:
+            with stage_metrics.stage('ffprobe'):
+                probe = ffmpeg.probe(file_path)
+            camera_model = _ffprobe_camera_model(probe)
+            tz = tz_policy.resolve(file_path, camera_model)
+            if trace is not None and trace.camera_model is None:
+                trace.camera_model = camera_model
+            format_info = probe.get('format', {})
+            creation_time_str = format_info.get('tags', {}).get('creation_time')
+            if creation_time_str:
+                ffmpeg_dt = validate_and_parse_datetime(creation_time_str, tz)
+                if trace is not None:
+                    trace.add('ffprobe', 'format:creation_time', creation_time_str, ffmpeg_dt, tz, ffprobe_used)
+                if ffmpeg_dt and ffprobe_used:
+                    logger.debug(" [ffmpeg] format:tags:creation_time -> 候補: %s", ffmpeg_dt)
+                    valid_datetimes.append((ffmpeg_dt, 'ffprobe'))
+            # stream タグの creation_time(動画/音声トラックにある場合)
+            for stream in probe.get('streams', []):
+                stream_creation_time = stream.get('tags', {}).get('creation_time')
+                if stream_creation_time:
+                    stream_dt = validate_and_parse_datetime(stream_creation_time, tz)
+                    if trace is not None:
+                        trace.add('ffprobe', f"stream[{stream.get('index', '?')}]:creation_time",
+                                  stream_creation_time, stream_dt, tz, ffprobe_used)
+                    if stream_dt and ffprobe_used:
+                        logger.debug(" [ffmpeg] stream[%s]:tags:creation_time -> 候補: %s", stream.get('index', '?'), stream_dt)
+                        valid_datetimes.append((stream_dt, 'ffprobe'))
+        except ffmpeg.Error as e:
+            logger.debug("ffmpeg probeエラー: %s (%s)", os.path.basename(file_path), e)
+            if trace is not None:
+                trace.error('ffprobe', e)
+        except Exception as e:
+            logger.warning("ffmpeg処理中の予期せぬエラー: %s (%s)", os.path.basename(file_path), e)
+            if trace is not None:
+                trace.error('ffprobe', e)
     # 2. ExifToolを使用する
-    if not valid_datetimes:
+    # (trace.exhaustive の場合はヘッダーや ffprobe で見つかっていても候補の記録のために実行する)
+    exiftool_used = not valid_datetimes
+    if exiftool_used or (trace is not None and trace.exhaustive):
         try:
             files = [str(file_path)]
-            with exiftool.ExifToolHelper() as et:
-                # 動画関連の主要な作成日時系のタグを指定 (-FileModifyDateは含めない)
-                params = [
-                    "-QuickTime:CreateDate", "-QuickTime:MediaCreateDate", "-QuickTime:TrackCreateDate",
-                    "-Keys:CreationDate", "-UserData:DateTimeOriginal",
-                    "-XMP:DateTimeOriginal", "-XMP:CreateDate", "-XMP:DateCreated",
-                    "-H264:DateTimeOriginal", "-MPEG:DateTimeOriginal",
-                    "-RIFF:DateTimeOriginal", "-ASF:CreationDate", "-Matroska:DateUTC",
-                    "-EXIF:DateTimeOriginal", "-EXIF:CreateDate", # 動画にEXIFがある場合
-                    "-Composite:SubSecCreateDate", "-Composite:SubSecDateTimeOriginal",
-                    "-fast", "-api", "largefilesupport=1"
-                ]
-                metadata = et.get_metadata(files, params=params)
+            # 動画関連の主要な作成日時系のタグを指定 (-FileModifyDateは含めない)
+            params = [
+                "-QuickTime:CreateDate", "-QuickTime:MediaCreateDate", "-QuickTime:TrackCreateDate",
+                "-Keys:CreationDate", "-UserData:DateTimeOriginal",
+                "-XMP:DateTimeOriginal", "-XMP:CreateDate", "-XMP:DateCreated",
+                "-H264:DateTimeOriginal", "-MPEG:DateTimeOriginal",
+                "-RIFF:DateTimeOriginal", "-ASF:CreationDate", "-Matroska:DateUTC",
+                "-EXIF:DateTimeOriginal", "-EXIF:CreateDate", # 動画にEXIFがある場合
+                "-Composite:SubSecCreateDate", "-Composite:SubSecDateTimeOriginal",
+                "-Model", "-OffsetTimeOriginal", # タイムゾーン決定用
+                "-fast", "-api", "largefilesupport=1"
+            ]
+            with stage_metrics.stage('exiftool'):
+                metadata = exiftool_get_metadata(files, params)
             if metadata:
                 d = metadata[0]
+                tz = tz_policy.resolve(
+                    file_path, _exiftool_camera_model(d), _lookup_exiftool_tag(d, "EXIF:OffsetTimeOriginal")
+                )
                 # 収集対象とするExifToolのタグ名リスト
                 # FileModifyDate は最も古い日時を求める意図から除外
                 exiftool_tags_to_check = [
@@ -267,98 +1307,64 @@ def get_video_date(file_path, local_timezone='Asia/Tokyo'):
                     "EXIF:DateTimeOriginal", "EXIF:CreateDate",
                     "Composite:SubSecCreateDate", "Composite:SubSecDateTimeOriginal",
                 ]
+                if trace is not None and trace.camera_model is None:
+                    trace.camera_model = _exiftool_camera_model(d)
                 for key in exiftool_tags_to_check:
-                    tag_name_only = key.split(':')[-1]
-                    if tag_name_only in d:
-                        val = d[tag_name_only]
-                        dt_candidate = None
-                        if isinstance(val, str) and val.strip():
-                            dt_candidate = validate_and_parse_datetime(val)
-                        elif isinstance(val, datetime):
-                            if val.tzinfo:
-                                tz = pytz.timezone(local_timezone)
-                                val = val.astimezone(tz).replace(tzinfo=None)
-                            if validate_and_parse_datetime(val.strftime("%Y:%m:%d %H:%M:%S")):
-                                dt_candidate = val
-                        if dt_candidate:
-                            print(f" [ExifTool] Tag {key} -> 候補: {dt_candidate.strftime('%Y:%m:%d %H:%M:%S')}")
-                            valid_datetimes.append(dt_candidate)
+                    val = _lookup_exiftool_tag(d, key)
+                    if val is not None:
+                        dt_candidate = validate_and_parse_datetime(val, tz)
+                        if trace is not None:
+                            trace.add('exiftool', key, val, dt_candidate, tz, exiftool_used)
+                        if dt_candidate and exiftool_used:
+                            logger.debug(" [ExifTool] Tag %s -> 候補: %s", key, dt_candidate)
+                            valid_datetimes.append((dt_candidate, 'exiftool'))
             else:
-                print(f"メタデータ取得エラー [ExifTool]: {os.path.basename(file_path)}")
+                logger.debug("メタデータ取得エラー [ExifTool]: %s", os.path.basename(file_path))
         except Exception as e:
-            print(f"メタデータ取得中に予期せぬエラー [ExifTool]: {os.path.basename(file_path)} ({e})")
+            logger.warning("メタデータ取得中に予期せぬエラー [ExifTool]: %s (%s)", os.path.basename(file_path), e)
+            if trace is not None:
+                trace.error('exiftool', e)
     # 3. 収集した有効な日時の中から最も古いものを選択または代替処理
     if valid_datetimes:
-        # 重複を除去して最小値(最も古い日時)を取得
-        unique_valid_datetimes = list(set(valid_datetimes))
-        oldest_datetime = min(unique_valid_datetimes)
-        print(f"-> 動画 {os.path.dirname(file_path)}: 最も古い日時 {oldest_datetime.strftime('%Y:%m:%d %H:%M:%S')} を採用")
+        oldest_datetime, source = min(valid_datetimes, key=lambda candidate: candidate[0])
+        stage_metrics.record_source(source)
+        logger.debug("-> 動画 %s: 最も古い日時 %s を採用", os.path.basename(file_path), oldest_datetime)
+        if trace is not None:
+            trace.choose(oldest_datetime, source)
+            if trace.exhaustive:
+                get_file_timestamp_date(file_path, tz_policy, "動画", trace, used=False)
         # 最も古いdatetimeオブジェクトを期待する文字列形式に変換して返す
         return oldest_datetime.strftime('%Y_%m_%d_%H_%M_%S')
     # ––– メタデータ日時が見つからなかった場合の処理 –––
-    if not valid_datetimes:
-        print(f"有効なメタデータ日時が見つかりませんでした。ExifToolでファイルのタイムスタンプを確認します: {os.path.basename}")
-        file_timestamps_from_exif = []
-        try:
-            files = [str(file_path)]
-            with exiftool.ExifToolHelper() as et:
-                # Fileグループのタイムスタンプのみを取得
-                params = [
-                    "-G", # グループ名を取得
-                    "-File:FileModifyDate",
-                    "-File:FileAccessDate",
-                    "-File:FileInodeChangeDate", # Linux/macOSでのinode変更日時
-                    "-File:FileCreateDate",    # Windowsでの作成日時 (ExifToolバージョン依存)
-                    "-fast", "-api", "largefilesupport=1"
-                ]
-                metadata = et.get_metadata(files, params=params)
-            if metadata:
-                d = metadata[0]
-                file_tags_to_check = [
-                "File:FileModifyDate",
-                "File:FileAccessDate",
-                "File:FileInodeChangeDate",
-                "File:FileCreateDate",
-                ]
-                for tag in file_tags_to_check:
-                    if tag in d:
-                        val = d[tag]
-                        # タイムゾーン対応のパース関数を使用
-                        dt_candidate = validate_and_parse_datetime(val)
-                        if dt_candidate:
-                            print(f" [ExifTool File] {tag} -> 候補: {dt_candidate.strftime('%Y:%m:%d %H:%M:%S')}")
-                            file_timestamps_from_exif.append(dt_candidate)
-            else:
-                print(f"ファイルタイムスタンプ取得結果なし [ExifTool File]:{os.path.basename(file_path)}")
-        except FileNotFoundError:
-            print(f"ファイルが見つかりません [ExifTool File]: {file_path}")
-            return None
-        except Exception as e:
-            print(f"ファイルタイムスタンプ取得中に予期せぬエラー [ExifTool File]: {os.path.basename(file_path)}")
-            return None
-        if file_timestamps_from_exif:
-            unique_file_timestamps = list(set(file_timestamps_from_exif))
-            oldest_file_time = min(unique_file_timestamps)
-            print(f"-> 動画 {os.path.basename(file_path)}: ExifToolのファイルタイムスタンプから最も古い日時 {oldest_file_time.strftime('%Y:%m:%d %H:%M:%S')} を代替として採用します。")
-            return oldest_file_time.strftime('%Y_%m_%d_%H_%M_%S')
-        else:
-            print(f"有効な日時データを取得できませんでした: {os.path.basename(file_path)}")
-            return None
+    return get_file_timestamp_date(file_path, tz_policy, "動画", trace)
 
-def get_file_date(file_path):
+def get_file_date(file_path, tz_policy=None, trace=None):
     """
     画像または動画ファイルから撮影日時を取得。
     取得できなければ、ファイルの最終更新日時を利用する。
     撮影日時は 'YYYY_MM_DD_HH_MM_SS' 形式で返す。
+    trace(DateTrace)を渡すと、候補と採用値を記録する。
+    ファイルの先頭は HeaderBuffer で一度だけ読み込み、抽出処理の間で共有する。
     """
     ext = os.path.splitext(file_path)[1].lower()
     date_str = None
-    if ext in IMAGE_EXTS:
-        date_str = get_image_date(file_path)
-    elif ext in VIDEO_EXTS:
-        date_str = get_video_date(file_path)
+    # 先頭を一度だけ読み、PIL・MP4のボックス読み取りで共有する(開けない場合は各抽出処理がパスから開き、エラーを報告する)
+    header = None
+    try:
+        if ext in IMAGE_EXTS or ext in NATIVE_VIDEO_READERS:
+            header = HeaderBuffer(file_path)
+    except OSError as e:
+        logger.debug("ファイル先頭の読み込みエラー: %s (%s)", os.path.basename(file_path), e)
+    try:
+        if ext in IMAGE_EXTS:
+            date_str = get_image_date(file_path, tz_policy, trace, header)
+        elif ext in VIDEO_EXTS:
+            date_str = get_video_date(file_path, tz_policy, trace, header)
+    finally:
+        if header is not None:
+            header.close()
     if date_str:
-        print(f"-> 取得日時: {date_str} ({os.path.basename(file_path)})")
+        logger.debug("-> 取得日時: %s (%s)", date_str, os.path.basename(file_path))
         return date_str
     else:
         # 最終更新日時を使う場合（オプション）
@@ -369,10 +1375,11 @@ def get_file_date(file_path):
         #     return dt_mod.strftime('%Y_%m_%d_%H_%M_%S')
         # except Exception as e:
         #     print(f"-> 最終更新日時の取得エラー: {e} ({os.path.basename(file_path)})")
-        print(f"-> 日時取得失敗 ({os.path.basename(file_path)})")
-        print(f"日時取得失敗 ({os.path.basename(file_path)})")
+        stage_metrics.record_source('none')
+        logger.debug("-> 日時取得失敗 (%s)", os.path.basename(file_path))
         return None
 
+@stage_metrics.timed('make_destination_path')
 def make_destination_path(dest_root, date_str):
     """
     日付文字列（例: "2019_08_26_09_54_50"）から、dest_root/year/month/day/ を作成し、返す。
@@ -387,78 +1394,156 @@ def make_destination_path(dest_root, date_str):
         os.makedirs(dest_dir, exist_ok=True)
         return dest_dir, new_basename
     except ValueError: # パース失敗
-        print(f"日付文字列 '{date_str}' のパースエラー。移動先パス作成失敗。")
+        logger.error("日付文字列 '%s' のパースエラー。移動先パス作成失敗。", date_str)
         return None
     except Exception as e:
-        print(f"移動先パス作成エラー: {e} (日付: {date_str})")
+        logger.error("移動先パス作成エラー: %s (日付: %s)", e, date_str)
         return None
 
-def move_and_rename(src_path, dest_dir, new_basename):
+def choose_destination(src_path, dest_dir, new_basename):
     """
-    src_pathをdest_dir内にnew_basename + 元の拡張子で移動する。
-    同名ファイルがある場合は、内容を比較して
-        - 同一なら移動元のファイルを削除し、"duplicate" を返す。
-        - 異なる場合は、上書きせず連番を付加して移動する。
-    正常に移動できた場合は、"moved"、エラーが発生した場合は、"failed" を返す。
+    src_path の移動先を dest_dir 内から決め、(移動先のパス, 同一内容か) を返す。
+    new_basename + 元の拡張子から順に連番付きの名前を調べ、内容が同一の既存ファイルがあればそのパスと True を、
+    なければ最初の空いている名前のパスと False を返す。ファイルを読めない場合は OSError を送出する。
     """
-    if not os.path.exists(src_path):
-        print(f"移動元ファイルが見つかりません: {src_path}")
-        return "failed" # 移動元がない
     ext = os.path.splitext(src_path)[1].lower()
-    new_name = new_basename + ext
-    dest_path = os.path.join(dest_dir, new_name)
+    dest_path = os.path.join(dest_dir, new_basename + ext)
     counter = 1
     # 同名ファイルが存在する場合の処理
     while os.path.exists(dest_path):
         # 内容を比較(shallow=Falseでバイナリデータを用いた内容の厳密な比較になる)
+        with stage_metrics.stage('filecmp'):
+            same_content = filecmp.cmp(src_path, dest_path, shallow=False)
+        if same_content:
+            return dest_path, True
+        # 異なる内容の場合: 連番を付与して新しい名前を作成
+        dest_path = os.path.join(dest_dir, f"{new_basename}_{counter}{ext}")
+        counter += 1
+    return dest_path, False
+
+def apply_destination(src_path, dest_path, same_content, moved_to=None):
+    """
+    choose_destination の結果どおりに処理する。same_content なら移動元を削除して "duplicate" を、
+    そうでなければ dest_path に移動して "moved" を返す(dest_path に既にファイルがあれば上書きせず "failed")。
+    moved_to(リスト)を渡すと、成功した場合に dest_path を追加する。
+    """
+    if same_content:
+        # 同一の内容の場合: 移動元ファイルを削除し、重複カウントを増やす
+        logger.debug("重複ファイル検出: %s と %s は同一の内容です。移動せずに %s を削除します。", src_path, dest_path, src_path)
         try:
-            if filecmp.cmp(src_path, dest_path, shallow=False):
-                # 同一の内容の場合: 移動元ファイルを削除し、重複カウントを増やす
-                print(f"重複削除: {src_path} (重複先: {dest_path})")
-                print(f"重複ファイル検出: {src_path} と {dest_path} は同一の内容です。移動せずに {src_path} を削除します。")
-                try:
-                    os.remove(src_path)
-                    return "duplicate" # ここで処理終了
-                except OSError as e:
-                    print(f"重複ファイルの削除失敗: {src_path} ({e})")
-                    return "failed"
-            else:
-                # 異なる内容の場合: 連番を付与して新しい名前を作成
-                new_name = f"{new_basename}_{counter}{ext}"
-                dest_path = os.path.join(dest_dir, new_name)
-                counter += 1
-        except OSError as e: # ファイルアクセスエラーなど
-            print(f"重複チェック/ファイルアクセスエラー: {e} (src: {src_path}, dest: {dest_path})")
-            return "failed"
-        except Exception as e:
-            print(f"重複チェック中の予期せぬエラー: {e} (src: {src_path}, dest: {dest_path})")
+            size = os.path.getsize(src_path)
+            os.remove(src_path)
+            stage_metrics.add_bytes('duplicate_removed', size)
+        except OSError as e:
+            logger.error("重複ファイルの削除失敗: %s (%s)", src_path, e)
             return "failed"
+        if moved_to is not None:
+            moved_to.append(dest_path)
+        return "duplicate"
+    if os.path.exists(dest_path):
+        logger.error("移動先に別のファイルがあるため移動しません: %s -> %s", src_path, dest_path)
+        return "failed"
     try:
-        shutil.move(src_path, dest_path)
-        print(f"移動: {src_path} -> {dest_path}")
+        size = os.path.getsize(src_path)
+        with stage_metrics.stage('shutil_move'):
+            shutil.move(src_path, dest_path)
+        stage_metrics.add_bytes('moved', size)
+        logger.debug("移動: %s -> %s", src_path, dest_path)
+        if moved_to is not None:
+            moved_to.append(dest_path)
         return "moved"
     except Exception as e:
-        print(f"移動失敗: {src_path} -> {dest_path} ({e})")
+        logger.error("移動失敗: %s -> %s (%s)", src_path, dest_path, e)
         return "failed"
 
-def validate_and_parse_datetime(date_str):
+@stage_metrics.timed('move_and_rename')
+def move_and_rename(src_path, dest_dir, new_basename, moved_to=None):
     """
-    撮影日時の文字列を受け取り、正しい日付としてパースします。
-    タイムゾーン情報が含まれている場合は、東京(Asia/Tokyo)に合わせた後、tz情報を除去して返します。
-    形式は "YYYY:MM:DD HH:MM:SS" または "YYYY:MM:DD HH:MM:SS+09:00" のような形式を想定します。
+    src_pathをdest_dir内にnew_basename + 元の拡張子で移動する。
+    同名ファイルがある場合は、内容を比較して
+        - 同一なら移動元のファイルを削除し、"duplicate" を返す。
+        - 異なる場合は、上書きせず連番を付加して移動する。
+    正常に移動できた場合は、"moved"、エラーが発生した場合は、"failed" を返す。
+    moved_to(リスト)を渡すと、"moved" / "duplicate" の場合に移動先(または同一内容の既存ファイル)のパスを追加する。
     """
-    # 空白やNoneの場合
-    if not date_str or not isinstance(date_str, str) or date_str.strip() == "" or "0000:00:00" in date_str:
-        print(f"日付パース失敗: 入力が文字列ではありません (型: {type(date_str)})。")
+    if not os.path.exists(src_path):
+        logger.error("移動元ファイルが見つかりません: %s", src_path)
+        return "failed" # 移動元がない
+    try:
+        dest_path, same_content = choose_destination(src_path, dest_dir, new_basename)
+    except OSError as e: # ファイルアクセスエラーなど
+        logger.error("重複チェック/ファイルアクセスエラー: %s (src: %s, dest_dir: %s)", e, src_path, dest_dir)
+        return "failed"
+    except Exception as e:
+        logger.error("重複チェック中の予期せぬエラー: %s (src: %s, dest_dir: %s)", e, src_path, dest_dir)
+        return "failed"
+    return apply_destination(src_path, dest_path, same_content, moved_to)
+
+# --- 日時パース ---
+# 既定のローカルタイムゾーン(タイムゾーン情報付きの日時はここに合わせてからnaiveにする)
+# 実際に使うタイムゾーンは TimezonePolicy でファイルごとに決定する
+LOCAL_TIMEZONE = 'Asia/Tokyo'
+# TimezonePolicy の設定ファイル(存在する場合のみ読み込む)
+TIMEZONE_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'timezone_policy.json')
+# 日付として許容する範囲(上限は検証時点から MAX_ALLOWED_DATE_MARGIN 先まで)
+MIN_ALLOWED_DATE = datetime(1970, 1, 1)
+MAX_ALLOWED_DATE_MARGIN = timedelta(days=365)
+# パース結果キャッシュの上限(同じ文字列はタグ間・ファイル間で何度も現れる)
+DATETIME_CACHE_SIZE = 65536
+
+# EXIF ("YYYY:MM:DD HH:MM:SS") と ISO ("YYYY-MM-DDTHH:MM:SS") の一般的な形を一度に受ける固定パターン
+# サブ秒とタイムゾーン(Z, +09:00, +0900)は任意
+_FAST_DATETIME_RE = re.compile(
+    r'(\d{4})[:\-/](\d{2})[:\-/](\d{2})[T ](\d{2}):(\d{2}):(\d{2})'
+    r'(?:\.(\d{1,9}))?\s*(Z|[+\-]\d{2}:?\d{2})?'
+)
+_INVALID_CHARS_RE = re.compile(r'[^0-9:/\-T Z+.]')
+_TZ_NO_COLON_RE = re.compile(r'([+\-])(\d{2})(\d{2})$')
+_TZ_SUFFIX_RE = re.compile(r'([+\-]\d{2}:?\d{2}|Z)\s*$')
+_TZ_OFFSET_RE = re.compile(r'[+\-]\d{2}:?\d{2}|Z')
+# fromisoformatで読めない場合に試すフォーマット
+_STRPTIME_FORMATS = [
+    "%Y:%m:%d %H:%M:%S",        # EXIF 標準
+    "%Y-%m-%d %H:%M:%S",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y%m%d %H%M%S",          # 区切り文字なし
+    "%Y:%m:%d %H:%M:%S.%f",    # マイクロ秒付き
+    "%Y-%m-%d %H:%M:%S.%f",
+]
+
+@functools.lru_cache(maxsize=None)
+def _get_timezone(name):
+    """pytzのタイムゾーンオブジェクトを名前ごとに一度だけ生成する"""
+    return pytz.timezone(name)
+
+@functools.lru_cache(maxsize=None)
+def _fixed_offset(tz_str):
+    """'Z', '+09:00', '+0900' 形式のオフセット文字列を tzinfo に変換する"""
+    if tz_str == 'Z':
+        return timezone.utc
+    sign = -1 if tz_str[0] == '-' else 1
+    digits = tz_str[1:].replace(':', '')
+    minutes = int(digits[:2]) * 60 + int(digits[2:4])
+    return timezone(sign * timedelta(minutes=minutes))
+
+def _parse_fast(date_str):
+    """固定パターンに一致すれば datetime を直接組み立てる。一致しなければ None"""
+    m = _FAST_DATETIME_RE.fullmatch(date_str)
+    if not m:
+        return None
+    year, month, day, hour, minute, second, frac, tz_str = m.groups()
+    microsecond = int(frac[:6].ljust(6, '0')) if frac else 0
+    tzinfo = _fixed_offset(tz_str) if tz_str else None
+    try:
+        return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), microsecond, tzinfo)
+    except ValueError:
         return None
-    # 前処理: 不要な文字を除去
-    date_str = re.sub(r'[^0-9:/\-T Z+.]', ' ', date_str).strip()
-    parsed_dt = None
-    original_tzinfo = None
-    tz_match_found = None
+
+def _parse_slow(date_str):
+    """fromisoformat と strptime による従来のパース。一致しなければ None"""
     # 1. fromisoformatを試す
     try:
-        iso_str = date_str.strip().replace(" ", "T")
+        iso_str = date_str.replace(" ", "T")
         # マイクロ秒以降を切り捨て(最大6桁まで対応)
         if '.' in iso_str:
             parts = iso_str.split('.')
@@ -466,131 +1551,396 @@ def validate_and_parse_datetime(date_str):
         # Zを+00:00に
         if iso_str.endswith('Z'):
             iso_str = iso_str[:-1] + '+00:00'
-        # タイムゾーンオフセットがない場合がある
-        if 'T' in iso_str and not re.search(r'[+\-Z]', iso_str):
-            # オフセットなしISO形式は naive としてパースされる
-            pass
         # タイムゾーンオフセットの区切りがない場合(例: +0900) : を挿入
-        iso_str = re.sub(r'([+\-])(\d{2})(\d{2})$', r'\1\2:\3', iso_str)
-        temp_dt = datetime.fromisoformat(iso_str)
-        parsed_dt = temp_dt
-        original_tzinfo = parsed_dt.tzinfo # タイムゾーン情報を保持
+        iso_str = _TZ_NO_COLON_RE.sub(r'\1\2:\3', iso_str)
+        return datetime.fromisoformat(iso_str)
     except (ValueError, TypeError):
-        # 失敗したら次の方法へ
         pass
     # 2. strptimeで一般的なフォーマットを試す
-    if not parsed_dt:
-        formats_to_try = [
-            "%Y:%m:%d %H:%M:%S",        # EXIF 標準
-            "%Y-%m-%d %H:%M:%S",
-            "%Y/%m/%d %H:%M:%S",
-            # "%Y-%m-%dT%H:%M:%S",    # fromisoformatでカバーされるはず
-            "%Y%m%d %H%M%S",          # 区切り文字なし
-            "%Y:%m:%d %H:%M:%S.%f",    # マイクロ秒付き
-            "%Y-%m-%d %H:%M:%S.%f",
-            # タイムゾーン情報を含む可能性のある形式 (%zは限定的なので注意)
-            # "%Y:%m:%d %H:%M:%S%z",
-            # "%Y-%m-%d %H:%M:%S%z",
+    # タイムゾーンらしき部分を除去してパースを試みる
+    cleaned_str = date_str
+    tzinfo = None
+    tz_match = _TZ_SUFFIX_RE.search(cleaned_str)
+    if tz_match:
+        tzinfo = _fixed_offset(tz_match.group(1))
+        cleaned_str = cleaned_str[:tz_match.start()].strip()
+    for fmt in _STRPTIME_FORMATS:
+        # マイクロ秒を含むフォーマットの場合、入力にマイクロ秒がなければエラーになるため調整
+        fmt_to_use = fmt
+        input_to_use = cleaned_str
+        if ".%f" in fmt and '.' not in cleaned_str:
+            fmt_to_use = fmt.replace(".%f", "")
+        elif ".%f" not in fmt and '.' in cleaned_str:
+            input_to_use = cleaned_str.split('.')[0]
+        try:
+            return datetime.strptime(input_to_use, fmt_to_use).replace(tzinfo=tzinfo)
+        except ValueError:
+            continue
+    return None
+
+def _normalize_datetime(dt, tz):
+    """aware な datetime を tz の naive に揃える"""
+    if dt.tzinfo is not None:
+        # Naive datetime は元々がローカルタイムであると仮定し、aware のみ変換する
+        dt = dt.astimezone(tz).replace(tzinfo=None)
+    return dt
+
+def _check_date_range(dt, source_repr):
+    """
+    有効範囲をチェックする。上限は呼び出し時点の現在時刻から求めるため、
+    常駐する監視デーモンでも起動後の日付を範囲外にしない(キャッシュの外で毎回判定する)
+    """
+    if not (MIN_ALLOWED_DATE <= dt <= datetime.now() + MAX_ALLOWED_DATE_MARGIN):
+        logger.debug("日付範囲外エラー: 処理後の日付 '%s' は許容範囲外です (元: '%s')。", dt, source_repr)
+        return False
+    return dt
+
+@functools.lru_cache(maxsize=DATETIME_CACHE_SIZE)
+def _parse_datetime_str(date_str, tz):
+    """
+    文字列のパース結果を (文字列, タイムゾーン) ごとにキャッシュする本体。datetime は不変なので結果を共有してよい。
+    範囲チェックは時刻に依存するためここでは行わず、naive な datetime かパース失敗の False を返す
+    """
+    # 前後のヌル文字・空白だけならそのまま固定パターンを試す
+    stripped = date_str.strip().strip('\x00').strip()
+    parsed_dt = _parse_fast(stripped)
+    if parsed_dt is None:
+        # 前処理: 不要な文字を除去してから再試行
+        cleaned = _INVALID_CHARS_RE.sub(' ', date_str).strip()
+        parsed_dt = _parse_fast(cleaned) or _parse_slow(cleaned)
+    if parsed_dt is None:
+        logger.debug("日付パース失敗: 入力 '%s' は既知のフォーマットに一致しませんでした。", date_str)
+        return False
+    return _normalize_datetime(parsed_dt, tz)
+
+def validate_and_parse_datetime(date_str, tz=None):
+    """
+    撮影日時の文字列(または datetime)を受け取り、正しい日付としてパースします。
+    タイムゾーン情報が含まれている場合は、tz(省略時は LOCAL_TIMEZONE)に合わせた後、tz情報を除去して返します。
+    形式は "YYYY:MM:DD HH:MM:SS" または "YYYY:MM:DD HH:MM:SS+09:00" のような形式を想定します。
+    成功時は naive な datetime、入力が空なら None、パース失敗・範囲外なら False を返します。
+    """
+    if tz is None:
+        tz = _get_timezone(LOCAL_TIMEZONE)
+    if isinstance(date_str, datetime):
+        # 文字列への変換と再パースを挟まずに直接正規化する
+        return _check_date_range(_normalize_datetime(date_str, tz), date_str)
+    # 空白やNoneの場合
+    if not date_str or not isinstance(date_str, str) or not date_str.strip() or "0000:00:00" in date_str:
+        return None
+    parsed_dt = _parse_datetime_str(date_str, tz)
+    if parsed_dt is False:
+        return False
+    return _check_date_range(parsed_dt, date_str)
+
+def parse_datetime_batch(values, tz=None):
+    """
+    日時候補のリストをまとめて正規化する。
+    戻り値は入力と同じ順序のリストで、各要素は validate_and_parse_datetime と同じ規則に従う。
+    同じ文字列が複数回含まれていても実際のパースは一度だけ行われる。
+    """
+    results = []
+    seen = {}
+    for value in values:
+        if isinstance(value, str):
+            if value not in seen:
+                seen[value] = validate_and_parse_datetime(value, tz)
+            results.append(seen[value])
+        else:
+            results.append(validate_and_parse_datetime(value, tz))
+    return results
+
+class TimezonePolicy:
+    """
+    ファイルごとのローカルタイムゾーンを決めるポリシー。実行ごとに一度だけ生成して各抽出処理に渡す。
+    優先順位: EXIF OffsetTimeOriginal > カメラ機種ごとの指定 > ソースフォルダーごとの指定 > 既定値
+    タイムゾーン名は生成時に一度だけ解決し、以降は tzinfo オブジェクトのみを扱う。
+    """
+    def __init__(self, default=LOCAL_TIMEZONE, camera_models=None, source_folders=None, use_exif_offset=True):
+        self.default_tz = _get_timezone(default)
+        self.use_exif_offset = use_exif_offset
+        # 機種名は大文字小文字・前後の空白を無視して照合する
+        self.camera_models = {
+            model.strip().lower(): _get_timezone(name) for model, name in (camera_models or {}).items()
+        }
+        # フォルダーは最長一致で照合するため、長い順に並べておく
+        folders = [
+            (os.path.normcase(os.path.abspath(folder)), _get_timezone(name))
+            for folder, name in (source_folders or {}).items()
         ]
-        # タイムゾーンらしき部分を除去してパースを試みる
-        cleaned_str = date_str.strip()
-        tz_match = re.search(r'([+\-]\d{2}:?\d{2}|Z)\s*$', cleaned_str)
-        if tz_match:
-            tz_match_found = tz_match.group(1)
-            cleaned_str = cleaned_str[:tz_match.start()].strip()
-        for fmt in formats_to_try:
+        self.source_folders = sorted(folders, key=lambda item: len(item[0]), reverse=True)
+
+    @classmethod
+    def from_config(cls, config_path):
+        """
+        JSON設定ファイルからポリシーを生成する。例:
+        {"default": "Asia/Tokyo", "camera_models": {"Canon EOS R5": "Europe/Berlin"},
+         "source_folders": {"/mnt/uploads/usa": "America/New_York"}, "use_exif_offset": true}
+        """
+        with open(config_path, encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(
+            default=config.get('default', LOCAL_TIMEZONE),
+            camera_models=config.get('camera_models'),
+            source_folders=config.get('source_folders'),
+            use_exif_offset=config.get('use_exif_offset', True),
+        )
+
+    @classmethod
+    def load_default(cls):
+        """TIMEZONE_CONFIG_PATH があれば読み込み、なければ既定値のポリシーを返す"""
+        if os.path.exists(TIMEZONE_CONFIG_PATH):
+            try:
+                policy = cls.from_config(TIMEZONE_CONFIG_PATH)
+                logger.info("タイムゾーン設定を読み込みました: %s", TIMEZONE_CONFIG_PATH)
+                return policy
+            except (OSError, ValueError, pytz.UnknownTimeZoneError) as e:
+                logger.warning("タイムゾーン設定の読み込みに失敗しました (%s)。既定値 '%s' を使用します。", e, LOCAL_TIMEZONE)
+        return cls()
+
+    def resolve(self, file_path, camera_model=None, offset=None):
+        """ファイルパス・カメラ機種・EXIFのオフセット文字列から、そのファイルで使う tzinfo を返す"""
+        if offset and self.use_exif_offset:
+            offset = offset.strip()
+            if _TZ_OFFSET_RE.fullmatch(offset):
+                return _fixed_offset(offset)
+        if camera_model and self.camera_models:
+            tz = self.camera_models.get(camera_model.strip().lower())
+            if tz is not None:
+                return tz
+        if self.source_folders:
+            path = os.path.normcase(os.path.abspath(file_path))
+            for folder, tz in self.source_folders:
+                if path == folder or path.startswith(folder + os.sep):
+                    return tz
+        return self.default_tz
+
+@functools.lru_cache(maxsize=None)
+def default_timezone_policy():
+    """ポリシーが渡されなかった場合に使う既定のポリシー(プロセス内で一度だけ生成)"""
+    return TimezonePolicy.load_default()
+
+_EXT_CLASSES = {ext: EXT_CLASS_IMAGE for ext in IMAGE_EXTS}
+_EXT_CLASSES.update({ext: EXT_CLASS_VIDEO for ext in VIDEO_EXTS})
+_EXT_CLASSES.update({ext: EXT_CLASS_METADATA for ext in METADATA_EXTS})
+
+def ext_class(filename):
+    """ファイル名の拡張子から EXT_CLASS_* のいずれかを返す"""
+    return _EXT_CLASSES.get(os.path.splitext(filename)[1].lower(), EXT_CLASS_OTHER)
+
+class _ManifestChunk:
+    """FileManifest の最大 MANIFEST_CHUNK_SIZE 件分の列。ファイル名は UTF-8 などのバイト列を連結して持つ"""
+    __slots__ = ('dir_ids', 'name_ends', 'names', 'sizes', 'mtimes', 'classes')
+    _COLUMNS = ('dir_ids', 'name_ends', 'sizes', 'mtimes', 'classes')
+    _HEADER = struct.Struct('<QQ')
+
+    def __init__(self):
+        self.dir_ids = array.array('I')
+        self.name_ends = array.array('Q')
+        self.names = bytearray()
+        self.sizes = array.array('q')
+        self.mtimes = array.array('d')
+        self.classes = array.array('B')
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def name(self, index):
+        start = self.name_ends[index - 1] if index else 0
+        return os.fsdecode(bytes(self.names[start:self.name_ends[index]]))
+
+    def nbytes(self):
+        return len(self.names) + sum(len(getattr(self, c)) * getattr(self, c).itemsize for c in self._COLUMNS)
+
+    def to_bytes(self):
+        parts = [self._HEADER.pack(len(self), len(self.names))]
+        parts.extend(getattr(self, column).tobytes() for column in self._COLUMNS)
+        parts.append(bytes(self.names))
+        return b''.join(parts)
+
+    @classmethod
+    def from_file(cls, f):
+        chunk = cls()
+        count, names_size = cls._HEADER.unpack(f.read(cls._HEADER.size))
+        for column in cls._COLUMNS:
+            getattr(chunk, column).fromfile(f, count)
+        chunk.names = bytearray(f.read(names_size))
+        return chunk
+
+class FileManifest:
+    """
+    走査したファイルの一覧をコンパクトに保持する。
+    ディレクトリは一度だけ dirs に登録(インターン)し、ファイルごとにはディレクトリ番号・ファイル名のバイト列・
+    サイズ・更新日時・拡張子の分類を array の列として持つため、パスの文字列やファイルごとのオブジェクトを作らない
+    (数百万件でも1件あたり数十バイト)。spill_after 件を超えた分は一時ファイルに書き出し、読み出すときに戻す。
+    記録しない分類のファイルも class_counts には数える(count_media_files 用)。
+    """
+    def __init__(self, spill_after=None):
+        if spill_after is None:
             try:
-                # マイクロ秒を含むフォーマットの場合、入力にマイクロ秒がなければエラーになるため調整 
-                fmt_to_use = fmt
-                input_to_use = cleaned_str
-                if ".%f" in fmt and '.' not in cleaned_str:
-                    # フォーマットから.%fを除去
-                    fmt_to_use = fmt.replace(".%f", "")
-                elif ".%f" not in fmt and '.' in cleaned_str:
-                    # 入力から.%f以降を除去
-                    input_to_use = cleaned_str.split('.')[0]
-                temp_dt = datetime.strptime(input_to_use, fmt_to_use)
-                parsed_dt = temp_dt
-                break # パース成功
+                spill_after = int(os.environ.get(MANIFEST_SPILL_ENV, '0'))
             except ValueError:
-                continue
-    if not parsed_dt:
-        print(f"日付パース失敗: 入力 '{date_str}' は既知のフォーマットに一致しませんでした。")
-        return False
-    # 3. タイムゾーン処理(Asia/Tokyo基準のnaive datetimeにする)
-    try:
-        tokyo_tz = pytz.timezone('Asia/Tokyo')
-        dt_final_naive = None
-        if original_tzinfo: # fromisoformatでタイムゾーンが取得できた場合
-            dt_aware = parsed_dt # すでにaware
-            dt_tokyo = dt_aware.astimezone(tokyo_tz)
-            dt_final_naive = dt_tokyo.replace(tzinfo=None)
-        elif tz_match_found: # strptimeでパースし、タイムゾーンらしき文字列が見つかった場合
-            tz_str = tz_match_found
-            fixed_tz = None
+                logger.warning("%s の値が不正です: %s", MANIFEST_SPILL_ENV, os.environ.get(MANIFEST_SPILL_ENV))
+                spill_after = 0
+        self.spill_after = spill_after
+        self.dirs = []
+        self._dir_ids = {}
+        self.class_counts = [0, 0, 0, 0]
+        self._chunks = []          # メモリ上のまとまり
+        self._spill = None         # 書き出したまとまり(一時ファイル)
+        self._spill_offsets = []
+        self._spill_lock = threading.Lock()
+        self._current = _ManifestChunk()
+        self._count = 0
+
+    @classmethod
+    def from_paths(cls, paths, spill_after=None):
+        """パスのリストから作る(サイズと更新日時はここで stat する)"""
+        manifest = cls(spill_after)
+        for path in paths:
+            dirpath, filename = os.path.split(path)
             try:
-                if tz_str == 'Z':
-                    fixed_tz = pytz.utc
-                elif ':' in tz_str:
-                    fixed_tz = pytz.FixedOffset(int(tz_str[-5:-3])*60 + int(tz_str[-2:]) * (1 if tz_str.startswith('+') else -1))
-                elif len(tz_str) == 5: # +HHMM
-                    fixed_tz = pytz.FixedOffset(int(tz_str[1:3])*60 + int(tz_str[3:5]) * (1 if tz_str.startswith('+') else -1))
-                if fixed_tz:
-                    aware_dt = fixed_tz.localize(parsed_dt) # naiveをawareに
-                    dt_tokyo = aware_dt.astimezone(tokyo_tz)
-                    dt_final_naive = dt_tokyo.replace(tzinfo=None)
-                else: # オフセットが不明な場合はローカルタイムと仮定
-                    aware_dt = tokyo_tz.localize(parsed_dt, is_dst=None)
-                    dt_final_naive = aware_dt.replace(tzinfo=None) # 既に東京時間なのでtzinfo除去のみ
-            except Exception as tz_err:
-                print(f"警告: タイムゾーン '{tz_str}' の処理中にエラー({tz_err})。ローカルタイムと仮定します。")
-                aware_dt = tokyo_tz.localize(parsed_dt, is_dst=None)
-                dt_final_naive = aware_dt.replace(tzinfo=None)
+                st = os.stat(path)
+                size, mtime = st.st_size, st.st_mtime
+            except OSError:
+                size, mtime = -1, 0.0
+            manifest.add(manifest.add_dir(dirpath), filename, size, mtime, ext_class(filename))
+        return manifest
+
+    def __len__(self):
+        return self._count
+
+    def add_dir(self, dirpath):
+        """ディレクトリを登録して番号を返す(登録済みなら同じ番号)"""
+        dir_id = self._dir_ids.get(dirpath)
+        if dir_id is None:
+            dir_id = self._dir_ids[dirpath] = len(self.dirs)
+            self.dirs.append(dirpath)
+        return dir_id
+
+    def add(self, dir_id, filename, size, mtime, file_class):
+        """ファイルを1件記録する。size が不明な場合は -1"""
+        chunk = self._current
+        chunk.dir_ids.append(dir_id)
+        chunk.names += os.fsencode(filename)
+        chunk.name_ends.append(len(chunk.names))
+        chunk.sizes.append(size)
+        chunk.mtimes.append(mtime)
+        chunk.classes.append(file_class)
+        self.class_counts[file_class] += 1
+        self._count += 1
+        if len(chunk) >= MANIFEST_CHUNK_SIZE:
+            self._seal()
+
+    def count_only(self, file_class):
+        """記録せずに件数だけ数える"""
+        self.class_counts[file_class] += 1
+
+    def _seal(self):
+        chunk, self._current = self._current, _ManifestChunk()
+        if self.spill_after and (self._spill is not None or self._count > self.spill_after):
+            with self._spill_lock:
+                if self._spill is None:
+                    self._spill = tempfile.TemporaryFile(prefix='image-organizer-manifest-')
+                    logger.info("走査結果が %d 件を超えたため、一時ファイルに書き出します。", self.spill_after)
+                self._spill.seek(0, os.SEEK_END)
+                self._spill_offsets.append(self._spill.tell())
+                self._spill.write(chunk.to_bytes())
         else:
-            # Naive datetime は元々がAsia/Tokyoであると仮定
-            try:
-                aware_dt = tokyo_tz.localize(parsed_dt, is_dst=None)
-                dt_final_naive = aware_dt.replace(tzinfo=None) # tzinfo除去
-            except (pytz.AmbiguousTimeError, pytz.NonExistentTimeError) as e:
-                print(f"警告: ローカル時刻 '{parsed_dt}' のタイムゾーン割り当て時に問題 ({e})。そのまま naive な時刻を使用します。")
-                dt_final_naive = parsed_dt # naiveのまま使用
-        # 4. 有効範囲チェック
-        min_allowed_date = datetime(1970, 1, 1)
-        max_allowed_date = datetime.now() + timedelta(days=365) # 1年先まで許容
-        if not (min_allowed_date <= dt_final_naive <= max_allowed_date):
-            print(f"日付範囲外エラー: 処理後の日付 '{dt_final_naive}' は許容範囲外です (元: '{date_str}')。")
-            return False
-        return dt_final_naive # 成功時は naive な datetime オブジェクトを返す
-    except pytz.UnknownTimeZoneError:
-        print("タイムゾーン 'Asia/Tokyo' がみつかりません。pytzを確認してください。")
-        return False
-    except Exception as e:
-        print(f"タイムゾーン処理/日付処理中に予期せぬエラー: {e} (入力: '{date_str}', パース結果: {parsed_dt})")
-        return False
-    
+            self._chunks.append(chunk)
 
-def count_media_files(source_folder):
-    """メディアファイルの数をカウント"""
-    image_count = 0
-    video_count = 0
-    metadata_count = 0
-    other_count = 0
-    for dirpath, _, filenames in os.walk(source_folder):
-        for filename in filenames:
-            ext = os.path.splitext(filename)[1].lower()
-            if ext in IMAGE_EXTS:
-                image_count += 1
-            elif ext in VIDEO_EXTS:
-                video_count += 1
-            elif ext in METADATA_EXTS:
-                metadata_count += 1
-            else:
-                other_count += 1 # 対象外ファイルもカウント
-    return image_count, video_count, metadata_count, other_count
+    def _iter_chunks(self):
+        yield from self._chunks
+        for offset in self._spill_offsets:
+            # 複数の読み出しが交互に進んでもよいよう、まとまりごとに位置を指定して読む
+            with self._spill_lock:
+                self._spill.seek(offset)
+                chunk = _ManifestChunk.from_file(self._spill)
+            yield chunk
+        yield self._current
+
+    def entries(self):
+        """(パス, サイズ, 更新日時, 分類) を記録した順に返す"""
+        dirs = self.dirs
+        for chunk in self._iter_chunks():
+            for i in range(len(chunk)):
+                yield (os.path.join(dirs[chunk.dir_ids[i]], chunk.name(i)),
+                       chunk.sizes[i], chunk.mtimes[i], chunk.classes[i])
+
+    def paths(self):
+        for path, _, _, _ in self.entries():
+            yield path
+
+    def sizes(self):
+        for chunk in self._iter_chunks():
+            yield from chunk.sizes
+
+    def size_chunks(self):
+        """サイズの列をまとまりごとの array で返す"""
+        for chunk in self._iter_chunks():
+            yield chunk.sizes
+
+    def nbytes(self):
+        """メモリ上の列の大きさ(バイト、ディレクトリ表を除く)の概算"""
+        return sum(chunk.nbytes() for chunk in self._chunks) + self._current.nbytes()
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+            self._spill_offsets = []
+
+@stage_metrics.timed('scan')
+def scan_source_files(source_folder, classes=(EXT_CLASS_IMAGE, EXT_CLASS_VIDEO), spill_after=None):
+    """
+    source_folder 以下を os.scandir でたどり、classes に含まれる分類のファイルをサイズ・更新日時とともに
+    FileManifest に記録する(それ以外は件数のみ)。順序は os.walk と同じく、各フォルダーのファイルの後にサブフォルダー。
+    シンボリックリンクのフォルダーはたどらない。
+    """
+    manifest = FileManifest(spill_after)
+    stack = [source_folder]
+    while stack:
+        dirpath = stack.pop()
+        subdirs = []
+        dir_id = None
+        try:
+            with os.scandir(dirpath) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                subdirs.append(entry.path)
+                            continue
+                    except OSError:
+                        pass
+                    file_class = ext_class(entry.name)
+                    if file_class not in classes:
+                        manifest.count_only(file_class)
+                        continue
+                    try:
+                        st = entry.stat()
+                        size, mtime = st.st_size, st.st_mtime
+                    except OSError:
+                        size, mtime = -1, 0.0
+                    if dir_id is None:
+                        dir_id = manifest.add_dir(dirpath)
+                    manifest.add(dir_id, entry.name, size, mtime, file_class)
+        except OSError as e:
+            logger.warning("フォルダーを読み込めません: %s (%s)", dirpath, e)
+        stack.extend(reversed(subdirs))
+    return manifest
+
+def count_media_files(source_folder, manifest=None):
+    """メディアファイルの数をカウント(manifest が渡された場合は走査し直さない)"""
+    if manifest is None:
+        manifest = scan_source_files(source_folder, classes=())
+    counts = manifest.class_counts
+    # 対象外ファイルもカウント
+    return counts[EXT_CLASS_IMAGE], counts[EXT_CLASS_VIDEO], counts[EXT_CLASS_METADATA], counts[EXT_CLASS_OTHER]
 
 def thread_count():
     """環境に応じた最適なスレッド数を返す"""
-    cpu_count = multiprocessing.cpu_count()
+    cpu_count = os.cpu_count() or 1
     if platform.system() == 'Darwin':
         # is_apple_silicon = platform.processor() == 'arm' or platform.machine().startswith('arm') # より確実な判定
         # Apple Silicon の判定を修正 (processor()は空を返すことがあるためmachine()を見る)
@@ -598,141 +1948,858 @@ def thread_count():
         if is_apple_silicon:
             # 性能コア優先で少し多めに (最大16程度)
             optimal_threads = max(4, min(int(cpu_count * 0.5), 16))
-            print(f"Apple Silicon検出: スレッド数 = {optimal_threads}")
+            logger.info("Apple Silicon検出: スレッド数 = %d", optimal_threads)
             return optimal_threads
         else: # Intel Mac
             optimal_threads = max(4, min(cpu_count * 2, 16))
-            print(f"Intel Mac検出: スレッド数 = {optimal_threads}")
+            logger.info("Intel Mac検出: スレッド数 = %d", optimal_threads)
             return optimal_threads
     else: # Windows, Linuxなど
         optimal_threads = max(4, min(cpu_count * 2, 16))
-        print(f"{platform.system()}検出: スレッド数 = {optimal_threads}")
+        logger.info("%s検出: スレッド数 = %d", platform.system(), optimal_threads)
         return optimal_threads
 
+def move_related_files(file_path, dest_dir, new_basename):
+    """動画に付随する .thm / .xml ファイルを、動画と同じ新しいベース名で dest_dir に移動する"""
+    original_basename_no_ext = os.path.splitext(os.path.basename(file_path))[0]
+    original_dir = os.path.dirname(file_path)
+    # .thm ファイル (元のファイル名.thm / 大文字の .THM)
+    for thm_ext in (".thm", ".THM"):
+        thm_filename = original_basename_no_ext + thm_ext
+        thm_path = os.path.join(original_dir, thm_filename)
+        if os.path.exists(thm_path):
+            # .thm の移動結果はメインの結果に含めない（個別にカウントしない）
+            thm_res = move_and_rename(thm_path, dest_dir, new_basename)
+            if thm_res == "failed":
+                logger.warning("警告: 関連THM %s の移動失敗", thm_filename)
+            break
+    # .xml ファイル (命名規則を複数試す)
+    # core + suffix + M01.xml, core + M01 + suffix + .xml, basename.xml など
+    m = re.match(r'^(.*?)(\s*\(_?\d+\))?$', original_basename_no_ext) # _1 や (1) に対応
+    core = original_basename_no_ext
+    suffix = ''
+    if m:
+        core = m.group(1)
+        suffix = m.group(2) or ''
+    xml_patterns = [
+        f"{core}{suffix}M01.xml", # MyVideo (1)M01.xml
+        f"{core}M01{suffix}.xml", # C0029M01 (1).xml
+        f"{original_basename_no_ext}.xml", # MyVideo (1).xml
+        f"{original_basename_no_ext}.XML", # 大文字
+        f"{core}{suffix}M01.XML",
+        f"{core}M01{suffix}.XML",
+    ]
+    for pattern in xml_patterns:
+        potential_xml_path = os.path.join(original_dir, pattern)
+        if os.path.exists(potential_xml_path):
+            # .xml の移動結果もメインの結果に含めない
+            xml_res = move_and_rename(potential_xml_path, dest_dir, new_basename)
+            if xml_res == "failed":
+                logger.warning("警告: 関連XML %s の移動失敗", pattern)
+            break
+
+def move_media_with_sidecars(file_path, dest_dir, new_basename, moved_to=None, planned=None):
+    """
+    メディアファイルを移動/リネームし、移動または重複削除された動画であれば関連ファイルも移動する。
+    move_and_rename の結果("moved" / "duplicate" / "failed")を返す。moved_to は move_and_rename と同じ。
+    planned(choose_destination の結果)を渡すと、移動先を決め直さずにその通りに処理する。
+    同じ dest_dir に対する呼び出しは DestinationShards によって直列化される前提。
+    """
+    if planned is None:
+        res = move_and_rename(file_path, dest_dir, new_basename, moved_to)
+    else:
+        res = apply_destination(file_path, *planned, moved_to)
+    if res in ("moved", "duplicate") and os.path.splitext(file_path)[1].lower() in VIDEO_EXTS:
+        move_related_files(file_path, dest_dir, new_basename)
+    return res
+
+# --- 移動前の重複ファイルのまとめ ---
+def _partial_digest(file_path, size, block_size=SOURCE_DUP_BLOCK_SIZE):
+    """先頭と末尾の block_size バイトのハッシュ(ファイル全体が 2 ブロック以内ならファイル全体のハッシュと同じ意味になる)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        digest.update(f.read(block_size))
+        if size > block_size:
+            f.seek(max(size - block_size, block_size))
+            digest.update(f.read(block_size))
+    stage_metrics.add_bytes('dedup_read', min(size, 2 * block_size))
+    return digest.digest()
+
+def _full_digest(file_path, size):
+    with open(file_path, 'rb') as f:
+        digest = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).digest()
+    stage_metrics.add_bytes('dedup_read', size)
+    return digest
+
+def _split_by(paths, key_func):
+    """key_func の値ごとに paths を分け、2件以上ある組だけを元の順序のまま返す"""
+    groups = {}
+    for path in paths:
+        try:
+            key = key_func(path)
+        except OSError as e:
+            logger.debug("重複判定のための読み込みに失敗しました: %s (%s)", path, e)
+            continue
+        groups.setdefault(key, []).append(path)
+    return [group for group in groups.values() if len(group) > 1]
+
+@stage_metrics.timed('source_dedup')
+def find_source_duplicates(manifest, block_size=SOURCE_DUP_BLOCK_SIZE):
+    """
+    FileManifest の中で内容が同じファイルを探し、{代表のパス: [同じ内容の他のパス]} を返す(代表は記録順で最初のもの)。
+    まず走査時に記録したサイズで分け(同じサイズが2件以上ある場合だけパスを取り出す)、
+    同じサイズのものだけ先頭と末尾のブロックのハッシュで分け、
+    それでも同じで 2 ブロックより大きいものだけファイル全体のハッシュを取る。
+    """
+    # 2件以上あるサイズは、まとまりごとに並べ替えたサイズの array をマージして探す(全件分の int のリストは作らない)
+    sorted_chunks = [array.array('q', sorted(sizes)) for sizes in manifest.size_chunks()]
+    shared_sizes = set()
+    previous = None
+    for size in heapq.merge(*sorted_chunks):
+        if size == previous and size > 0:
+            shared_sizes.add(size)
+        previous = size
+    del sorted_chunks
+    by_size = {}
+    if shared_sizes:
+        for path, size, _, _ in manifest.entries():
+            if size in shared_sizes:
+                by_size.setdefault(size, []).append(path)
+    duplicates_of = {}
+    for size, paths in by_size.items():
+        for group in _split_by(paths, lambda p: _partial_digest(p, size, block_size)):
+            if size > 2 * block_size:
+                groups = _split_by(group, lambda p: _full_digest(p, size))
+            else:
+                groups = [group]
+            for same in groups:
+                duplicates_of[same[0]] = same[1:]
+    if duplicates_of:
+        logger.info("移動元で内容が同じファイルを %d 件見つけました(%d 組)。",
+                    sum(len(dups) for dups in duplicates_of.values()), len(duplicates_of))
+    return duplicates_of
+
+def group_source_duplicates(file_list, block_size=SOURCE_DUP_BLOCK_SIZE):
+    """
+    移動元の中で内容が同じファイルをまとめ、(代表のパス, [同じ内容の他のパス]) のリストを file_list の順で返す。
+    代表だけが日時の取得と移動を行い、他は代表の移動後に重複として削除される(resolve_source_duplicates)。
+    """
+    manifest = FileManifest.from_paths(file_list)
+    duplicates_of = find_source_duplicates(manifest, block_size)
+    grouped = set()
+    for dups in duplicates_of.values():
+        grouped.update(dups)
+    return [(path, duplicates_of.get(path, [])) for path in file_list if path not in grouped]
+
+def resolve_source_duplicates(duplicates, dest_dir, new_basename):
+    """
+    代表と同じ内容のファイルを削除し、動画であれば関連ファイルを代表と同じ名前で dest_dir に移動する。
+    代表の移動先と同じシャードで呼ばれる前提。各ファイルの結果("duplicate" / "failed")のリストを返す。
+    """
+    results = []
+    for path in duplicates:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            stage_metrics.add_bytes('duplicate_removed', size)
+            logger.debug("移動元の重複ファイルを削除しました: %s", path)
+        except OSError as e:
+            logger.error("移動元の重複ファイルの削除失敗: %s (%s)", path, e)
+            results.append("failed")
+            continue
+        if os.path.splitext(path)[1].lower() in VIDEO_EXTS:
+            move_related_files(path, dest_dir, new_basename)
+        results.append("duplicate")
+    return results
+
+def dest_shard_index(dest_dir, shard_count):
+    """移動先ディレクトリからシャード番号を求める(hash()と違いプロセスやホストが変わっても同じ値になる)"""
+    return zlib.crc32(os.path.normcase(dest_dir).encode('utf-8')) % shard_count
+
+class DestinationShards:
+    """
+    移動先ディレクトリのハッシュで移動処理を固定数のシャードに振り分け、シャードごとに1つのワーカーが順番に実行する。
+    同じディレクトリへの処理は必ず同じワーカーで直列化されるため、ファイル名の衝突判定にロックは要らない。
+    別のシャードに入った日付のディレクトリは互いに待たずに並行して処理される。
+    メモリ使用量はディレクトリ数ではなくシャード数で決まる。
+    """
+    def __init__(self, loop, executor, shard_count=DEST_SHARD_COUNT):
+        self.loop = loop
+        self.executor = executor
+        self.queues = [asyncio.Queue() for _ in range(shard_count)]
+        # シャードごとの待ち・実行中の件数。イベントループのスレッドだけが更新し、
+        # ProgressSnapshot.shard_depths として共有して進捗ウィンドウから読む
+        self.depths = [0] * shard_count
+        self.workers = [loop.create_task(self._worker(i)) for i in range(shard_count)]
+
+    async def _worker(self, index):
+        shard_queue = self.queues[index]
+        while True:
+            func, args, future = await shard_queue.get()
+            try:
+                if not future.cancelled():
+                    result = await self.loop.run_in_executor(self.executor, func, *args)
+                    if not future.cancelled():
+                        future.set_result(result)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            finally:
+                self.depths[index] -= 1
+                shard_queue.task_done()
+
+    def submit(self, dest_dir, func, *args):
+        """dest_dir を担当するシャードに func(*args) を積み、結果を受け取る Future を返す"""
+        future = self.loop.create_future()
+        index = dest_shard_index(dest_dir, len(self.queues))
+        self.depths[index] += 1
+        self.queues[index].put_nowait((func, args, future))
+        return future
+
+    async def close(self):
+        """積まれている処理をすべて終えてからワーカーを停止する"""
+        for q in self.queues:
+            await q.join()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+# --- 類似画像(再圧縮・縮小されたコピーなど)の検出 ---
+@stage_metrics.timed('dhash')
+def compute_dhash(file_path, hash_size=NEAR_DUP_HASH_SIZE):
+    """
+    画像の dHash(縮小したグレースケール画像で隣り合う画素の明暗を比べたビット列)を整数で返す。
+    JPEG は draft モードで縮小しながらデコードするため、全画素を展開するより大幅に軽い。
+    開けない形式(プラグインのない HEIC など)や壊れたファイルでは None を返す。
+    """
+    try:
+        with Image.open(file_path) as im:
+            im.draft('L', ((hash_size + 1) * 4, hash_size * 4))
+            small = im.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+            pixels = small.tobytes()
+    except Exception as e:
+        logger.debug("dHash の計算に失敗しました: %s (%s)", file_path, e)
+        return None
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+class BKTree:
+    """
+    ハミング距離による BK-tree。距離 d の範囲検索では、子への辺の距離が [d - r, d + r] の枝だけをたどるため
+    全件と比較せずに済む。ノードは [ハッシュ, 値, {距離: 子ノードの番号}] のリストで、そのままJSONに保存できる。
+    """
+    def __init__(self, nodes=None):
+        self.nodes = nodes or []
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add(self, hash_value, item):
+        if not self.nodes:
+            self.nodes.append([hash_value, item, {}])
+            return
+        index = 0
+        while True:
+            node = self.nodes[index]
+            distance = hamming_distance(hash_value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = len(self.nodes)
+                self.nodes.append([hash_value, item, {}])
+                return
+            index = child
+
+    def find(self, hash_value, max_distance):
+        """hash_value から max_distance 以内の (距離, ハッシュ, 値) を距離の小さい順に返す"""
+        if not self.nodes:
+            return []
+        matches = []
+        stack = [0]
+        while stack:
+            node = self.nodes[stack.pop()]
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                matches.append((distance, node[0], node[1]))
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda m: m[0])
+        return matches
+
+    def to_json(self):
+        return self.nodes
+
+    @classmethod
+    def from_json(cls, nodes):
+        # JSONのオブジェクトのキーは文字列になるため整数に戻す
+        return cls([[h, item, {int(k): v for k, v in children.items()}] for h, item, children in nodes])
+
+class NearDuplicateIndex:
+    """
+    移動先に整理済みの画像の dHash を BK-tree で保持し、類似画像を検索する。
+    索引は dest_root/.image_organizer/near_duplicates.json に保存され、次回以降の実行に引き継がれる。
+    移動の前に reserve で検索し、類似画像がなければ同じロックの中でハッシュを予約する。
+    移動が成功したら confirm で実際の移動先のパスで登録し、失敗・重複なら release で予約を取り消すため、
+    連番が付いたファイルや移動に失敗したファイルが誤ったパスで登録されることはなく、
+    同時に処理中の類似画像どうしも(予約と照合されるため)見逃さない。
+    ワーカースレッドから同時に呼ばれるため、索引の操作はロックの中で行う。
+    """
+    def __init__(self, dest_root, mode='report', max_distance=NEAR_DUP_MAX_DISTANCE):
+        if mode not in NEAR_DUP_MODES:
+            raise ValueError(f"不明な類似画像の検出モードです: {mode}")
+        self.dest_root = dest_root
+        self.mode = mode
+        self.max_distance = max_distance
+        self.state_dir = os.path.join(dest_root, ORGANIZER_STATE_DIR)
+        self.index_path = os.path.join(self.state_dir, 'near_duplicates.json')
+        self.report_path = os.path.join(self.state_dir, 'near_duplicates_report.json')
+        self.tree = BKTree()
+        self.matches = [] # 今回の実行で見つかった類似画像
+        self.reserved = {} # 予約番号 -> (ハッシュ, 移動元のパス)。移動中の画像で、同時に処理される件数分しかない
+        self._next_reservation = 0
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, dest_root, mode=None):
+        """mode(省略時は環境変数)が 'off' なら None を返す。それ以外は保存済みの索引を読み込んで返す"""
+        if mode is None:
+            mode = os.environ.get(NEAR_DUP_MODE_ENV, 'off').lower() or 'off'
+        if mode == 'off':
+            return None
+        index = cls(dest_root, mode)
+        index.load()
+        return index
+
+    def load(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("類似画像の索引を読み込めません。空の索引から始めます: %s (%s)", self.index_path, e)
+            return
+        if data.get("hash_size") != NEAR_DUP_HASH_SIZE:
+            logger.warning("類似画像の索引のハッシュ長が異なるため作り直します: %s", self.index_path)
+            return
+        self.tree = BKTree.from_json(data["nodes"])
+        logger.info("類似画像の索引を読み込みました: %d 件", len(self.tree))
+
+    def reserve(self, hash_value, file_path):
+        """
+        索引と移動中の予約から類似画像を検索する。見つかった場合は (None, 最も近いものの (距離, 既存のパス)) を返す。
+        予約と一致した場合の既存のパスは、移動中のファイルの移動元のパスになる。
+        見つからなければ同じロックの中でハッシュを予約し、(予約番号, None) を返す。
+        """
+        with self._lock:
+            found = [(distance, existing) for distance, _, existing in self.tree.find(hash_value, self.max_distance)]
+            for reserved_hash, reserved_path in self.reserved.values():
+                distance = hamming_distance(hash_value, reserved_hash)
+                if distance <= self.max_distance:
+                    found.append((distance, reserved_path))
+            if found:
+                return None, min(found, key=lambda m: m[0])
+            reservation = self._next_reservation
+            self._next_reservation += 1
+            self.reserved[reservation] = (hash_value, file_path)
+            return reservation, None
+
+    def report(self, file_path, match):
+        """類似画像として扱ったファイルを今回の報告に加える"""
+        distance, existing = match
+        with self._lock:
+            self.matches.append({"file": file_path, "match": existing, "distance": distance, "action": self.mode})
+
+    def confirm(self, reservation, library_path):
+        """予約した画像を移動先の library_path(dest_root からの相対パス)で索引に登録する"""
+        with self._lock:
+            hash_value, _ = self.reserved.pop(reservation)
+            self.tree.add(hash_value, library_path)
+            self.dirty = True
+
+    def release(self, reservation):
+        """移動しなかった画像の予約を取り消す"""
+        with self._lock:
+            self.reserved.pop(reservation, None)
+
+    def save(self):
+        """索引と今回の報告を書き出す"""
+        with self._lock:
+            if not self.dirty and not self.matches:
+                return
+            try:
+                os.makedirs(self.state_dir, exist_ok=True)
+                if self.dirty:
+                    _write_atomic(self.index_path, json.dumps(
+                        {"hash_size": NEAR_DUP_HASH_SIZE, "nodes": self.tree.to_json()}, ensure_ascii=False))
+                    self.dirty = False
+                if self.matches:
+                    _write_atomic(self.report_path, json.dumps(self.matches, ensure_ascii=False, indent=2))
+            except OSError as e:
+                logger.warning("類似画像の索引の保存に失敗しました: %s", e)
+
+def find_near_duplicate(near_dups, file_path, dest_root):
+    """
+    画像の dHash を計算して索引と照合し、(予約番号, 類似画像の (距離, 既存のパス)) を返す。
+    類似画像がなければハッシュを予約して (予約番号, None) を返す。呼び出し側は移動の結果に応じて
+    near_dups.confirm(実際の移動先)か near_dups.release を必ず呼ぶこと。
+    内容がまったく同じファイルは move_and_rename の重複判定に任せるため、類似画像として扱わない(予約もしない)。
+    """
+    hash_value = compute_dhash(file_path)
+    if hash_value is None:
+        return None, None
+    reservation, match = near_dups.reserve(hash_value, file_path)
+    if match is None:
+        return reservation, None
+    distance, existing = match
+    existing_path = os.path.join(dest_root, existing)
+    if distance == 0 and os.path.exists(existing_path):
+        try:
+            if filecmp.cmp(file_path, existing_path, shallow=False):
+                return None, None
+        except OSError:
+            pass
+    near_dups.report(file_path, match)
+    return None, match
+
+# --- 整理済みファイルのカタログ ---
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,      -- dest_root からの相対パス
+    taken_at TEXT NOT NULL,     -- 採用した撮影日時 'YYYY-MM-DD HH:MM:SS'
+    source TEXT,                -- 日時の取得元(pil / exiftool / mp4_header / riff_header / ebml_header / ffprobe / file_timestamp など)
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    camera_model TEXT,
+    kind TEXT NOT NULL,         -- image / video
+    original_path TEXT,
+    added_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_taken_at ON files (taken_at);
+CREATE INDEX IF NOT EXISTS files_source ON files (source, taken_at);
+"""
+
+@stage_metrics.timed('catalog_hash')
+def file_sha256(file_path):
+    with open(file_path, 'rb') as f:
+        digest = hashlib.file_digest(f, 'sha256').hexdigest()
+    stage_metrics.add_bytes('hashed', os.path.getsize(file_path))
+    return digest
+
+class LibraryCatalog:
+    """
+    移動したファイルごとに1行(パス・撮影日時・取得元・サイズ・ハッシュ・機種名)を記録する SQLite のカタログ。
+    dest_root/.image_organizer/catalog.sqlite に作られ、catalog.py で検索できる。
+    ワーカースレッドから呼ばれるため、行はロックの中でためておき CATALOG_FLUSH_ROWS 行ごとにまとめて書き込む。
+    """
+    def __init__(self, dest_root, hash_files=True):
+        self.dest_root = dest_root
+        self.hash_files = hash_files
+        self.path = os.path.join(dest_root, ORGANIZER_STATE_DIR, CATALOG_FILE_NAME)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.executescript(CATALOG_SCHEMA)
+        self.pending = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, dest_root):
+        """環境変数でカタログが無効にされていれば None、そうでなければカタログを開いて返す"""
+        if os.environ.get(CATALOG_ENV, '1').lower() in ('0', 'false', 'no'):
+            return None
+        hash_files = os.environ.get(CATALOG_HASH_ENV, '1').lower() not in ('0', 'false', 'no')
+        try:
+            return cls(dest_root, hash_files)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("カタログを開けません。カタログへの記録なしで続行します: %s", e)
+            return None
+
+    def record(self, dest_path, trace, original_path):
+        """移動したファイル dest_path の行を追加する(ハッシュの計算を含むため、ワーカースレッドで呼ぶ)"""
+        try:
+            size = os.path.getsize(dest_path)
+            digest = file_sha256(dest_path) if self.hash_files else None
+        except OSError as e:
+            logger.warning("カタログ用の情報を取得できません: %s (%s)", dest_path, e)
+            return
+        taken_at = datetime.strptime(trace.chosen, '%Y_%m_%d_%H_%M_%S').isoformat(sep=' ')
+        kind = 'video' if os.path.splitext(dest_path)[1].lower() in VIDEO_EXTS else 'image'
+        row = (
+            os.path.relpath(dest_path, self.dest_root), taken_at, trace.source, size, digest,
+            trace.camera_model, kind, os.path.abspath(original_path), datetime.now().isoformat(sep=' ', timespec='seconds'),
+        )
+        with self._lock:
+            self.pending.append(row)
+            if len(self.pending) >= CATALOG_FLUSH_ROWS:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.pending:
+            return
+        try:
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", self.pending)
+        except sqlite3.Error as e:
+            logger.warning("カタログへの書き込みに失敗しました: %s", e)
+        self.pending = []
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self.conn.close()
+
+class ProgressSnapshot:
+    """
+    処理の進捗。値を書き換えるのはイベントループのスレッドだけで、GUIのスレッドは読むだけなので
+    ロックは使わない(個々の属性の読み書きはアトミックなため、表示用には十分)。
+    """
+    def __init__(self):
+        self.total_files = 0
+        self.processed = 0
+        self.moved = 0
+        self.duplicate = 0
+        self.failed = 0
+        self.skipped = 0
+        self.near_duplicate = 0 # 類似画像として報告・隔離したファイル数
+        self.pending = 0    # 未着手のファイル数
+        self.extracting = 0 # 日時取得中のファイル数
+        self.moving = 0     # 移動待ち・移動中のファイル数(シャードのキューにあるもの)
+        self.shard_depths = [] # シャードごとの待ち件数(DestinationShards.depths を共有する)
+        self.started_at = None
+        self.finished = False
+        self.cancelled = False
+
+    def start(self, total_files):
+        self.total_files = total_files
+        self.pending = total_files
+        self.started_at = time.monotonic()
+
+    def rates(self):
+        """(経過秒, ファイル/秒, MB/秒, 残り時間の見込み秒 or None) を返す"""
+        if self.started_at is None:
+            return 0.0, 0.0, 0.0, None
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        files_per_sec = self.processed / elapsed
+        byte_counts = stage_metrics.byte_counts
+        mb_per_sec = (byte_counts.get('moved', 0) + byte_counts.get('duplicate_removed', 0)) / (1024 * 1024) / elapsed
+        remaining = self.total_files - self.processed
+        eta = remaining / files_per_sec if files_per_sec > 0 else None
+        return elapsed, files_per_sec, mb_per_sec, eta
+
+    def shard_backlog(self):
+        """(最も待ちの多いシャードの件数, 処理待ちのあるシャード数, シャード数) を返す"""
+        depths = list(self.shard_depths)
+        return max(depths, default=0), sum(1 for d in depths if d), len(depths)
+
 # --- 非同期処理(async/await) ---
-async def async_process_file(file_path, dest_root, loop, executor):
+async def async_process_file(file_path, dest_root, loop, executor, tz_policy=None, shards=None, progress=None,
+                             near_dups=None, catalog=None):
+    """
+    1ファイルの日時を取得して dest_root 以下に移動する。
+    移動処理は shards(DestinationShards)の担当ワーカーで直列に実行する。
+    shards を省略した場合は直接実行するため、同じディレクトリへの同時呼び出しは避けること。
+    progress(ProgressSnapshot)を渡すと、日時取得中・移動待ちの件数を更新する。
+    near_dups(NearDuplicateIndex)を渡すと画像の類似画像を検索し、見つかれば報告する。
+    隔離モードでは撮影日のフォルダーではなく dest_root/_near_duplicates/ 以下に移動する。
+    戻り値の "near_duplicate" は類似画像として扱った場合に 1 になる。
+    catalog(LibraryCatalog)を渡すと、移動したファイルの行を記録する。
+    """
     ext = os.path.splitext(file_path)[1].lower()
     if ext not in IMAGE_EXTS and ext not in VIDEO_EXTS:
         return {"moved": 0, "duplicate": 0, "failed": 0}
+    progress = progress or ProgressSnapshot()
     # ブロッキングなget_file_dateもrun_in_executorで呼ぶ
-    date_str = await loop.run_in_executor(executor, get_file_date, file_path)
+    progress.extracting += 1
+    # カタログに取得元と機種名を記録するため、日時抽出の過程を残す
+    trace = DateTrace() if catalog is not None else None
+    try:
+        date_str = await loop.run_in_executor(executor, get_file_date, file_path, tz_policy, trace)
+    finally:
+        progress.extracting -= 1
     if not date_str:
-        print(f"日付情報なし: {file_path} をスキップします。")
+        logger.info("日付情報なし: %s をスキップします。", file_path)
         return {"moved": 0, "duplicate": 0, "failed": 0}
     dest_info = await loop.run_in_executor(executor, make_destination_path, dest_root, date_str)
     if not dest_info:
-        print(f"移動先ディレクトリ作成失敗: {file_path} をスキップします。")
+        logger.warning("移動先ディレクトリ作成失敗: %s をスキップします。", file_path)
         return {"moved": 0, "duplicate": 0, "failed": 0}
     dest_dir, new_basename = dest_info
-    # asyncio.Lockで同じディレクトリへの同時アクセスを防ぐ
-    async with dir_locks_lock:
-        dir_lock = dir_locks.setdefault(dest_dir, asyncio.Lock())
-    result_counts = {"moved": 0, "duplicate": 0, "failed": 0}
-    async with dir_lock:
-        # メインのメディアファイルを移動/リネーム
-        res = await loop.run_in_executor(executor, move_and_rename, file_path, dest_dir, new_basename)
-        if res in result_counts:
-            result_counts[res] += 1
+    result_counts = {"moved": 0, "duplicate": 0, "failed": 0, "near_duplicate": 0}
+    reservation = match = None
+    if near_dups is not None and ext in IMAGE_EXTS:
+        reservation, match = await loop.run_in_executor(executor, find_near_duplicate, near_dups, file_path, dest_root)
+        if match is not None:
+            distance, existing = match
+            result_counts["near_duplicate"] = 1
+            if near_dups.mode == 'quarantine':
+                dest_dir = os.path.join(dest_root, NEAR_DUP_QUARANTINE_DIR, os.path.relpath(dest_dir, dest_root))
+                await loop.run_in_executor(executor, functools.partial(os.makedirs, dest_dir, exist_ok=True))
+                logger.info("類似画像を隔離します: %s (既存: %s, 距離 %d)", file_path, existing, distance)
+            else:
+                logger.info("類似画像を検出しました: %s (既存: %s, 距離 %d)", file_path, existing, distance)
+    # メインのメディアファイルと関連ファイルを移動/リネーム
+    moved_to = []
+    res = None
+    progress.moving += 1
+    try:
+        if shards is not None:
+            res = await shards.submit(dest_dir, move_media_with_sidecars, file_path, dest_dir, new_basename, moved_to)
         else:
-            result_counts["failed"] += 1 # 不明な場合は失敗
-        # メインファイルが移動または重複削除された場合、関連ファイルを処理
-        if res == "moved" or res == "duplicate":
-            if ext in VIDEO_EXTS:
-                original_basename_no_ext = os.path.splitext(os.path.basename(file_path))[0]
-                original_dir = os.path.dirname(file_path)
-                # .thm ファイル (元のファイル名.thm)
-                thm_filename = original_basename_no_ext + ".thm"
-                thm_path = os.path.join(original_dir, thm_filename)
-                if os.path.exists(thm_path):
-                    # .thm の移動結果はメインの結果に含めない（個別にカウントしない）
-                    thm_res = await loop.run_in_executor(executor, move_and_rename, thm_path, dest_dir, new_basename)
-                    if thm_res == "failed":
-                        print(f"警告: 関連THM {thm_filename} の移動失敗")
-                # .xml ファイル (命名規則を複数試す)
-                # core + suffix + M01.xml, core + M01 + suffix + .xml, basename.xml など 
-                m = re.match(r'^(.*?)(\s*\(_?\d+\))?$', original_basename_no_ext) # _1 や (1) に対応
-                core = original_basename_no_ext
-                suffix = ''
-                if m:
-                    core = m.group(1)
-                    suffix = m.group(2) or ''
-                xml_patterns = [
-                    f"{core}{suffix}M01.xml", # MyVideo (1)M01.xml
-                    f"{core}M01{suffix}.xml", # C0029M01 (1).xml
-                    f"{original_basename_no_ext}.xml", # MyVideo (1).xml
-                    f"{original_basename_no_ext}.XML", # 大文字
-                    f"{core}{suffix}M01.XML",
-                    f"{core}M01{suffix}.XML",
-                ]
-                found_xml_path = None
-                xml_filename_found = None
-                for pattern in xml_patterns:
-                    potential_xml_path = os.path.join(original_dir, pattern)
-                    if os.path.exists(potential_xml_path):
-                        found_xml_path = potential_xml_path
-                        xml_filename_found = pattern
-                        break
-                if found_xml_path:
-                    # .xml の移動結果もメインの結果に含めない
-                    xml_res = await loop.run_in_executor(executor, move_and_rename, found_xml_path, dest_dir, new_basename)
-                    if xml_res == "failed":
-                        print(f"警告: 関連XML {xml_filename_found} の移動失敗")
-
+            res = await loop.run_in_executor(
+                executor, move_media_with_sidecars, file_path, dest_dir, new_basename, moved_to)
+    finally:
+        progress.moving -= 1
+        if reservation is not None:
+            if res == "moved" and moved_to:
+                # 連番が付いた場合も含め、実際に移動した先のパスで類似画像の索引に登録する
+                near_dups.confirm(reservation, os.path.relpath(moved_to[0], dest_root))
+            else:
+                near_dups.release(reservation)
+    if catalog is not None and res == "moved" and moved_to:
+        await loop.run_in_executor(executor, catalog.record, moved_to[0], trace, file_path)
+    if res in ("moved", "duplicate"):
+        # 同じ内容のファイルを代表と同じ場所にまとめるため、移動先を返す
+        result_counts["dest"] = (dest_dir, new_basename)
+    if res in result_counts:
+        result_counts[res] += 1
+    else:
+        result_counts["failed"] += 1 # 不明な場合は失敗
     return result_counts
 
-async def async_main(source_folder, dest_root):
+async def async_process_group(file_path, duplicates, dest_root, loop, executor, tz_policy=None, shards=None,
+                              progress=None, near_dups=None, catalog=None):
+    """
+    find_source_duplicates / group_source_duplicates でまとめた1組を処理し、ファイルごとの結果の辞書のリスト(代表が先頭)を返す。
+    代表を async_process_file で処理し、移動(または移動先での重複削除)できた場合は、残りを日時の取得なしで
+    重複として削除する。代表がスキップ・失敗した場合は、残りを1件ずつ通常どおり処理する。
+    """
+    result = await async_process_file(
+        file_path, dest_root, loop, executor, tz_policy, shards, progress, near_dups, catalog)
+    results = [result]
+    if not duplicates:
+        return results
+    dest = result.get("dest")
+    if dest is None:
+        for path in duplicates:
+            results.append(await async_process_file(
+                path, dest_root, loop, executor, tz_policy, shards, progress, near_dups, catalog))
+        return results
+    dest_dir, new_basename = dest
+    if shards is not None:
+        statuses = await shards.submit(dest_dir, resolve_source_duplicates, duplicates, dest_dir, new_basename)
+    else:
+        statuses = await loop.run_in_executor(executor, resolve_source_duplicates, duplicates, dest_dir, new_basename)
+    for status in statuses:
+        counts = {"moved": 0, "duplicate": 0, "failed": 0, "near_duplicate": 0}
+        counts[status] += 1
+        results.append(counts)
+    return results
+
+async def process_file_groups(groups, num_workers, dest_root, loop, executor, tz_policy, shards, progress,
+                              near_dups=None, catalog=None, cancel_event=None):
+    """
+    (代表のパス, 重複のリスト) の組を num_workers 個のワーカーで順に async_process_group に渡し、
+    結果を progress(ProgressSnapshot)に加算する。組ごとにタスクを作らないため、組の数によらず
+    同時に処理する組は num_workers(通常はスレッド数 × IN_FLIGHT_PER_THREAD)までになる。
+    cancel_event(threading.Event / asyncio.Event)がセットされると新しい組を始めず、処理中の組の完了を待って戻る。
+    """
+    group_iter = iter(groups)
+
+    async def worker():
+        # 共有のイテレーターから1組ずつ取り出す(イベントループ上なので取り出しは競合しない)
+        for file_path, duplicates in group_iter:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            progress.pending -= 1 + len(duplicates)
+            try:
+                results = await async_process_group(
+                    file_path, duplicates, dest_root, loop, executor, tz_policy, shards, progress, near_dups, catalog)
+            except Exception:
+                logger.exception("処理中に予期せぬエラー: %s", file_path)
+                results = [{"moved": 0, "duplicate": 0, "failed": 1}] * (1 + len(duplicates))
+            for result in results:
+                progress.moved += result["moved"]
+                progress.duplicate += result["duplicate"]
+                progress.failed += result["failed"]
+                progress.near_duplicate += result.get("near_duplicate", 0)
+                # スキップされたファイル数 (日付なし or 移動先作成失敗)
+                if not (result["moved"] or result["duplicate"] or result["failed"]):
+                    progress.skipped += 1
+                progress.processed += 1
+                # コンソールに進捗を表示
+                if progress.processed % 10 == 0 or progress.processed == progress.total_files:
+                    deepest, busy, _ = progress.shard_backlog()
+                    logger.info("進捗: %d/%d ファイル処理完了 (移動待ちのシャード %d, 最大待ち %d)",
+                                progress.processed, progress.total_files, busy, deepest)
+
+    await asyncio.gather(*(worker() for _ in range(num_workers)))
+
+async def async_main(source_folder, dest_root, tz_policy=None, metrics_json=None, metrics_prom=None,
+                     progress=None, cancel_event=None, near_duplicates=None, manifest=None):
+    """
+    source_folder 内のメディアファイルを撮影日時ごとに dest_root へ整理する。
+    同時に処理するファイル数はスレッド数に応じて制限し、progress(ProgressSnapshot)に進捗を書き込む。
+    cancel_event(threading.Event)がセットされると新しいファイルの処理を始めず、
+    処理中のファイル(移動中のものを含む)を完了させてから戻る。
+    終了時に処理段階ごとの計測結果をログに出し、metrics_json / metrics_prom(省略時は環境変数)が
+    指定されていればJSON/Prometheus形式でも書き出す。
+    near_duplicates('off' / 'report' / 'quarantine'、省略時は環境変数)で類似画像の検出を有効にする。
+    移動したファイルは dest_root のカタログ(LibraryCatalog、環境変数で無効化可)に記録する。
+    移動元で内容が同じファイルは事前にまとめ、代表の1件だけ日時を取得して移動する(find_source_duplicates)。
+    manifest(scan_source_files の結果)が渡された場合は走査し直さずにそれを使う。manifest は終了時に閉じる。
+    """
+    stage_metrics.reset()
     loop = asyncio.get_running_loop()
+    progress = progress or ProgressSnapshot()
+    # タイムゾーンポリシーは実行ごとに一度だけ解決し、全ファイルの処理に渡す
+    if tz_policy is None:
+        tz_policy = TimezonePolicy.load_default()
     num_threads = thread_count()
     executor = ThreadPoolExecutor(max_workers=num_threads)
-    # 対象ファイルのパスをリストアップ(これは軽い処理なので同期でOK)
-    file_list = []
-    print("ファイルリスト作成中...")
-    for dirpath, _, filenames in os.walk(source_folder):
-        for filename in filenames:
-            ext = os.path.splitext(filename)[1].lower()
-            if ext in IMAGE_EXTS or ext in VIDEO_EXTS:
-                file_list.append(os.path.join(dirpath, filename))
-    print(f"{len(file_list)} 個のメディアファイルを検出しました。")
-    tasks = [async_process_file(file_path, dest_root, loop, executor) for file_path in file_list]
-    # 進捗表示
-    results = []
-    processed_count = 0
-    total_files = len(tasks)
-    print("ファイル処理を開始します...")
-    for future in asyncio.as_completed(tasks):
-        result = await future
-        results.append(result)
-        processed_count += 1
-        # コンソールに進捗を表示
-        if processed_count % 10 == 0 or processed_count == total_files:
-            print(f"進捗: {processed_count}/{total_files} ファイル処理完了")
-    total_moved = sum(r["moved"] for r in results)
-    total_duplicate = sum(r["duplicate"] for r in results)
-    total_failed = sum(r["failed"] for r in results)
-    # スキップされたファイル数 (日付なし or 移動先作成失敗)
-    total_skipped = total_files - (total_moved + total_duplicate + total_failed)
-    print("全ファイルの処理が完了しました。")
+    # 対象ファイルを走査する(パスの文字列のリストは作らず、FileManifest にまとめて持つ)
+    if manifest is None:
+        logger.info("ファイルリスト作成中...")
+        manifest = await loop.run_in_executor(executor, scan_source_files, source_folder)
+    total_files = len(manifest)
+    logger.info("%d 個のメディアファイルを検出しました。(走査結果 %.1f MB)", total_files, manifest.nbytes() / (1024 * 1024))
+    progress.start(total_files)
+    near_dups = NearDuplicateIndex.from_env(dest_root, near_duplicates)
+    catalog = LibraryCatalog.from_env(dest_root)
+    shards = DestinationShards(loop, executor)
+    progress.shard_depths = shards.depths
+    # 内容が同じファイルをまとめる(読み込みを伴うためスレッドで実行する)
+    duplicates_of = await loop.run_in_executor(executor, find_source_duplicates, manifest)
+    grouped = set()
+    for dups in duplicates_of.values():
+        grouped.update(dups)
+
+    def iter_groups():
+        for path in manifest.paths():
+            if path not in grouped:
+                yield path, duplicates_of.get(path, [])
+
+    logger.info("ファイル処理を開始します...")
+    # 1ファイルごとにタスクを作らず、一定数のワーカーで順に処理する
+    await process_file_groups(
+        iter_groups(), num_threads * IN_FLIGHT_PER_THREAD, dest_root, loop, executor, tz_policy, shards, progress,
+        near_dups, catalog, cancel_event)
+    await shards.close()
     executor.shutdown(wait=True) # Executorをシャットダウン
-    return total_moved, total_duplicate, total_failed, total_skipped, total_files
+    close_exiftool_workers()
+    if near_dups is not None:
+        near_dups.save()
+        logger.info("類似画像: %d 件 (%s)", progress.near_duplicate, near_dups.mode)
+    if catalog is not None:
+        catalog.close()
+    manifest.close()
+    progress.cancelled = cancel_event is not None and cancel_event.is_set()
+    progress.finished = True
+    if progress.cancelled:
+        logger.info("キャンセルされました。%d/%d ファイルを処理しました。", progress.processed, total_files)
+    else:
+        logger.info("全ファイルの処理が完了しました。")
+    stage_metrics.write_reports(metrics_json, metrics_prom)
+    return progress.moved, progress.duplicate, progress.failed, progress.skipped, total_files
 
-def gui_main():
-    # ロケール設定 (エラーハンドリング付き)
+def _format_duration(seconds):
+    if seconds is None:
+        return "--:--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+class ProgressWindow:
+    """処理の進捗(件数・速度・残り時間・各段階の待ち件数)を表示し、キャンセルを受け付けるウィンドウ"""
+    def __init__(self, root, progress, cancel_event):
+        self.root = root
+        self.progress = progress
+        self.cancel_event = cancel_event
+        root.title("画像・動画の整理")
+        root.resizable(False, False)
+        frame = ttk.Frame(root, padding=12)
+        frame.grid()
+        self.status_var = tk.StringVar(value="処理を開始しています...")
+        self.counts_var = tk.StringVar()
+        self.rate_var = tk.StringVar()
+        self.queue_var = tk.StringVar()
+        ttk.Label(frame, textvariable=self.status_var).grid(row=0, column=0, sticky="w")
+        self.bar = ttk.Progressbar(frame, length=420, mode="determinate")
+        self.bar.grid(row=1, column=0, pady=6)
+        ttk.Label(frame, textvariable=self.counts_var).grid(row=2, column=0, sticky="w")
+        ttk.Label(frame, textvariable=self.rate_var).grid(row=3, column=0, sticky="w")
+        ttk.Label(frame, textvariable=self.queue_var).grid(row=4, column=0, sticky="w")
+        self.cancel_button = ttk.Button(frame, text="キャンセル", command=self.cancel)
+        self.cancel_button.grid(row=5, column=0, pady=(8, 0), sticky="e")
+        # ウィンドウを閉じた場合もキャンセルとして扱い、移動途中のファイルは完了させる
+        root.protocol("WM_DELETE_WINDOW", self.cancel)
+        root.deiconify()
+
+    def cancel(self):
+        if not self.cancel_event.is_set():
+            logger.info("キャンセルが要求されました。処理中のファイルを完了させてから停止します。")
+            self.cancel_event.set()
+            self.cancel_button.state(["disabled"])
+
+    def refresh(self):
+        p = self.progress
+        elapsed, files_per_sec, mb_per_sec, eta = p.rates()
+        if self.cancel_event.is_set():
+            self.status_var.set("キャンセル中: 処理中のファイルを完了させています...")
+        else:
+            self.status_var.set(f"処理中: {p.processed}/{p.total_files} ファイル")
+        self.bar["maximum"] = max(p.total_files, 1)
+        self.bar["value"] = p.processed
+        self.counts_var.set(f"移動 {p.moved} / 重複 {p.duplicate} / スキップ {p.skipped} / 失敗 {p.failed}")
+        self.rate_var.set(
+            f"{files_per_sec:.1f} ファイル/秒  {mb_per_sec:.1f} MB/秒  "
+            f"経過 {_format_duration(elapsed)}  残り {_format_duration(eta)}"
+        )
+        deepest, busy, shard_count = p.shard_backlog()
+        self.queue_var.set(
+            f"未着手 {p.pending} / 日時取得中 {p.extracting} / 移動待ち {p.moving}  "
+            f"(シャード {busy}/{shard_count} 稼働, 最大待ち {deepest})"
+        )
+
+def setup_locale():
+    """
+    ロケールを設定する。まずユーザーの既定ロケールを使い、それが日本語でなければ
+    実行中のOSで有効な日本語ロケール名だけを試す(存在しない名前を順に試す時間を省くため)。
+    """
     try:
-        # Windowsの場合は 'ja-JP' や 'japanese' も試す
-        locales_to_try = ['ja_JP.UTF-8', 'ja_JP.utf8', 'Japanese_Japan.932', 'ja-JP', 'japanese', '']
-        set_locale = False
+        current = locale.setlocale(locale.LC_ALL, '')
+        if current.lower().startswith(('ja', 'japanese')):
+            logger.debug("ロケールを '%s' に設定しました。", current)
+            return
+        # Windowsの場合は 'Japanese_Japan.932' や 'japanese' を試す
+        if sys.platform == 'win32':
+            locales_to_try = ['Japanese_Japan.932', 'japanese']
+        else:
+            locales_to_try = ['ja_JP.UTF-8', 'ja_JP.utf8']
         for loc in locales_to_try:
             try:
                 locale.setlocale(locale.LC_ALL, loc)
-                print(f"ロケールを '{loc}' に設定しました。")
-                set_locale = True
-                break
+                logger.debug("ロケールを '%s' に設定しました。", loc)
+                return
             except locale.Error:
                 continue
-        if not set_locale:
-            print("警告: 日本語ロケールの設定に失敗しました。デフォルトロケールを使用します。")
+        logger.debug("日本語ロケールが見つからないため、既定ロケール '%s' を使用します。", current)
     except Exception as e:
-         print(f"ロケール設定中に予期せぬエラー: {e}")
+        logger.warning("ロケール設定中に予期せぬエラー: %s", e)
+
+def gui_main():
+    # ロケール設定 (エラーハンドリング付き)
+    setup_locale()
     # Tkinterのルートウィンドウを作成（表示はしない）
     root = tk.Tk()
     root.withdraw()
@@ -749,9 +2816,10 @@ def gui_main():
         messagebox.showerror("エラー", "移動先フォルダーが選択されませんでした。")
         return
     
-    print("処理対象のファイル数をカウントしています...")
-    # メディアファイル数のカウント
-    image_count, video_count, metadata_count, other_count = count_media_files(source_folder)
+    logger.info("処理対象のファイル数をカウントしています...")
+    # メディアファイル数のカウント(走査結果はそのまま整理処理に渡す)
+    manifest = scan_source_files(source_folder)
+    image_count, video_count, metadata_count, other_count = count_media_files(source_folder, manifest)
     total_media_files = image_count + video_count
 
     count_message = (
@@ -766,21 +2834,56 @@ def gui_main():
         f"【対象外ファイル（移動されません）】\n"
         f"  その他: {other_count} 個"
     )
-    print(count_message) # コンソールにも表示
+    logger.info("%s", count_message) # コンソールにも表示
 
     if not messagebox.askyesno("処理内容の確認", f"{count_message}\n\nこれらのメディアファイル ({total_media_files}個) を撮影日時に基づいて\n「{dest_root}」\nに整理しますか？"):
-        print("処理はキャンセルされました。")
+        logger.info("処理はキャンセルされました。")
+        manifest.close()
         return
     # --- 非同期処理の実行 ---
-    print("非同期処理を実行します...")
+    logger.info("非同期処理を実行します...")
     # asyncio.run() は Windows で SelectorEventLoop を使う
     # ProactorEventLoop が必要な場合がある (特に subprocess 関連)
     if platform.system() == "Windows":
         asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-    total_moved, total_duplicate, total_failed, total_skipped, total_processed = asyncio.run(async_main(source_folder, dest_root))
+    # 処理は別スレッドのイベントループで実行し、GUIのスレッドは進捗の表示だけを行う
+    progress = ProgressSnapshot()
+    cancel_event = threading.Event()
+    outcome = {}
+
+    def run_pipeline():
+        try:
+            outcome["result"] = asyncio.run(
+                async_main(source_folder, dest_root, progress=progress, cancel_event=cancel_event, manifest=manifest)
+            )
+        except Exception as e:
+            logger.exception("処理中に予期せぬエラーが発生しました")
+            outcome["error"] = e
+
+    window = ProgressWindow(root, progress, cancel_event)
+    pipeline_thread = threading.Thread(target=run_pipeline, name="organizer-pipeline")
+    pipeline_thread.start()
+
+    def poll():
+        window.refresh()
+        if pipeline_thread.is_alive():
+            root.after(PROGRESS_POLL_MS, poll)
+        else:
+            root.quit()
+
+    root.after(PROGRESS_POLL_MS, poll)
+    root.mainloop()
+    pipeline_thread.join()
+    root.withdraw()
+
+    if "error" in outcome:
+        messagebox.showerror("エラー", f"処理中にエラーが発生しました: {outcome['error']}")
+        return
+    total_moved, total_duplicate, total_failed, total_skipped, total_processed = outcome["result"]
 
     # --- 結果表示 ---
+    not_started = total_processed - progress.processed
     summary = (
         f"【処理結果】\n"
         f"  処理対象ファイル数: {total_processed} 件\n"
@@ -789,11 +2892,13 @@ def gui_main():
         f"  重複ファイル(削除): {total_duplicate} 件\n"
         f"  スキップ(日付なし等): {total_skipped} 件\n"
         f"  移動失敗: {total_failed} 件\n"
-        f"--------------------\n"
+        + (f"  類似画像(報告・隔離): {progress.near_duplicate} 件\n" if progress.near_duplicate else "")
+        + (f"  未処理(キャンセル): {not_started} 件\n" if progress.cancelled else "")
+        + f"--------------------\n"
         f"  (成功 + 重複 + スキップ + 失敗 = {total_moved + total_duplicate + total_skipped + total_failed})"
     )
-    print(summary) # コンソールにも表示
-    messagebox.showinfo("処理完了", summary)
+    logger.info("%s", summary) # コンソールにも表示
+    messagebox.showinfo("処理中断" if progress.cancelled else "処理完了", summary)
 
 if __name__ == "__main__":
     # 必要に応じてExifToolのパスを指定
@@ -812,4 +2917,8 @@ if __name__ == "__main__":
     #         print("警告: ExifToolが見つからないか、実行できません。パスを確認してください。")
     #     except Exception as e:
     #         print(f"ExifToolのチェック中にエラー: {e}")
-    gui_main()
+    setup_logging()
+    try:
+        gui_main()
+    finally:
+        shutdown_logging()
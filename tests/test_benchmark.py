@@ -0,0 +1,60 @@
+import os
+
+import benchmark
+
+
+def _crash_child(name, corpus, repeat, result_queue):
+    # OOM で強制終了された場合と同じく、結果を返さずに終了する
+    os._exit(137)
+
+
+def _hang_child(name, corpus, repeat, result_queue):
+    import time
+    time.sleep(60)
+
+
+def _ok_child(name, corpus, repeat, result_queue):
+    result_queue.put((name, {"items": 1, "seconds": 0.1}, None))
+
+
+def test_crashed_child_is_reported_as_failure(tmp_path):
+    results, failures = benchmark.run_benchmarks(str(tmp_path), ["parse"], target=_crash_child)
+    assert results == {}
+    assert "137" in failures["parse"]
+
+
+def test_hung_child_times_out(tmp_path):
+    results, failures = benchmark.run_benchmarks(str(tmp_path), ["parse"], timeout=2, target=_hang_child)
+    assert results == {}
+    assert "parse" in failures
+
+
+def test_successful_child(tmp_path):
+    results, failures = benchmark.run_benchmarks(str(tmp_path), ["parse", "startup"], target=_ok_child)
+    assert set(results) == {"parse", "startup"} and failures == {}
+
+
+def test_parse_scenario_reports_uncached_and_cached(tmp_path):
+    result = benchmark.scenario_parse(str(tmp_path), 1)
+    assert result["items"] == 20000
+    assert result["seconds"] == result["uncached_seconds"]
+    # 2回目はすべてキャッシュに当たる
+    assert result["cached_seconds"] < result["uncached_seconds"]
+    assert "(cached)" in benchmark.format_results({"parse": {**result, "files_per_sec": 1.0, "stages": {}}})
+
+
+def test_uppercase_thm_sidecar_moves_with_video(tmp_path):
+    import asyncio
+
+    import main
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    created = benchmark.generate_corpus(str(source), count=3, mix={"mp4": 1}, depth=1)
+    assert created["mp4"] == 3
+    moved, duplicate, failed, skipped, total = asyncio.run(main.async_main(str(source), str(dest)))
+    assert (moved, failed) == (3, 0)
+    left = [name for _, _, names in os.walk(source) for name in names]
+    assert left == []
+    thm = [name for _, _, names in os.walk(dest) for name in names if name.endswith(".thm")]
+    assert len(thm) == 3
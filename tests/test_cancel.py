@@ -0,0 +1,60 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import benchmark
+import main
+
+
+def _files(root):
+    return sorted(os.path.relpath(os.path.join(d, n), root) for d, _, names in os.walk(root) for n in names)
+
+
+def test_cancel_drains_in_flight_moves(tmp_path, monkeypatch):
+    monkeypatch.setenv(main.CATALOG_ENV, "0")
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    source.mkdir()
+    dest.mkdir()
+    rng = random.Random(0)
+    for i in range(60):
+        benchmark._write_image(str(source / f"IMG_{i:04d}.jpg"), rng, "JPEG", datetime(2021, 1, 1) + timedelta(days=i))
+    cancel_event = threading.Event()
+    started = []
+    original = main.move_media_with_sidecars
+
+    def slow_move(file_path, *args):
+        # 最初の移動が始まった時点でキャンセルし、移動中のものが完了まで待たれることを確かめる
+        started.append(file_path)
+        cancel_event.set()
+        time.sleep(0.05)
+        return original(file_path, *args)
+
+    monkeypatch.setattr(main, "move_media_with_sidecars", slow_move)
+    progress = main.ProgressSnapshot()
+    moved, duplicate, failed, skipped, total = asyncio.run(
+        main.async_main(str(source), str(dest), progress=progress, cancel_event=cancel_event, near_duplicates="off"))
+    assert total == 60
+    assert progress.cancelled and progress.finished
+    # 始まった移動はすべて完了し、まだ始めていないファイルは移動元に残る
+    assert 1 <= moved == len(started) < total
+    assert failed == 0
+    assert progress.moving == 0
+    assert len(_files(dest)) == moved
+    assert len(_files(source)) == total - moved
+    assert not any(name.endswith(".tmp") for name in _files(dest))
+
+
+def test_progress_rates_and_eta():
+    progress = main.ProgressSnapshot()
+    assert progress.rates() == (0.0, 0.0, 0.0, None)
+    progress.start(100)
+    progress.started_at -= 10
+    progress.processed = 25
+    elapsed, files_per_sec, _, eta = progress.rates()
+    assert round(files_per_sec) == 2 and round(eta) == 30
+    assert main._format_duration(eta) == "0:00:30"
+    assert main._format_duration(None) == "--:--:--"
@@ -0,0 +1,58 @@
+import asyncio
+import random
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import benchmark
+import catalog
+import main
+
+TAKEN_AT = datetime(2021, 3, 4, 5, 6, 7)
+
+
+def test_video_rows_have_camera_model(tmp_path, monkeypatch):
+    monkeypatch.setenv(main.CATALOG_ENV, "1")
+    rng = random.Random(0)
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    source.mkdir()
+    dest.mkdir()
+    (source / "C0001.MP4").write_bytes(benchmark._mp4_bytes(TAKEN_AT, rng, model="ILCE-7M3"))
+    (source / "C0002.MP4").write_bytes(benchmark._mp4_bytes(TAKEN_AT, rng, moov_at_end=True, model="ILCE-7M3"))
+    (source / "DSCF0003.AVI").write_bytes(benchmark._avi_bytes(TAKEN_AT, rng, model="FinePix F30"))
+    benchmark._write_image(str(source / "IMG_0004.JPG"), rng, "JPEG", TAKEN_AT)
+    moved, *_ = asyncio.run(main.async_main(str(source), str(dest)))
+    assert moved == 4
+
+    conn = sqlite3.connect(catalog.catalog_path(str(dest)))
+    try:
+        where, params = catalog.build_filters("2021-03-01", "2021-03-31", camera="ilce-7m3", kind="video")
+        rows = list(catalog.query_files(conn, where, params))
+        assert len(rows) == 2
+        assert {row["source"] for row in rows} == {"mp4_header"}
+        where, params = catalog.build_filters(camera="FinePix F30", kind="video")
+        assert [row["source"] for row in catalog.query_files(conn, where, params)] == ["riff_header"]
+        counts = {key: count for key, count, _ in catalog.count_by(conn, "camera", "", [])}
+        assert counts == {"BenchCam": 1, "ILCE-7M3": 2, "FinePix F30": 1}
+    finally:
+        conn.close()
+
+
+def test_readonly_open_escapes_uri_characters(tmp_path):
+    dest = tmp_path / "photos ?#% 100%25"
+    path = catalog.catalog_path(str(dest))
+    (dest / main.ORGANIZER_STATE_DIR).mkdir(parents=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(main.CATALOG_SCHEMA)
+    conn.close()
+    conn = catalog.open_readonly(path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM files").fetchone() == (0,)
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            conn.execute("DELETE FROM files")
+    finally:
+        conn.close()
+    # 同じ名前の別ファイル(? 以降を切り捨てたパス)が作られていない
+    assert sorted(p.name for p in tmp_path.iterdir()) == [dest.name]
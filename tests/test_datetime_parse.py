@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import main
+
+TOKYO = main._get_timezone("Asia/Tokyo")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2021:03:04 05:06:07", datetime(2021, 3, 4, 5, 6, 7)),
+    ("2021-03-04T05:06:07", datetime(2021, 3, 4, 5, 6, 7)),
+    ("2021/03/04 05:06:07", datetime(2021, 3, 4, 5, 6, 7)),
+    ("2021:03:04 05:06:07.5", datetime(2021, 3, 4, 5, 6, 7, 500000)),
+    ("2021:03:04 05:06:07.123456789", datetime(2021, 3, 4, 5, 6, 7, 123456)),
+])
+def test_parse_fast_naive(text, expected):
+    assert main._parse_fast(text) == expected
+
+
+@pytest.mark.parametrize("text, minutes", [
+    ("2021:03:04 05:06:07Z", 0),
+    ("2021:03:04 05:06:07+09:00", 540),
+    ("2021:03:04 05:06:07+0930", 570),
+    # 符号は時と分の両方にかかる(以前は分だけが負になっていた)
+    ("2021:03:04 05:06:07-05:30", -330),
+    ("2021:03:04 05:06:07-0330", -210),
+])
+def test_parse_fast_offsets(text, minutes):
+    dt = main._parse_fast(text)
+    assert dt.utcoffset() == timedelta(minutes=minutes)
+    assert dt.replace(tzinfo=None) == datetime(2021, 3, 4, 5, 6, 7)
+
+
+def test_parse_fast_rejects_other_forms():
+    assert main._parse_fast("20210304 050607") is None
+    assert main._parse_fast("2021:13:04 05:06:07") is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("20210304 050607", datetime(2021, 3, 4, 5, 6, 7)),
+    ("2021-03-04 05:06:07.1234567", datetime(2021, 3, 4, 5, 6, 7, 123456)),
+    ("2021-03-04T05:06:07-0330", datetime(2021, 3, 4, 5, 6, 7, tzinfo=timezone(-timedelta(hours=3, minutes=30)))),
+])
+def test_parse_slow(text, expected):
+    assert main._parse_slow(text) == expected
+
+
+def test_parse_slow_unknown_format():
+    assert main._parse_slow("yesterday") is None
+
+
+def test_negative_offset_converted_to_local():
+    # 2021-03-04 05:06:07-05:30 は UTC 10:36:07、東京では 19:36:07
+    assert main.validate_and_parse_datetime("2021:03:04 05:06:07-05:30", TOKYO) == datetime(2021, 3, 4, 19, 36, 7)
+
+
+def test_microseconds_survive_conversion():
+    assert main.validate_and_parse_datetime("2021:03:04 05:06:07.250Z", TOKYO) == datetime(2021, 3, 4, 14, 6, 7, 250000)
+
+
+def test_batch_keeps_order_and_parses_each_string_once(monkeypatch):
+    main._parse_datetime_str.cache_clear()
+    calls = []
+    original = main._parse_fast
+    monkeypatch.setattr(main, "_parse_fast", lambda s: calls.append(s) or original(s))
+    values = ["2020:01:02 03:04:05", "", None, "garbage", "2020:01:02 03:04:05", datetime(2019, 5, 6, 7, 8, 9)]
+    assert main.parse_datetime_batch(values, TOKYO) == [
+        datetime(2020, 1, 2, 3, 4, 5), None, None, False, datetime(2020, 1, 2, 3, 4, 5), datetime(2019, 5, 6, 7, 8, 9),
+    ]
+    assert calls.count("2020:01:02 03:04:05") == 1
+
+
+def test_future_limit_follows_current_time(monkeypatch):
+    # 常駐プロセスでも上限は検証時点の現在時刻から決まる(キャッシュ済みの結果でも同じ)
+    main._parse_datetime_str.cache_clear()
+    text = "2030:01:01 00:00:00"
+
+    class FrozenDatetime(datetime):
+        current = datetime(2025, 1, 1)
+
+        @classmethod
+        def now(cls, tz=None):
+            return cls.current
+
+    monkeypatch.setattr(main, "datetime", FrozenDatetime)
+    assert main.validate_and_parse_datetime(text, TOKYO) is False
+    FrozenDatetime.current = datetime(2029, 6, 1)
+    assert main.validate_and_parse_datetime(text, TOKYO) == datetime(2030, 1, 1)
+
+
+def test_dates_before_1970_rejected():
+    assert main.validate_and_parse_datetime("1969:12:31 23:59:59", TOKYO) is False
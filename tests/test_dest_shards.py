@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+
+
+def _dirs_in_distinct_shards(count, shard_count=main.DEST_SHARD_COUNT):
+    dirs, seen = [], set()
+    day = 1
+    while len(dirs) < count:
+        dest_dir = f"/library/2024/2024_01/2024_01_{day:02d}"
+        index = main.dest_shard_index(dest_dir, shard_count)
+        if index not in seen:
+            seen.add(index)
+            dirs.append(dest_dir)
+        day += 1
+    return dirs
+
+
+def test_shard_index_is_stable():
+    # プロセスやホストが変わっても同じシャードになる(hash() のランダム化の影響を受けない)
+    dest_dir = "/library/2024/2024_01/2024_01_02"
+    assert main.dest_shard_index(dest_dir, 32) == zlib.crc32(dest_dir.encode("utf-8")) % 32
+
+
+def test_same_directory_runs_in_submit_order_one_at_a_time():
+    order = []
+    active = []
+    lock = threading.Lock()
+
+    def work(n):
+        with lock:
+            active.append(n)
+            overlap = len(active)
+        time.sleep(0.002)
+        with lock:
+            active.remove(n)
+            order.append(n)
+        return overlap
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            shards = main.DestinationShards(loop, executor)
+            futures = [shards.submit("/library/2024/2024_05/2024_05_05", work, n) for n in range(30)]
+            overlaps = await asyncio.gather(*futures)
+            await shards.close()
+        return overlaps
+
+    overlaps = asyncio.run(run())
+    assert order == list(range(30))
+    assert set(overlaps) == {1}
+
+
+def test_different_shards_run_in_parallel_and_depths_drain():
+    barrier = threading.Barrier(4, timeout=5)
+    dirs = _dirs_in_distinct_shards(4)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            shards = main.DestinationShards(loop, executor)
+            progress = main.ProgressSnapshot()
+            progress.shard_depths = shards.depths
+            # 4つのシャードが同時に動いていなければ Barrier がタイムアウトする
+            futures = [shards.submit(d, barrier.wait) for d in dirs]
+            futures += [shards.submit(dirs[0], lambda: None) for _ in range(3)]
+            assert progress.shard_backlog() == (4, 4, main.DEST_SHARD_COUNT)
+            await asyncio.gather(*futures)
+            await shards.close()
+            return progress.shard_backlog()
+
+    assert asyncio.run(run()) == (0, 0, main.DEST_SHARD_COUNT)
+
+
+def test_exception_is_delivered_to_caller():
+    def fail():
+        raise OSError("disk full")
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            shards = main.DestinationShards(loop, executor)
+            try:
+                await shards.submit("/library/x", fail)
+            except OSError as e:
+                return str(e)
+            finally:
+                await shards.close()
+
+    assert asyncio.run(run()) == "disk full"
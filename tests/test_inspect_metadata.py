@@ -0,0 +1,48 @@
+import json
+import os
+import random
+import subprocess
+import sys
+from datetime import datetime
+
+import benchmark
+import inspect_metadata
+import main
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _corpus(tmp_path):
+    folder = tmp_path / "media"
+    folder.mkdir()
+    rng = random.Random(0)
+    benchmark._write_image(str(folder / "a.jpg"), rng, "JPEG", datetime(2019, 4, 1, 9, 30, 0))
+    (folder / "b.mp4").write_bytes(benchmark._mp4_bytes(datetime(2021, 6, 1, 0, 0, 0), rng, model="BenchCam"))
+    (folder / "notes.txt").write_text("not media", encoding="utf-8")
+    return folder
+
+
+def test_cli_writes_one_json_line_per_file(tmp_path):
+    folder = _corpus(tmp_path)
+    other = tmp_path / "list.txt"
+    other.write_text(f"{folder / 'notes.txt'}\n\n", encoding="utf-8")
+    output = tmp_path / "out.jsonl"
+    subprocess.run(
+        [sys.executable, os.path.join(REPO_DIR, "inspect_metadata.py"), str(folder),
+         "--files-from", str(other), "--jobs", "2", "--output", str(output)],
+        cwd=REPO_DIR, check=True, capture_output=True,
+    )
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    # フォルダー内はメディアファイルだけを名前順に、一覧のファイルはそのまま入力順に出力する
+    assert [os.path.basename(r["path"]) for r in records] == ["a.jpg", "b.mp4", "notes.txt"]
+    image, video, other_file = records
+    assert image["kind"] == "image" and image["chosen"] == "2019_04_01_09_30_00" and image["source"] == "pil"
+    assert any(c["used"] and c["value"] == "2019-04-01 09:30:00" for c in image["candidates"])
+    assert video["kind"] == "video" and video["source"] == "mp4_header" and video["camera_model"] == "BenchCam"
+    assert other_file == {"path": str(folder / "notes.txt"), "kind": "other", "error": "対象外の拡張子です"}
+
+
+def test_inspect_files_keeps_input_order():
+    paths = [f"/nonexistent/{i:03d}.txt" for i in range(50)]
+    records = list(inspect_metadata.inspect_files(paths, jobs=2, tz_policy=main.TimezonePolicy()))
+    assert [r["path"] for r in records] == paths
@@ -0,0 +1,33 @@
+import json
+import os
+import subprocess
+import sys
+
+import benchmark
+import main
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("PIL", "PIL.Image", "exiftool", "ffmpeg", "pytz", "tkinter")
+
+
+def _loaded_after(statement):
+    code = f"import json, sys; {statement}; print(json.dumps(sorted(sys.modules)))"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    return set(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+
+def test_import_main_does_not_load_heavy_modules():
+    loaded = _loaded_after("import main")
+    assert "main" in loaded
+    assert loaded.isdisjoint(HEAVY_MODULES)
+
+
+def test_benchmark_tracks_the_same_modules():
+    assert set(HEAVY_MODULES) <= set(benchmark.LAZY_MODULES)
+
+
+def test_lazy_module_loads_on_first_attribute():
+    proxy = main._LazyModule("colorsys")
+    assert proxy.__dict__["_module"] is None
+    assert proxy.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert proxy.__dict__["_module"] is sys.modules["colorsys"]
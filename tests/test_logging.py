@@ -0,0 +1,65 @@
+import json
+import logging
+import sys
+import threading
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def restore_logger():
+    yield
+    main.shutdown_logging()
+    main.logger.handlers.clear()
+    main.logger.setLevel(logging.NOTSET)
+    main.logger.propagate = True
+
+
+def test_json_formatter_one_object_per_record():
+    try:
+        raise ValueError("壊れたファイル")
+    except ValueError:
+        record = logging.LogRecord("image_organizer", logging.WARNING, __file__, 1, "移動失敗: %s", ("a.jpg",), None)
+        record.exc_info = sys.exc_info()
+    line = main.JsonLinesFormatter().format(record)
+    assert "\n" not in line
+    entry = json.loads(line)
+    assert entry["level"] == "WARNING"
+    assert entry["message"] == "移動失敗: a.jpg"
+    assert "ValueError" in entry["exception"]
+    assert {"time", "thread"} <= entry.keys()
+
+
+def test_shutdown_flushes_queued_records(tmp_path, restore_logger):
+    log_file = tmp_path / "organizer.log"
+    main.setup_logging(level="DEBUG", log_file=str(log_file), json_lines=True)
+    workers = [
+        threading.Thread(target=lambda n=n: [main.logger.debug("worker %d line %d", n, i) for i in range(200)])
+        for n in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # shutdown_logging() が戻った時点でキューの中身はすべて書き出されている
+    main.shutdown_logging()
+    entries = [json.loads(line) for line in log_file.read_text(encoding="utf-8").splitlines()]
+    assert len(entries) == 800
+    assert all(entry["level"] == "DEBUG" for entry in entries)
+    assert main._log_listener is None
+
+
+def test_level_filters_and_env_defaults(tmp_path, monkeypatch, restore_logger):
+    log_file = tmp_path / "organizer.log"
+    monkeypatch.setenv(main.LOG_LEVEL_ENV, "warning")
+    monkeypatch.setenv(main.LOG_FILE_ENV, str(log_file))
+    monkeypatch.delenv(main.LOG_JSON_ENV, raising=False)
+    main.setup_logging()
+    main.logger.info("表示しない")
+    main.logger.warning("表示する %s", "x")
+    main.shutdown_logging()
+    lines = log_file.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1
+    assert "WARNING" in lines[0] and "表示する x" in lines[0]
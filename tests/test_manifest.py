@@ -0,0 +1,36 @@
+import main
+
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_duplicates_found_across_chunks_and_spill(tmp_path, monkeypatch):
+    # まとまりを小さくして、同じサイズのファイルが別のまとまり(一時ファイルを含む)に分かれるようにする
+    monkeypatch.setattr(main, "MANIFEST_CHUNK_SIZE", 3)
+    paths = [_write(tmp_path / f"unique_{i}.jpg", b"x" * (100 + i)) for i in range(10)]
+    first = _write(tmp_path / "a.jpg", b"same content")
+    paths.insert(1, first)
+    second = _write(tmp_path / "b.jpg", b"same content")
+    paths.append(second)
+    other = _write(tmp_path / "c.jpg", b"other conten") # 同じサイズで内容が異なる
+    paths.append(other)
+    manifest = main.FileManifest.from_paths(paths, spill_after=5)
+    try:
+        assert list(manifest.paths()) == paths
+        assert main.find_source_duplicates(manifest) == {first: [second]}
+    finally:
+        manifest.close()
+
+
+def test_scan_counts_other_files_without_recording(tmp_path):
+    (tmp_path / "sub").mkdir()
+    _write(tmp_path / "IMG_0001.JPG", b"1")
+    _write(tmp_path / "sub" / "C0001.MP4", b"22")
+    _write(tmp_path / "sub" / "C0001M01.XML", b"<xml/>")
+    _write(tmp_path / "notes.txt", b"text")
+    manifest = main.scan_source_files(str(tmp_path))
+    assert [(path, size) for path, size, _, _ in manifest.entries()] == [
+        (str(tmp_path / "IMG_0001.JPG"), 1), (str(tmp_path / "sub" / "C0001.MP4"), 2)]
+    assert main.count_media_files(str(tmp_path), manifest) == (1, 1, 1, 1)
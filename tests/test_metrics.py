@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+import main
+
+
+def _metrics():
+    metrics = main.StageMetrics()
+    metrics.observe("pil", 0.002)
+    metrics.observe("pil", 0.2)
+    metrics.observe("pil", 60.0, failed=True)
+    with pytest.raises(RuntimeError):
+        with metrics.stage("move"):
+            raise RuntimeError
+    metrics.add_bytes("moved", 1024)
+    metrics.add_bytes("moved", 2048)
+    metrics.record_source("pil")
+    metrics.record_source("pil")
+    metrics.record_source("ffprobe")
+    return metrics
+
+
+def test_json_report(tmp_path):
+    path = tmp_path / "metrics.json"
+    _metrics().write_json(str(path))
+    report = json.loads(path.read_text(encoding="utf-8"))
+    pil = report["stages"]["pil"]
+    assert pil["count"] == 3 and pil["errors"] == 1
+    assert pil["max_seconds"] == 60.0
+    assert pil["histogram"]["0.005"] == 1 and pil["histogram"]["0.25"] == 1 and pil["histogram"]["+Inf"] == 1
+    assert sum(pil["histogram"].values()) == 3
+    assert report["stages"]["move"]["errors"] == 1
+    assert report["bytes"] == {"moved": 3072}
+    assert report["sources"] == {"pil": 2, "ffprobe": 1}
+
+
+def test_prometheus_report(tmp_path):
+    path = tmp_path / "metrics.prom"
+    _metrics().write_prometheus(str(path))
+    lines = path.read_text(encoding="utf-8").splitlines()
+    # バケットは累積値で、+Inf は count と一致する
+    assert 'image_organizer_stage_seconds_bucket{stage="pil",le="0.001"} 0' in lines
+    assert 'image_organizer_stage_seconds_bucket{stage="pil",le="0.005"} 1' in lines
+    assert 'image_organizer_stage_seconds_bucket{stage="pil",le="30.0"} 2' in lines
+    assert 'image_organizer_stage_seconds_bucket{stage="pil",le="+Inf"} 3' in lines
+    assert 'image_organizer_stage_seconds_count{stage="pil"} 3' in lines
+    assert 'image_organizer_stage_errors_total{stage="move"} 1' in lines
+    assert 'image_organizer_bytes_total{kind="moved"} 3072' in lines
+    assert 'image_organizer_date_source_total{source="ffprobe"} 1' in lines
+    for line in lines:
+        assert line.startswith("#") or line.startswith("image_organizer_")
+
+
+def test_timed_decorator_and_reset():
+    metrics = main.StageMetrics()
+
+    @metrics.timed("work")
+    def work(x):
+        return x * 2
+
+    assert work(21) == 42
+    assert metrics.to_dict()["stages"]["work"]["count"] == 1
+    metrics.reset()
+    assert metrics.to_dict()["stages"] == {}
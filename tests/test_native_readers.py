@@ -0,0 +1,258 @@
+import _strptime
+import calendar
+import locale
+import random
+import struct
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from PIL import Image
+
+import benchmark
+import main
+
+IDIT = "SUN AUG 17 11:42:43 2005"
+
+
+def test_idit_parses_without_english_locale(monkeypatch):
+    # setup_locale() で日本語ロケールにした場合と同じく、曜日・月名を日本語にする
+    monkeypatch.setattr(calendar, "month_abbr", [""] + [f"{m}月" for m in range(1, 13)])
+    monkeypatch.setattr(calendar, "day_abbr", ["月", "火", "水", "木", "金", "土", "日"])
+    monkeypatch.setattr(_strptime, "_TimeRE_cache", _strptime.TimeRE())
+    assert main._parse_riff_date(IDIT) == (datetime(2005, 8, 17, 11, 42, 43), True)
+    assert main._parse_riff_date("Thu Oct  2 06:07:08 2006\n") == (datetime(2006, 10, 2, 6, 7, 8), True)
+
+
+@pytest.mark.parametrize("name", ["ja_JP.UTF-8", "Japanese_Japan.932", "de_DE.UTF-8", "fr_FR.UTF-8"])
+def test_idit_parses_under_non_c_lc_time(name):
+    saved = locale.setlocale(locale.LC_TIME)
+    try:
+        locale.setlocale(locale.LC_TIME, name)
+    except locale.Error:
+        pytest.skip(f"ロケール {name} がありません")
+    try:
+        assert main._parse_riff_date(IDIT) == (datetime(2005, 8, 17, 11, 42, 43), True)
+    finally:
+        locale.setlocale(locale.LC_TIME, saved)
+
+
+def test_riff_date_forms():
+    assert main._parse_riff_date("2018-07-04") == (datetime(2018, 7, 4), False)
+    assert main._parse_riff_date("2017:03:02 10:11:12") == ("2017:03:02 10:11:12", True)
+    # 月名として不正なものは文字列のまま返す
+    assert main._parse_riff_date("SUN XYZ 17 11:42:43 2005") == ("SUN XYZ 17 11:42:43 2005", True)
+
+
+def _box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def _header(tmp_path, data, name="clip.mov"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return main.HeaderBuffer(str(path))
+
+
+def test_mp4_model_from_quicktime_keys(tmp_path):
+    # iPhone などの moov/meta(hdlr + keys + ilst)
+    keys = [b"com.apple.quicktime.make", b"com.apple.quicktime.model"]
+    keys_box = _box(b"keys", struct.pack(">II", 0, len(keys)) + b"".join(
+        struct.pack(">I4s", 8 + len(key), b"mdta") + key for key in keys))
+    items = b"".join(
+        _box(index.to_bytes(4, "big"), _box(b"data", struct.pack(">II", 1, 0) + value))
+        for index, value in ((1, b"Apple"), (2, b"iPhone 15 Pro")))
+    meta = _box(b"meta", _box(b"hdlr", bytes(8) + b"mdta" + bytes(13)) + keys_box + _box(b"ilst", items))
+    data = _box(b"ftyp", b"qt  " + bytes(4)) + _box(b"moov", meta) + _box(b"mdat", bytes(64))
+    with _header(tmp_path, data) as header:
+        assert main.read_mp4_camera_model(header) == "iPhone 15 Pro"
+
+
+def test_mp4_model_from_udta(tmp_path):
+    text = b"ILCE-7M3"
+    udta = _box(b"udta", _box(b"\xa9mod", struct.pack(">HH", len(text), 0) + text))
+    data = _box(b"ftyp", b"isom" + bytes(4)) + _box(b"mdat", bytes(64)) + _box(b"moov", udta)
+    with _header(tmp_path, data, "clip.mp4") as header:
+        assert main.read_mp4_camera_model(header) == "ILCE-7M3"
+
+
+def test_mp4_without_model(tmp_path):
+    data = _box(b"ftyp", b"isom" + bytes(4)) + _box(b"moov", _box(b"mvhd", bytes(100)))
+    with _header(tmp_path, data, "clip.mp4") as header:
+        assert main.read_mp4_camera_model(header) is None
+
+
+# --- MP4 / MOV ---
+UTC_DATE = datetime(2019, 6, 7, 8, 9, 10, tzinfo=timezone.utc)
+
+
+def _mp4_dates(tmp_path, data):
+    with _header(tmp_path, data, "clip.mp4") as header:
+        return main.read_mp4_creation_times(header)
+
+
+def _full_box(box_type, seconds, version=0):
+    if version == 1:
+        return _box(box_type, struct.pack(">B3xQQ", 1, seconds, seconds) + bytes(80))
+    return _box(box_type, struct.pack(">B3xII", 0, seconds, seconds) + bytes(80))
+
+
+def test_mp4_valid_header(tmp_path):
+    data = benchmark._mp4_bytes(UTC_DATE.replace(tzinfo=None), random.Random(0))
+    assert _mp4_dates(tmp_path, data) == [
+        ("moov/mvhd", UTC_DATE), ("moov/trak/tkhd", UTC_DATE), ("moov/trak/mdia/mdhd", UTC_DATE)]
+
+
+def test_mp4_moov_past_head_uses_tail_window(tmp_path):
+    mdat = _box(b"mdat", bytes(main.HEADER_BUFFER_SIZE * 2))
+    data = _box(b"ftyp", b"isom" + bytes(4)) + mdat + _box(b"moov", _full_box(b"mvhd", 1))
+    with _header(tmp_path, data, "clip.mp4") as header:
+        assert main.read_mp4_creation_times(header) == [("moov/mvhd", datetime(1904, 1, 1, 0, 0, 1, tzinfo=timezone.utc))]
+
+
+def test_mp4_epoch_edges(tmp_path):
+    # 0 は未設定として無視し、version 1 の 64 ビット値も読む。datetime の範囲を超える値は無視する
+    moov = _box(b"moov", _full_box(b"mvhd", 0) + _box(b"trak", _full_box(b"tkhd", 3_000_000_000, version=1)
+                                                     + _box(b"mdia", _full_box(b"mdhd", 2**64 - 1, version=1))))
+    data = _box(b"ftyp", b"isom" + bytes(4)) + moov
+    expected = datetime(1904, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=3_000_000_000)
+    assert _mp4_dates(tmp_path, data) == [("moov/trak/tkhd", expected)]
+
+
+def test_mp4_largesize_mdat(tmp_path):
+    # size == 1 の場合は 64 ビットのサイズが続く
+    payload = bytes(1024)
+    mdat = struct.pack(">I4sQ", 1, b"mdat", 16 + len(payload)) + payload
+    data = _box(b"ftyp", b"isom" + bytes(4)) + mdat + _box(b"moov", _full_box(b"mvhd", 1))
+    assert [tag for tag, _ in _mp4_dates(tmp_path, data)] == ["moov/mvhd"]
+
+
+def test_mp4_truncated_and_oversized_boxes(tmp_path):
+    data = benchmark._mp4_bytes(UTC_DATE.replace(tzinfo=None), random.Random(0))
+    # moov の途中で切れたファイル。読める範囲の creation_time だけを返す
+    moov_at = data.index(b"moov") - 4
+    assert _mp4_dates(tmp_path, data[:moov_at + 8 + 8 + 6]) == []
+    assert _mp4_dates(tmp_path, data[:moov_at + 60]) == [("moov/mvhd", UTC_DATE)]
+    # 実際より大きいサイズのボックスはファイル末尾で打ち切る
+    oversized = _box(b"ftyp", b"isom" + bytes(4)) + struct.pack(">I4s", 10**9, b"moov") + _full_box(b"mvhd", 1)
+    assert [tag for tag, _ in _mp4_dates(tmp_path, oversized)] == ["moov/mvhd"]
+    # 8 バイト未満のサイズは不正としてたどるのをやめる
+    broken = _box(b"ftyp", b"isom" + bytes(4)) + struct.pack(">I4s", 4, b"moov") + bytes(32)
+    assert _mp4_dates(tmp_path, broken) == []
+    assert _mp4_dates(tmp_path, b"") == []
+
+
+# --- AVI (RIFF) ---
+LOCAL_DATE = datetime(2005, 8, 17, 11, 42, 43)
+
+
+def _riff_dates(tmp_path, data):
+    with _header(tmp_path, data, "clip.avi") as header:
+        return main.read_riff_dates(header)
+
+
+def _avi(*chunks):
+    return benchmark._riff_chunk(b"RIFF", b"AVI " + b"".join(chunks))
+
+
+def _list(list_type, *chunks):
+    return benchmark._riff_chunk(b"LIST", list_type + b"".join(chunks))
+
+
+def test_riff_valid_header(tmp_path):
+    data = benchmark._avi_bytes(LOCAL_DATE, random.Random(0))
+    assert _riff_dates(tmp_path, data) == [("hdrl/IDIT", LOCAL_DATE)]
+
+
+def test_riff_strd_exif_dates(tmp_path):
+    exif = Image.Exif()
+    exif.get_ifd(main.EXIF_IFD_POINTER)[0x9003] = "2005:08:17 11:42:43"
+    strd = benchmark._riff_chunk(b"strd", b"AVIF" + exif.tobytes())
+    data = _avi(_list(b"hdrl", _list(b"strl", strd)))
+    assert _riff_dates(tmp_path, data) == [("strd/0x9003", "2005:08:17 11:42:43")]
+
+
+def test_riff_info_past_head_uses_tail_window(tmp_path):
+    movi = _list(b"movi", bytes(main.HEADER_BUFFER_SIZE * 2))
+    info = _list(b"INFO", benchmark._riff_chunk(b"ICRD", b"2005-08-17\0"))
+    data = _avi(_list(b"hdrl", benchmark._riff_chunk(b"avih", bytes(56))), movi, info)
+    assert _riff_dates(tmp_path, data) == [("INFO/ICRD", datetime(2005, 8, 17))]
+
+
+def test_riff_date_only_icrd_loses_to_idit(tmp_path):
+    info = _list(b"INFO", benchmark._riff_chunk(b"ICRD", b"2005-08-16\0"))
+    idit = benchmark._riff_chunk(b"IDIT", b"WED AUG 17 11:42:43 2005\n\0")
+    data = _avi(_list(b"hdrl", idit), info)
+    assert _riff_dates(tmp_path, data) == [("hdrl/IDIT", LOCAL_DATE)]
+
+
+def test_riff_truncated_and_oversized_chunks(tmp_path):
+    data = benchmark._avi_bytes(LOCAL_DATE, random.Random(0))
+    idit_at = data.index(b"IDIT")
+    # IDIT の途中で切れたファイルは読める範囲の文字列になり、日時としては解釈できない
+    assert _riff_dates(tmp_path, data[:idit_at + 8 + 10]) == [("hdrl/IDIT", "WED AUG 17")]
+    assert _riff_dates(tmp_path, data[:idit_at]) == []
+    # 実際より大きいサイズの LIST はファイル末尾で打ち切る
+    idit = benchmark._riff_chunk(b"IDIT", b"WED AUG 17 11:42:43 2005\n\0")
+    oversized = _avi(struct.pack("<4sI", b"LIST", 10**9) + b"hdrl" + idit)
+    assert _riff_dates(tmp_path, oversized) == [("hdrl/IDIT", LOCAL_DATE)]
+    assert _riff_dates(tmp_path, b"RIFF") == []
+    assert _riff_dates(tmp_path, b"") == []
+
+
+# --- Matroska / WebM (EBML) ---
+def _mkv_dates(tmp_path, data):
+    with _header(tmp_path, data, "clip.mkv") as header:
+        return main.read_ebml_dates(header)
+
+
+def _date_utc_mkv(nanoseconds, cluster_size=64):
+    info = benchmark._ebml(0x1549A966, benchmark._ebml(0x4461, struct.pack(">q", nanoseconds)))
+    cluster = benchmark._ebml(0x1F43B675, bytes(cluster_size))
+    return benchmark._ebml(0x1A45DFA3, benchmark._ebml(0x4282, b"webm")) + benchmark._ebml(0x18538067, info + cluster)
+
+
+def test_ebml_valid_header(tmp_path):
+    data = benchmark._mkv_bytes(UTC_DATE.replace(tzinfo=None), random.Random(0))
+    assert _mkv_dates(tmp_path, data) == [("Segment/Info/DateUTC", UTC_DATE)]
+
+
+def test_ebml_epoch_edges(tmp_path):
+    epoch = datetime(2001, 1, 1, tzinfo=timezone.utc)
+    assert _mkv_dates(tmp_path, _date_utc_mkv(0)) == [("Segment/Info/DateUTC", epoch)]
+    # 2001 年より前は負の値になる
+    before = _mkv_dates(tmp_path, _date_utc_mkv(-86_400 * 10**9 + 1_500))
+    assert before == [("Segment/Info/DateUTC", epoch - timedelta(days=1) + timedelta(microseconds=1))]
+
+
+def test_ebml_info_after_cluster_uses_seek_head(tmp_path):
+    info = benchmark._ebml(0x1549A966, benchmark._ebml(0x4461, struct.pack(">q", 0)))
+    cluster = benchmark._ebml(0x1F43B675, bytes(main.HEADER_BUFFER_SIZE * 2))
+
+    def seek_head(position):
+        seek = benchmark._ebml(0x53AB, (0x1549A966).to_bytes(4, "big")) + benchmark._ebml(0x53AC, position.to_bytes(8, "big"))
+        return benchmark._ebml(0x114D9B74, benchmark._ebml(0x4DBB, seek))
+
+    head_size = len(seek_head(0))
+    segment = seek_head(head_size + len(cluster)) + cluster + info
+    data = benchmark._ebml(0x1A45DFA3, benchmark._ebml(0x4282, b"matroska")) + benchmark._ebml(0x18538067, segment)
+    assert _mkv_dates(tmp_path, data) == [("Segment/Info/DateUTC", datetime(2001, 1, 1, tzinfo=timezone.utc))]
+    # SeekHead がなく Info が Cluster の後ろにある場合は探さない(メディアデータを読み進めない)
+    without_seek = benchmark._ebml(0x1A45DFA3, b"") + benchmark._ebml(0x18538067, cluster + info)
+    assert _mkv_dates(tmp_path, without_seek) == []
+
+
+def test_ebml_truncated_and_oversized_elements(tmp_path):
+    data = _date_utc_mkv(0)
+    date_at = data.index(b"\x44\x61")
+    # DateUTC の途中で切れたファイル
+    assert _mkv_dates(tmp_path, data[:date_at + 9 + 4]) == []
+    # 可変長整数の途中で切れたファイル
+    assert _mkv_dates(tmp_path, data[:date_at + 3]) == []
+    # 実際より大きいサイズの Segment はファイル末尾で打ち切る
+    header = benchmark._ebml(0x1A45DFA3, b"")
+    info = benchmark._ebml(0x1549A966, benchmark._ebml(0x4461, struct.pack(">q", 0)))
+    oversized = header + b"\x18\x53\x80\x67" + b"\x01" + (10**9).to_bytes(7, "big") + info
+    assert len(_mkv_dates(tmp_path, oversized)) == 1
+    # 不正な可変長整数(先頭バイトが 0)
+    assert _mkv_dates(tmp_path, header + b"\x18\x53\x80\x67\x00" + bytes(16)) == []
+    assert _mkv_dates(tmp_path, b"") == []
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from PIL import Image
+
+import benchmark
+import main
+
+TAKEN_AT = datetime(2020, 5, 5, 10, 0, 0)
+
+
+def _gradient(path, reverse=False, quality=95):
+    """左右方向のグラデーション(reverse で向きを逆にすると dHash が大きく異なる)"""
+    im = Image.new("L", (90, 80))
+    for x in range(90):
+        value = 255 - x * 2 if reverse else x * 2
+        for y in range(80):
+            im.putpixel((x, y), value)
+    im.convert("RGB").save(path, "JPEG", quality=quality, exif=benchmark._exif_bytes(TAKEN_AT))
+
+
+def test_index_records_actual_destination(tmp_path, monkeypatch):
+    monkeypatch.setenv(main.CATALOG_ENV, "0")
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    source.mkdir()
+    dest.mkdir()
+    _gradient(source / "a.jpg")
+    _gradient(source / "b.jpg", reverse=True)
+    moved, *_ = asyncio.run(main.async_main(str(source), str(dest), near_duplicates="report"))
+    assert moved == 2
+
+    index = main.NearDuplicateIndex(str(dest))
+    index.load()
+    expected = [os.path.join("2020-05", "05", name) for name in ("20200505_100000.jpg", "20200505_100000_1.jpg")]
+    assert sorted(node[1] for node in index.tree.nodes) == expected
+    # 索引の各ハッシュは、そのパスに実際にあるファイルのハッシュと一致する
+    for hash_value, library_path, _ in index.tree.nodes:
+        assert main.compute_dhash(str(dest / library_path)) == hash_value
+
+    # 2件目の再エンコードは、実際に 2件目が移動された(連番付きかもしれない)ファイルと照合される
+    reencoded = tmp_path / "b_small.jpg"
+    _gradient(reencoded, reverse=True, quality=60)
+    _, match = main.find_near_duplicate(index, str(reencoded), str(dest))
+    assert match is not None
+    expected_match = min(expected, key=lambda p: main.hamming_distance(
+        main.compute_dhash(str(dest / p)), main.compute_dhash(str(reencoded))))
+    assert match[1] == expected_match
+
+
+def test_failed_move_is_not_indexed(tmp_path, monkeypatch):
+    monkeypatch.setenv(main.CATALOG_ENV, "0")
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    source.mkdir()
+    dest.mkdir()
+    _gradient(source / "a.jpg")
+    monkeypatch.setattr(main, "move_media_with_sidecars", lambda *args: "failed")
+    asyncio.run(main.async_main(str(source), str(dest), near_duplicates="report"))
+    index = main.NearDuplicateIndex(str(dest))
+    index.load()
+    assert len(index.tree) == 0
+
+
+
+def test_concurrent_near_duplicates_are_detected(tmp_path, monkeypatch):
+    monkeypatch.setenv(main.CATALOG_ENV, "0")
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    source.mkdir()
+    dest.mkdir()
+    _gradient(source / "a.jpg")
+    _gradient(source / "a_small.jpg", quality=60)
+    original = main.move_media_with_sidecars
+
+    def slow_move(*args):
+        # 移動に時間がかかっても、もう一方の検索が予約と照合されることを確かめる
+        time.sleep(0.2)
+        return original(*args)
+
+    monkeypatch.setattr(main, "move_media_with_sidecars", slow_move)
+    monkeypatch.setattr(main, "thread_count", lambda: 4)
+    progress = main.ProgressSnapshot()
+    moved, *_ = asyncio.run(main.async_main(str(source), str(dest), progress=progress, near_duplicates="report"))
+    assert moved == 2
+    assert progress.near_duplicate == 1
+    index = main.NearDuplicateIndex(str(dest))
+    index.load()
+    assert len(index.tree) == 1
+
+
+def test_reservation_is_released_or_confirmed():
+    index = main.NearDuplicateIndex("/library")
+    first, match = index.reserve(0b1111, "/src/a.jpg")
+    assert first is not None and match is None
+    second, match = index.reserve(0b1110, "/src/b.jpg")
+    assert second is None and match == (1, "/src/a.jpg")
+    index.release(first)
+    third, match = index.reserve(0b1110, "/src/b.jpg")
+    assert match is None
+    index.confirm(third, "2020-05/05/20200505_100000.jpg")
+    assert index.reserved == {}
+    assert index.reserve(0b1111, "/src/c.jpg") == (None, (1, "2020-05/05/20200505_100000.jpg"))
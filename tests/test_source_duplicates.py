@@ -0,0 +1,70 @@
+import asyncio
+import os
+import random
+import shutil
+from datetime import datetime
+
+import benchmark
+import main
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_groups_keep_input_order(tmp_path):
+    a = _write(tmp_path / "a.jpg", b"A" * 100)
+    b = _write(tmp_path / "b.jpg", b"B" * 100)
+    a_copy = _write(tmp_path / "sub" / "a_copy.jpg", b"A" * 100)
+    empty1 = _write(tmp_path / "e1.jpg", b"")
+    empty2 = _write(tmp_path / "e2.jpg", b"")
+    a_copy2 = _write(tmp_path / "a_copy2.jpg", b"A" * 100)
+    groups = main.group_source_duplicates([b, a, a_copy, empty1, empty2, a_copy2])
+    # 空のファイルは内容が同じでもまとめない
+    assert groups == [(b, []), (a, [a_copy, a_copy2]), (empty1, []), (empty2, [])]
+
+
+def test_same_head_and_tail_differs_in_middle(tmp_path):
+    block = 1024
+    head, tail = b"h" * block, b"t" * block
+    first = _write(tmp_path / "v1.mp4", head + b"x" * 5000 + tail)
+    second = _write(tmp_path / "v2.mp4", head + b"y" * 5000 + tail)
+    third = _write(tmp_path / "v3.mp4", head + b"x" * 5000 + tail)
+    # 先頭・末尾のブロックが同じでも、ファイル全体のハッシュで区別する
+    assert main.group_source_duplicates([first, second, third], block_size=block) == [
+        (first, [third]), (second, []),
+    ]
+
+
+def test_resolve_removes_copies_and_moves_their_sidecars(tmp_path):
+    dest_dir = tmp_path / "library" / "2021-06" / "01"
+    dest_dir.mkdir(parents=True)
+    copy = _write(tmp_path / "src" / "C0002.MP4", b"video")
+    _write(tmp_path / "src" / "C0002M01.XML", b"<xml/>")
+    missing = str(tmp_path / "src" / "gone.jpg")
+    results = main.resolve_source_duplicates([copy, missing], str(dest_dir), "20210601_000000")
+    assert results == ["duplicate", "failed"]
+    assert not os.path.exists(copy)
+    assert sorted(os.listdir(dest_dir)) == ["20210601_000000.xml"]
+
+
+def test_async_main_extracts_one_date_per_group(tmp_path, monkeypatch):
+    monkeypatch.setenv(main.CATALOG_ENV, "0")
+    rng = random.Random(0)
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    (source / "backup").mkdir(parents=True)
+    dest.mkdir()
+    original = str(source / "IMG_0001.jpg")
+    benchmark._write_image(original, rng, "JPEG", datetime(2018, 2, 3, 4, 5, 6))
+    for i in range(3):
+        shutil.copyfile(original, source / "backup" / f"IMG_0001 ({i}).jpg")
+    calls = []
+    get_file_date = main.get_file_date
+    monkeypatch.setattr(main, "get_file_date", lambda path, *args: calls.append(path) or get_file_date(path, *args))
+    moved, duplicate, failed, skipped, total = asyncio.run(main.async_main(str(source), str(dest)))
+    assert (moved, duplicate, failed, skipped, total) == (1, 3, 0, 0, 4)
+    assert len(calls) == 1
+    assert [n for _, _, names in os.walk(source) for n in names] == []
@@ -0,0 +1,65 @@
+import json
+import os
+from datetime import timedelta
+
+import main
+
+
+def _policy(tmp_path):
+    return main.TimezonePolicy(
+        default="Asia/Tokyo",
+        camera_models={" Canon EOS R5 ": "Europe/Berlin"},
+        source_folders={
+            str(tmp_path / "uploads"): "America/New_York",
+            str(tmp_path / "uploads" / "hawaii"): "Pacific/Honolulu",
+        },
+    )
+
+
+def _zone(tz):
+    return getattr(tz, "zone", None)
+
+
+def test_exif_offset_wins(tmp_path):
+    policy = _policy(tmp_path)
+    path = str(tmp_path / "uploads" / "hawaii" / "a.jpg")
+    tz = policy.resolve(path, "Canon EOS R5", "-03:00")
+    assert tz.utcoffset(None) == timedelta(hours=-3)
+
+
+def test_invalid_or_disabled_offset_is_ignored(tmp_path):
+    policy = _policy(tmp_path)
+    path = str(tmp_path / "other" / "a.jpg")
+    assert _zone(policy.resolve(path, None, "nonsense")) == "Asia/Tokyo"
+    policy.use_exif_offset = False
+    assert _zone(policy.resolve(path, "canon eos r5", "+02:00")) == "Europe/Berlin"
+
+
+def test_camera_model_before_folder(tmp_path):
+    policy = _policy(tmp_path)
+    path = str(tmp_path / "uploads" / "hawaii" / "a.jpg")
+    assert _zone(policy.resolve(path, "CANON EOS R5")) == "Europe/Berlin"
+
+
+def test_longest_folder_prefix(tmp_path):
+    policy = _policy(tmp_path)
+    assert _zone(policy.resolve(str(tmp_path / "uploads" / "hawaii" / "a.jpg"))) == "Pacific/Honolulu"
+    assert _zone(policy.resolve(str(tmp_path / "uploads" / "b.jpg"), "Unknown")) == "America/New_York"
+    # 名前が前方一致するだけの別フォルダーは対象外
+    assert _zone(policy.resolve(str(tmp_path / "uploads2" / "c.jpg"))) == "Asia/Tokyo"
+
+
+def test_default(tmp_path):
+    assert _zone(_policy(tmp_path).resolve(str(tmp_path / "d.jpg"))) == "Asia/Tokyo"
+
+
+def test_from_config(tmp_path):
+    config = tmp_path / "timezone_policy.json"
+    config.write_text(json.dumps({
+        "default": "UTC",
+        "source_folders": {str(tmp_path / "usa"): "America/Chicago"},
+        "use_exif_offset": False,
+    }), encoding="utf-8")
+    policy = main.TimezonePolicy.from_config(str(config))
+    assert _zone(policy.resolve(os.path.join(str(tmp_path / "usa"), "x.mp4"), None, "+09:00")) == "America/Chicago"
+    assert _zone(policy.resolve(str(tmp_path / "x.mp4"))) == "UTC"
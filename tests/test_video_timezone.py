@@ -0,0 +1,48 @@
+import random
+from datetime import datetime
+
+import benchmark
+import main
+
+# mvhd などは UTC で記録される
+RECORDED_UTC = datetime(2022, 7, 1, 12, 0, 0)
+
+
+def _policy():
+    return main.TimezonePolicy(default="Asia/Tokyo", camera_models={"ILCE-7M3": "America/New_York"})
+
+
+def test_native_mp4_uses_model_timezone(tmp_path):
+    path = tmp_path / "C0001.MP4"
+    path.write_bytes(benchmark._mp4_bytes(RECORDED_UTC, random.Random(0), model="ILCE-7M3"))
+    trace = main.DateTrace()
+    assert main.get_video_date(str(path), _policy(), trace) == "2022_07_01_08_00_00"
+    assert trace.source == "mp4_header"
+    assert trace.camera_model == "ILCE-7M3"
+
+
+def test_native_mp4_of_other_model_uses_default(tmp_path):
+    path = tmp_path / "C0002.MP4"
+    path.write_bytes(benchmark._mp4_bytes(RECORDED_UTC, random.Random(0), model="HERO9"))
+    trace = main.DateTrace()
+    assert main.get_video_date(str(path), _policy(), trace) == "2022_07_01_21_00_00"
+    assert trace.source == "mp4_header"
+
+
+def test_native_avi_ignores_camera_models(tmp_path):
+    # RIFF の IDIT はカメラのローカル時刻なので、機種ごとの設定があってもそのまま使う
+    path = tmp_path / "DSCF0001.AVI"
+    path.write_bytes(benchmark._avi_bytes(datetime(2005, 8, 17, 11, 42, 43), random.Random(0)))
+    trace = main.DateTrace()
+    assert main.get_video_date(str(path), _policy(), trace) == "2005_08_17_11_42_43"
+    assert trace.source == "riff_header"
+
+
+def test_mp4_without_model_falls_back_when_models_configured(tmp_path):
+    path = tmp_path / "C0003.MP4"
+    path.write_bytes(benchmark._mp4_bytes(RECORDED_UTC, random.Random(0)))
+    trace = main.DateTrace()
+    main.get_video_date(str(path), _policy(), trace)
+    native = [c for c in trace.candidates if c["source"] == "mp4_header"]
+    assert native and not any(c["used"] for c in native)
+    assert trace.source != "mp4_header"
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import time
+
+import main
+import watch_folder
+
+
+def _write(path, data=b"x"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_settle_tracker_waits_for_stable_files(tmp_path):
+    tracker = watch_folder.SettleTracker(settle_seconds=0.05)
+    stable = _write(tmp_path / "a.jpg")
+    growing = _write(tmp_path / "b.mp4")
+    gone = _write(tmp_path / "c.jpg")
+    for path in (stable, growing, gone):
+        tracker.touch(path)
+    # 初回はサイズ・更新日時を記録するだけ
+    assert tracker.pop_ready() == []
+    time.sleep(0.06)
+    with open(growing, "ab") as f:
+        f.write(b"more")
+    os.remove(gone)
+    assert tracker.pop_ready() == [stable]
+    assert set(tracker.pending) == {growing}
+    time.sleep(0.06)
+    assert tracker.pop_ready() == [growing]
+    assert tracker.pending == {}
+
+
+def test_polling_watcher_reports_new_and_changed_media(tmp_path):
+    watcher = watch_folder.PollingWatcher(str(tmp_path), interval=0)
+    first = _write(tmp_path / "DCIM" / "a.jpg")
+    _write(tmp_path / "notes.txt")
+    assert watcher._scan() == [first]
+    assert watcher._scan() == []
+    second = _write(tmp_path / "DCIM" / "b.MOV")
+    with open(first, "ab") as f:
+        f.write(b"changed")
+    assert sorted(watcher._scan()) == sorted([first, second])
+
+
+def _fake_group_processor(state, started_hook=None):
+    async def fake(file_path, duplicates, *args, **kwargs):
+        state["active"] += 1
+        state["started"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        if started_hook is not None:
+            started_hook(state)
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        state["finished"] += 1
+        return [{"moved": 1, "duplicate": 0, "failed": 0}]
+    return fake
+
+
+def _state():
+    return {"active": 0, "started": 0, "finished": 0, "peak": 0}
+
+
+def test_process_file_groups_bounds_in_flight(monkeypatch):
+    state = _state()
+    monkeypatch.setattr(main, "async_process_group", _fake_group_processor(state))
+    progress = main.ProgressSnapshot()
+    progress.start(500)
+    groups = ((f"/src/{i}.jpg", []) for i in range(500))
+
+    async def run():
+        await main.process_file_groups(groups, 4, "/dest", asyncio.get_running_loop(), None, None, None, progress)
+
+    asyncio.run(run())
+    assert state["finished"] == 500 and progress.moved == 500
+    assert state["peak"] == 4
+
+
+def test_watch_stops_mid_batch_after_in_flight_files(tmp_path, monkeypatch):
+    source = tmp_path / "upload"
+    dest = tmp_path / "library"
+    dest.mkdir()
+    for i in range(100):
+        _write(source / f"IMG_{i:04d}.jpg", f"image {i}".encode())
+    stop_event = asyncio.Event()
+    state = _state()
+
+    def stop_after_first(s):
+        if s["started"] == 1:
+            stop_event.set()
+
+    monkeypatch.setattr(main, "async_process_group", _fake_group_processor(state, stop_after_first))
+    monkeypatch.setattr(main, "thread_count", lambda: 2)
+    monkeypatch.setattr(watch_folder, "PENDING_CHECK_INTERVAL", 0.01)
+    totals = asyncio.run(asyncio.wait_for(watch_folder.watch_main(
+        str(source), str(dest), settle_seconds=0, poll_interval=0, use_polling=True, stop_event=stop_event,
+        near_duplicates="off"), timeout=30))
+    # 停止要求の後は新しいファイルを始めず、始めたものはすべて完了させる
+    workers = 2 * main.IN_FLIGHT_PER_THREAD
+    assert 1 <= state["started"] <= workers
+    assert state["finished"] == state["started"] == totals["moved"]
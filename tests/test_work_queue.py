@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+import work_queue
+
+
+def _ready_queue(tmp_path, count=3):
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    source.mkdir()
+    queue = work_queue.WorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.configure(str(dest), shard_count=1)
+    paths = []
+    for i in range(count):
+        path = source / f"IMG_{i}.jpg"
+        path.write_bytes(b"image %d" % i)
+        paths.append(str(path))
+    queue.enqueue(paths)
+    rows = queue.lease_batch("a", count, 60)
+    dest_dir = str(dest / "2020-05" / "05")
+    os.makedirs(dest_dir)
+    queue.mark_extracted([(file_id, dest_dir, f"20200505_10000{i}") for i, (file_id, _) in enumerate(rows)], 1)
+    return queue
+
+
+def test_expired_shard_lease_fences_previous_owner(tmp_path):
+    queue = _ready_queue(tmp_path)
+    assert queue.claim_shards("a", 1, 0.05) == [0]
+    rows = queue.fetch_movable([0], 10)
+    assert queue.mark_moving("a", 0, [(rows[0][0], os.path.join(rows[0][2], "20200505_100000.jpg"), "moved")])
+    time.sleep(0.1)
+    # リースが切れたシャードは別のワーカーが取り直し、元の担当者は移動も記録もできない
+    assert queue.claim_shards("b", 1, 60) == [0]
+    assert queue.renew_shards("a", [0], 60) == []
+    assert not queue.mark_moving("a", 0, [(rows[1][0], os.path.join(rows[1][2], "20200505_100001.jpg"), "moved")])
+    assert not queue.mark_moved("a", 0, [(rows[0][0], "moved")])
+    assert queue.mark_moved("b", 0, [(rows[0][0], "moved")])
+    queue.close()
+
+
+def test_move_stops_when_lease_is_lost(tmp_path):
+    queue = _ready_queue(tmp_path, count=20)
+    queue.claim_shards("a", 1, 60)
+    rows = queue.fetch_movable([0], 100)
+    # 別のワーカーが担当を奪った状態を作る
+    queue.conn.execute("UPDATE shards SET owner = 'b'")
+    outcomes = work_queue.move_owned_files(queue, "a", rows, 60, executor=None)
+    assert outcomes == []
+    assert queue.counts() == {"ready": 20}
+    queue.close()
+
+
+def _crashed_mid_move(tmp_path, dest_name, planned_result):
+    """前の担当者が dest_name への移動を記録した後に落ち、移動元が消えている状態を作る"""
+    queue = _ready_queue(tmp_path, count=1)
+    queue.claim_shards("a", 1, 60)
+    (row,) = queue.fetch_movable([0], 10)
+    dest_path = os.path.join(row[2], dest_name)
+    assert queue.mark_moving("a", 0, [(row[0], dest_path, planned_result)])
+    os.remove(row[1])
+    (row,) = queue.fetch_movable([0], 10)
+    assert row[5:] == ("moving", dest_path, planned_result)
+    return queue, row
+
+
+def test_recovery_checks_only_the_recorded_destination(tmp_path):
+    queue, row = _crashed_mid_move(tmp_path, "20200505_100000.jpg", "moved")
+    # 同じ秒の無関係なファイルが連番付きで置かれていても、記録された移動先がなければ移動済みとはみなさない
+    with open(os.path.join(row[2], "20200505_100000_1.jpg"), "wb") as f:
+        f.write(b"unrelated")
+    assert work_queue.move_shard_files(work_queue.plan_shard_moves([row])) == [(row[0], "failed")]
+    with open(row[6], "wb") as f:
+        f.write(b"image 0")
+    assert work_queue.move_shard_files(work_queue.plan_shard_moves([row])) == [(row[0], "moved")]
+    queue.close()
+
+
+def test_recovery_reports_planned_duplicate(tmp_path):
+    queue, row = _crashed_mid_move(tmp_path, "20200505_100000.jpg", "duplicate")
+    with open(row[6], "wb") as f:
+        f.write(b"image 0")
+    assert work_queue.move_shard_files(work_queue.plan_shard_moves([row])) == [(row[0], "duplicate")]
+    queue.close()
+
+
+def test_destination_is_recorded_before_the_move(tmp_path, monkeypatch):
+    queue = _ready_queue(tmp_path, count=3)
+    rows = queue.fetch_movable([0], 10)
+    # 3件とも同じ移動先の名前にし、1件目と3件目は同じ内容にする
+    with open(rows[2][1], "wb") as f:
+        f.write(b"image 0")
+    queue.conn.execute("UPDATE files SET new_basename = '20200505_100000'")
+    queue.claim_shards("a", 1, 60)
+    rows = queue.fetch_movable([0], 10)
+    recorded = []
+    original = main.apply_destination
+
+    def check_recorded(src_path, dest_path, same_content, moved_to=None):
+        recorded.append(queue_reader.execute(
+            "SELECT state, dest_path, planned_result FROM files WHERE path = ?", (src_path,)).fetchone())
+        return original(src_path, dest_path, same_content, moved_to)
+
+    queue_reader = sqlite3.connect(str(tmp_path / "queue.sqlite"), check_same_thread=False)
+    monkeypatch.setattr(main, "apply_destination", check_recorded)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        outcomes = work_queue.move_owned_files(queue, "a", rows, 60, executor)
+    assert outcomes == ["moved", "moved", "duplicate"]
+    dest_dir = rows[0][2]
+    assert recorded == [
+        ("moving", os.path.join(dest_dir, "20200505_100000.jpg"), "moved"),
+        ("moving", os.path.join(dest_dir, "20200505_100000_1.jpg"), "moved"),
+        ("moving", os.path.join(dest_dir, "20200505_100000.jpg"), "duplicate"),
+    ]
+    assert queue.counts() == {"done": 3}
+    queue_reader.close()
+    queue.close()
+
+
+def test_old_queue_gets_destination_columns(tmp_path):
+    db_path = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, state TEXT NOT NULL "
+                 "DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_expires REAL, "
+                 "dest_dir TEXT, new_basename TEXT, shard INTEGER, result TEXT, error TEXT, updated_at REAL)")
+    conn.commit()
+    conn.close()
+    queue = work_queue.WorkQueue(db_path)
+    columns = {row[1] for row in queue.conn.execute("PRAGMA table_info(files)")}
+    assert {"dest_path", "planned_result"} <= columns
+    queue.close()
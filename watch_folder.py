@@ -0,0 +1,314 @@
+"""
+アップロード用フォルダーを常時監視し、新しく届いたメディアファイルだけを整理する常駐モード。
+Linux では inotify で変更を受け取り、それ以外の環境(または --polling 指定時)は定期的な走査で検出する。
+書き込み中のファイルは、サイズと更新日時が一定時間変化しなくなるまで処理を待つ。
+ExifToolワーカー・スレッドプール・移動先シャード・日時パースのキャッシュ・類似画像の索引・カタログはバッチ間で保持される。
+
+使い方:
+    python watch_folder.py SOURCE_DIR DEST_DIR [--settle 5] [--poll-interval 2] [--polling] [--no-initial-scan]
+                           [--near-duplicates off|report|quarantine]
+"""
+import argparse
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import signal
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+from main import logger
+
+# 書き込み完了とみなすまでにサイズ・更新日時が変化しない時間(秒)
+DEFAULT_SETTLE_SECONDS = 5.0
+# ポーリング方式での走査間隔(秒)
+DEFAULT_POLL_INTERVAL = 2.0
+# 安定判定のために保留中ファイルを確認する間隔(秒)
+PENDING_CHECK_INTERVAL = 1.0
+
+# inotify のイベントマスク (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_media_file(path):
+    ext = os.path.splitext(path)[1].lower()
+    return ext in main.IMAGE_EXTS or ext in main.VIDEO_EXTS
+
+
+def scan_media_files(root):
+    """root 以下のメディアファイルのパスを列挙する"""
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if is_media_file(path):
+                yield path
+
+
+class PollingWatcher:
+    """一定間隔でツリーを走査し、新しいファイルや変化したファイルを報告する"""
+    def __init__(self, root, interval=DEFAULT_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.known = {}
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _scan(self):
+        current = {}
+        changed = []
+        for path in scan_media_files(self.root):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            key = (st.st_size, st.st_mtime_ns)
+            current[path] = key
+            if self.known.get(path) != key:
+                changed.append(path)
+        self.known = current
+        return changed
+
+    async def wait_changes(self, loop, executor):
+        await asyncio.sleep(self.interval)
+        return await loop.run_in_executor(executor, self._scan)
+
+
+class InotifyWatcher:
+    """inotify でツリー全体を監視する(Linux専用)。新しいサブフォルダーにも監視を追加する"""
+    def __init__(self, root):
+        self.root = root
+        self.fd = None
+        self.wd_to_dir = {}
+        self.queue = asyncio.Queue()
+        self._libc = None
+
+    @staticmethod
+    def available():
+        return sys.platform.startswith("linux") and ctypes.util.find_library("c") is not None
+
+    def start(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 に失敗しました")
+        self._add_tree(self.root)
+        asyncio.get_running_loop().add_reader(self.fd, self._on_readable)
+
+    def close(self):
+        if self.fd is not None:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+    def _add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            logger.warning("監視を追加できません: %s (errno %d)", directory, ctypes.get_errno())
+            return
+        self.wd_to_dir[wd] = directory
+
+    def _add_tree(self, root):
+        """root 以下のすべてのフォルダーを監視し、既に存在するメディアファイルを報告する"""
+        for dirpath, _, filenames in os.walk(root):
+            self._add_watch(dirpath)
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if is_media_file(path):
+                    self.queue.put_nowait(path)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                # イベントが溢れた場合は取りこぼしを防ぐため全体を再走査する
+                logger.warning("inotify のイベントキューが溢れました。フォルダー全体を再走査します。")
+                self._add_tree(self.root)
+                continue
+            if mask & IN_IGNORED:
+                self.wd_to_dir.pop(wd, None)
+                continue
+            directory = self.wd_to_dir.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+            elif is_media_file(path):
+                self.queue.put_nowait(path)
+
+    async def wait_changes(self, loop, executor):
+        changed = [await self.queue.get()]
+        while not self.queue.empty():
+            changed.append(self.queue.get_nowait())
+        return changed
+
+
+class SettleTracker:
+    """サイズと更新日時が settle_seconds の間変化しなかったファイルを処理可能として返す"""
+    def __init__(self, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        self.settle_seconds = settle_seconds
+        self.pending = {} # path -> ((size, mtime_ns), 最後に変化を確認した時刻)
+
+    def touch(self, path):
+        self.pending.setdefault(path, (None, time.monotonic()))
+
+    def pop_ready(self):
+        now = time.monotonic()
+        ready = []
+        for path, (key, since) in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                # 処理前に削除・移動されたファイルは追跡をやめる
+                del self.pending[path]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != key:
+                self.pending[path] = (current, now)
+            elif now - since >= self.settle_seconds:
+                del self.pending[path]
+                ready.append(path)
+        return ready
+
+
+async def watch_main(source_folder, dest_root, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                     poll_interval=DEFAULT_POLL_INTERVAL, use_polling=False, initial_scan=True, stop_event=None,
+                     near_duplicates=None):
+    """
+    source_folder を監視し、届いたファイルを async_process_file で dest_root に整理し続ける。
+    stop_event がセットされるまで(または SIGINT/SIGTERM を受けるまで)動作する。停止要求はバッチの途中でも有効で、
+    まだ始めていないファイルは移動元に残し(次回起動時の走査で処理される)、処理中のファイルの完了を待って戻る。
+    near_duplicates は async_main と同じ類似画像の検出モード(省略時は環境変数)。
+    """
+    loop = asyncio.get_running_loop()
+    num_threads = main.thread_count()
+    executor = ThreadPoolExecutor(max_workers=num_threads)
+    tz_policy = main.TimezonePolicy.load_default()
+    shards = main.DestinationShards(loop, executor)
+    near_dups = main.NearDuplicateIndex.from_env(dest_root, near_duplicates)
+    catalog = main.LibraryCatalog.from_env(dest_root)
+    stop_event = stop_event or asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass # Windows では add_signal_handler が使えない
+
+    if not use_polling and InotifyWatcher.available():
+        watcher = InotifyWatcher(source_folder)
+        logger.info("inotify で監視します: %s", source_folder)
+    else:
+        watcher = PollingWatcher(source_folder, poll_interval)
+        logger.info("%.1f 秒間隔のポーリングで監視します: %s", poll_interval, source_folder)
+    tracker = SettleTracker(settle_seconds)
+    main.stage_metrics.reset()
+    watcher.start()
+    if not initial_scan:
+        # 起動時点で存在するファイルは処理済みとして扱う
+        if isinstance(watcher, PollingWatcher):
+            watcher._scan()
+        else:
+            while not watcher.queue.empty():
+                watcher.queue.get_nowait()
+    progress = main.ProgressSnapshot()
+    progress.start(0)
+    progress.shard_depths = shards.depths
+    change_task = None
+    stop_task = asyncio.ensure_future(stop_event.wait())
+    try:
+        while not stop_event.is_set():
+            if change_task is None:
+                change_task = asyncio.ensure_future(watcher.wait_changes(loop, executor))
+            timeout = PENDING_CHECK_INTERVAL if tracker.pending else None
+            done, _ = await asyncio.wait({change_task, stop_task}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if change_task in done:
+                for path in change_task.result():
+                    tracker.touch(path)
+                change_task = None
+            ready = tracker.pop_ready()
+            if not ready:
+                continue
+            logger.info("%d 個の新しいファイルを処理します。", len(ready))
+            groups = await loop.run_in_executor(executor, main.group_source_duplicates, ready)
+            progress.total_files += len(ready)
+            progress.pending += len(ready)
+            # 初回のバッチはツリー全体になりうるため、async_main と同じく一定数のワーカーで順に処理する。
+            # 停止要求を受けたら新しいファイルは始めず、処理中のものの完了だけを待つ
+            await main.process_file_groups(
+                groups, num_threads * main.IN_FLIGHT_PER_THREAD, dest_root, loop, executor, tz_policy, shards,
+                progress, near_dups, catalog, stop_event)
+            logger.info(
+                "累計: 移動 %d / 重複 %d / スキップ %d / 失敗 %d",
+                progress.moved, progress.duplicate, progress.skipped, progress.failed,
+            )
+            # 停止時に失われないよう、バッチごとに索引・カタログを保存する
+            if near_dups is not None:
+                await loop.run_in_executor(executor, near_dups.save)
+            if catalog is not None:
+                await loop.run_in_executor(executor, catalog.flush)
+    finally:
+        for task in (change_task, stop_task):
+            if task is not None:
+                task.cancel()
+        watcher.close()
+        await shards.close()
+        executor.shutdown(wait=True)
+        if catalog is not None:
+            catalog.close()
+        main.close_exiftool_workers()
+        main.stage_metrics.write_reports()
+    return {
+        "moved": progress.moved, "duplicate": progress.duplicate, "failed": progress.failed,
+        "skipped": progress.skipped, "near_duplicate": progress.near_duplicate,
+    }
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="フォルダーを監視して届いたメディアファイルを整理する")
+    parser.add_argument("source")
+    parser.add_argument("dest")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS, help="書き込み完了とみなす無変化時間(秒)")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, help="ポーリング間隔(秒)")
+    parser.add_argument("--polling", action="store_true", help="inotify を使わずポーリングで監視する")
+    parser.add_argument("--no-initial-scan", action="store_true", help="起動時に既にあるファイルは処理しない")
+    parser.add_argument("--near-duplicates", choices=main.NEAR_DUP_MODES, help="類似画像の検出モード(省略時は環境変数)")
+    args = parser.parse_args()
+    main.setup_logging()
+    try:
+        asyncio.run(watch_main(
+            args.source, args.dest, settle_seconds=args.settle, poll_interval=args.poll_interval,
+            use_polling=args.polling, initial_scan=not args.no_initial_scan, near_duplicates=args.near_duplicates,
+        ))
+    finally:
+        main.shutdown_logging()
+
+
+if __name__ == "__main__":
+    cli()
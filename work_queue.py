@@ -0,0 +1,657 @@
+"""
+複数のワーカープロセス(同じマシンでも、同じNASをマウントした別のホストでも)で整理処理を分担するための作業キュー。
+キューは SQLite のファイル1つで、ファイルの一覧・リース・移動先シャードの担当者を保持する。
+
+処理の流れ:
+    1. enqueue でソースフォルダーのメディアファイルをキューに登録する(移動先もキューに記録される)。
+    2. 各ワーカーは未処理のファイルを batch 件ずつリースし、日時を取得して移動先を決める。
+       リースの期限が切れたファイル(ワーカーが落ちた場合など)は別のワーカーが取り直す。
+    3. 移動は移動先ディレクトリのシャード(main.dest_shard_index)ごとに担当ワーカーを1つだけ決めて行う。
+       同じディレクトリへの移動は常に1つのワーカーで直列に行われるため、ホストをまたいでもファイル名の衝突判定が競合しない。
+
+複数ホストで使う場合は、すべてのホストで同じパスにソース・移動先・キューのファイルが見えていること、
+ホスト間の時計が概ね合っていることが前提。NAS上のキューでは WAL が使えないため --journal-mode delete(既定)を使う。
+
+使い方:
+    python work_queue.py enqueue QUEUE_DB SOURCE_DIR DEST_DIR
+    python work_queue.py work QUEUE_DB [--batch 32] [--lease 300] [--exit-when-drained]
+    python work_queue.py status QUEUE_DB
+    python work_queue.py retry-failed QUEUE_DB
+"""
+import argparse
+import math
+import os
+import socket
+import sqlite3
+import sys
+import re
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import main
+from main import logger
+
+# 1回にリースするファイル数
+DEFAULT_BATCH_SIZE = 32
+# リースの有効期間(秒)。この間に更新されなければ別のワーカーが取り直す
+DEFAULT_LEASE_SECONDS = 300.0
+# 仕事がないときにキューを確認する間隔(秒)
+DEFAULT_IDLE_INTERVAL = 5.0
+# 日時取得・移動をやり直す上限回数
+MAX_ATTEMPTS = 3
+# リースの有効期間のうち、更新せずに処理を続けてよい割合
+# (日時取得の待ち時間はこの間隔でリースを更新し、移動はこの時間を過ぎたら次のファイルに進まずに止める)
+LEASE_RENEW_FRACTION = 1 / 3
+# 1つのシャードでリースを確認してから続けて移動するファイル数の上限
+MOVE_SUB_BATCH_SIZE = 8
+
+# ファイルの状態
+# pending: 未処理 / extracting: 日時取得のためリース中 / ready: 移動先が決まり移動待ち
+# moving: 移動中(dest_path に実際の移動先、planned_result に "moved" / "duplicate" を記録してから移動する)
+# done: 完了(移動・重複削除) / skipped: 日付が取れない等でスキップ / failed: 失敗(上限回数に達した場合を含む)
+ACTIVE_STATES = ('pending', 'extracting', 'ready', 'moving')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    dest_dir TEXT,
+    new_basename TEXT,
+    shard INTEGER,
+    dest_path TEXT,
+    planned_result TEXT,
+    result TEXT,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_state ON files (state, lease_expires);
+CREATE INDEX IF NOT EXISTS files_shard ON files (shard, state);
+CREATE TABLE IF NOT EXISTS shards (
+    shard INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    lease_expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+class WorkQueue:
+    """
+    SQLite の作業キュー。状態を変える操作はすべて BEGIN IMMEDIATE のトランザクションで行うため、
+    複数のプロセスが同じファイルやシャードを同時にリースすることはない。
+    接続はスレッド間で共有しないこと(ワーカーではメインスレッドだけが使う)。
+    """
+    def __init__(self, db_path, journal_mode='delete', busy_timeout=60.0):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=busy_timeout, isolation_level=None)
+        self.conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """移動先の記録がなかった版で作られたキューに列を追加する"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+        with self._transaction():
+            for column in ("dest_path", "planned_result"):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE files ADD COLUMN {column} TEXT")
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        return _ImmediateTransaction(self.conn)
+
+    # --- 設定 ---
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def configure(self, dest_root, shard_count=main.DEST_SHARD_COUNT):
+        """
+        移動先とシャード数を記録する。すべてのワーカーが同じ値を使う必要があるため、
+        既に別の値が記録されている場合は ValueError にする。
+        """
+        dest_root = os.path.abspath(dest_root)
+        with self._transaction():
+            for key, value in (("dest_root", dest_root), ("shard_count", str(shard_count))):
+                current = self.get_meta(key)
+                if current is None:
+                    self.conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, value))
+                elif current != value:
+                    raise ValueError(f"キューの {key} は既に {current} に設定されています(指定値: {value})")
+
+    # --- 登録 ---
+    def enqueue(self, paths, chunk_size=1000):
+        """パスを未処理として登録する(登録済みのパスは無視する)。新しく登録した件数を返す"""
+        added = 0
+        chunk = []
+        now = time.time()
+        for path in paths:
+            chunk.append((os.path.abspath(path), now))
+            if len(chunk) >= chunk_size:
+                added += self._insert(chunk)
+                chunk = []
+        if chunk:
+            added += self._insert(chunk)
+        return added
+
+    def _insert(self, rows):
+        with self._transaction():
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO files (path, updated_at) VALUES (?, ?)", rows)
+            return self.conn.total_changes - before
+
+    # --- ワーカー ---
+    def heartbeat(self, worker_id, lease_seconds):
+        """生存を記録し、自分のファイル・シャードのリースを延長する"""
+        now = time.time()
+        with self._transaction():
+            self.conn.execute(
+                "INSERT OR REPLACE INTO workers (worker, host, pid, last_seen) VALUES (?, ?, ?, ?)",
+                (worker_id, socket.gethostname(), os.getpid(), now),
+            )
+            self.conn.execute(
+                "UPDATE files SET lease_expires = ? WHERE worker = ? AND state = 'extracting'",
+                (now + lease_seconds, worker_id),
+            )
+            self.conn.execute("UPDATE shards SET lease_expires = ? WHERE owner = ?", (now + lease_seconds, worker_id))
+
+    def live_workers(self, lease_seconds):
+        since = time.time() - lease_seconds
+        return self.conn.execute("SELECT COUNT(*) FROM workers WHERE last_seen >= ?", (since,)).fetchone()[0]
+
+    def lease_batch(self, worker_id, batch_size, lease_seconds):
+        """
+        未処理のファイル(またはリースが切れたファイル)を最大 batch_size 件リースし、(id, path) のリストを返す。
+        リースの切れが MAX_ATTEMPTS 回に達したファイルは失敗にする。
+        """
+        now = time.time()
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE files SET state = 'failed', error = ?, worker = NULL, updated_at = ? "
+                "WHERE state = 'extracting' AND lease_expires < ? AND attempts >= ?",
+                ("リースの期限切れが上限回数に達しました", now, now, MAX_ATTEMPTS),
+            )
+            rows = self.conn.execute(
+                "SELECT id, path FROM files WHERE state = 'pending' "
+                "OR (state = 'extracting' AND lease_expires < ?) ORDER BY id LIMIT ?",
+                (now, batch_size),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE files SET state = 'extracting', worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                [(worker_id, now + lease_seconds, now, file_id) for file_id, _ in rows],
+            )
+        return rows
+
+    def mark_extracted(self, results, shard_count):
+        """
+        日時取得の結果を記録する。results は (id, dest_dir, new_basename) または (id, None, 理由) のリスト。
+        移動先が決まったファイルは ready になり、移動先ディレクトリのシャードが割り当てられる。
+        """
+        now = time.time()
+        ready = []
+        skipped = []
+        for file_id, dest_dir, value in results:
+            if dest_dir is None:
+                skipped.append((value, now, file_id))
+            else:
+                ready.append((dest_dir, value, main.dest_shard_index(dest_dir, shard_count), now, file_id))
+        with self._transaction():
+            self.conn.executemany(
+                "UPDATE files SET state = 'ready', dest_dir = ?, new_basename = ?, shard = ?, worker = NULL, "
+                "lease_expires = NULL, updated_at = ? WHERE id = ? AND state = 'extracting'",
+                ready,
+            )
+            self.conn.executemany(
+                "UPDATE files SET state = 'skipped', result = ?, worker = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE id = ? AND state = 'extracting'",
+                skipped,
+            )
+
+    def mark_retry(self, file_id, error):
+        """例外で処理できなかったファイルを、上限回数までは未処理に戻し、それ以降は失敗にする"""
+        now = time.time()
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE files SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, worker = NULL, lease_expires = NULL, updated_at = ? WHERE id = ?",
+                (MAX_ATTEMPTS, error, now, file_id),
+            )
+
+    # --- 移動先シャード ---
+    def claim_shards(self, worker_id, max_shards, lease_seconds):
+        """
+        移動待ちのファイルがあり、担当者がいない(またはリースが切れた)シャードを max_shards 個まで担当し、
+        担当しているシャード番号のリストを返す。
+        """
+        now = time.time()
+        with self._transaction():
+            owned = [row[0] for row in self.conn.execute("SELECT shard FROM shards WHERE owner = ?", (worker_id,))]
+            if len(owned) < max_shards:
+                candidates = self.conn.execute(
+                    "SELECT DISTINCT f.shard FROM files f LEFT JOIN shards s ON s.shard = f.shard "
+                    "WHERE f.state IN ('ready', 'moving') AND (s.owner IS NULL OR s.lease_expires < ?) LIMIT ?",
+                    (now, max_shards - len(owned)),
+                ).fetchall()
+                for (shard,) in candidates:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO shards (shard, owner, lease_expires) VALUES (?, ?, ?)",
+                        (shard, worker_id, now + lease_seconds),
+                    )
+                    owned.append(shard)
+        return owned
+
+    def release_idle_shards(self, worker_id):
+        """移動待ちのファイルがなくなったシャードの担当をやめ、他のワーカーが取れるようにする"""
+        with self._transaction():
+            self.conn.execute(
+                "DELETE FROM shards WHERE owner = ? AND shard NOT IN "
+                "(SELECT DISTINCT shard FROM files WHERE state IN ('ready', 'moving') AND shard IS NOT NULL)",
+                (worker_id,),
+            )
+
+    def release_worker(self, worker_id):
+        """ワーカーの終了時に、担当シャードとリース中のファイルを手放す"""
+        with self._transaction():
+            self.conn.execute("DELETE FROM shards WHERE owner = ?", (worker_id,))
+            self.conn.execute(
+                "UPDATE files SET state = 'pending', worker = NULL, lease_expires = NULL, attempts = attempts - 1 "
+                "WHERE worker = ? AND state = 'extracting'",
+                (worker_id,),
+            )
+            self.conn.execute("DELETE FROM workers WHERE worker = ?", (worker_id,))
+
+    def fetch_movable(self, shards, limit):
+        """
+        担当シャードの移動待ち・移動中のファイルを
+        (id, path, dest_dir, new_basename, shard, state, dest_path, planned_result) で返す
+        """
+        if not shards:
+            return []
+        placeholders = ",".join("?" * len(shards))
+        return self.conn.execute(
+            f"SELECT id, path, dest_dir, new_basename, shard, state, dest_path, planned_result FROM files "
+            f"WHERE shard IN ({placeholders}) AND state IN ('ready', 'moving') ORDER BY shard, id LIMIT ?",
+            (*shards, limit),
+        ).fetchall()
+
+    def _owns_shard(self, worker_id, shard, now):
+        row = self.conn.execute(
+            "SELECT 1 FROM shards WHERE shard = ? AND owner = ? AND lease_expires >= ?", (shard, worker_id, now)
+        ).fetchone()
+        return row is not None
+
+    def renew_shards(self, worker_id, shards, lease_seconds):
+        """担当しているシャードのリースを延長し、まだ担当しているシャード番号のリストを返す"""
+        now = time.time()
+        owned = []
+        with self._transaction():
+            for shard in shards:
+                cursor = self.conn.execute(
+                    "UPDATE shards SET lease_expires = ? WHERE shard = ? AND owner = ? AND lease_expires >= ?",
+                    (now + lease_seconds, shard, worker_id, now),
+                )
+                if cursor.rowcount:
+                    owned.append(shard)
+        return owned
+
+    def mark_moving(self, worker_id, shard, plans):
+        """
+        シャードをまだ担当している場合だけファイルを移動中にして True を返す。plans は (id, 移動先のパス, 予定の結果) のリストで、
+        移動を始める前に実際の移動先を記録しておくことで、途中で落ちた場合に新しい担当者がそのパスだけを確認できる。
+        リースが切れて担当を失っていれば何も変更せずに False を返す(移動を始めてはいけない)。
+        """
+        now = time.time()
+        with self._transaction():
+            if not self._owns_shard(worker_id, shard, now):
+                return False
+            self.conn.executemany(
+                "UPDATE files SET state = 'moving', dest_path = ?, planned_result = ?, updated_at = ? "
+                "WHERE id = ? AND shard = ? AND state IN ('ready', 'moving')",
+                [(dest_path, planned_result, now, file_id, shard) for file_id, dest_path, planned_result in plans],
+            )
+        return True
+
+    def mark_moved(self, worker_id, shard, results):
+        """
+        移動結果を記録する。results は (id, "moved" / "duplicate" / "failed") のリスト。
+        シャードの担当を失っていた場合は記録せずに False を返す(ファイルは moving のまま残り、新しい担当者が確認する)。
+        """
+        now = time.time()
+        with self._transaction():
+            if not self._owns_shard(worker_id, shard, now):
+                return False
+            self.conn.executemany(
+                "UPDATE files SET state = ?, result = ?, updated_at = ? WHERE id = ? AND shard = ? AND state = 'moving'",
+                [("failed" if res == "failed" else "done", res, now, file_id, shard) for file_id, res in results],
+            )
+        return True
+
+    # --- 状態 ---
+    def counts(self):
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM files GROUP BY state").fetchall())
+
+    def is_drained(self):
+        placeholders = ",".join("?" * len(ACTIVE_STATES))
+        row = self.conn.execute(
+            f"SELECT 1 FROM files WHERE state IN ({placeholders}) LIMIT 1", ACTIVE_STATES
+        ).fetchone()
+        return row is None
+
+    def retry_failed(self):
+        """失敗したファイルを未処理に戻す。戻した件数を返す"""
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE files SET state = 'pending', attempts = 0, error = NULL, result = NULL, shard = NULL, "
+                "dest_dir = NULL, new_basename = NULL, dest_path = NULL, planned_result = NULL, updated_at = ? "
+                "WHERE state = 'failed'",
+                (time.time(),),
+            )
+            return cursor.rowcount
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE で書き込みロックを先に取り、例外時はロールバックするコンテキストマネージャー"""
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def scan_media_files(root):
+    """root 以下のメディアファイルのパスを列挙する(走査結果は main.FileManifest にまとめて持つ)"""
+    manifest = main.scan_source_files(root)
+    try:
+        yield from manifest.paths()
+    finally:
+        manifest.close()
+
+
+def extract_destination(file_path, dest_root, tz_policy):
+    """
+    1ファイルの日時を取得して移動先ディレクトリを作る。
+    (dest_dir, new_basename) または (None, スキップ理由) を返す。
+    """
+    date_str = main.get_file_date(file_path, tz_policy)
+    if not date_str:
+        return None, "no_date"
+    dest_info = main.make_destination_path(dest_root, date_str)
+    if not dest_info:
+        return None, "no_destination"
+    return dest_info
+
+
+def plan_shard_moves(rows):
+    """
+    1つのシャードのファイルの移動先を main.choose_destination で決め、行の末尾の (dest_path, planned_result) を
+    置き換えた行のリストを返す。移動先の決定は移動の前に行い、mark_moving でキューに記録してから移動する。
+    前の担当者が移動の途中で落ちた("moving" のまま移動元がない)ファイルは、記録済みの移動先をそのまま使う。
+    同じ名前の移動先を取り合うファイルがあれば、その手前までを返す(残りは前のファイルの移動後に決める)。
+    """
+    planned = []
+    names = set()
+    for row in rows:
+        file_id, path, dest_dir, new_basename, shard, state, dest_path, planned_result = row
+        if state == 'moving' and not os.path.exists(path):
+            planned.append(row)
+            continue
+        name = (dest_dir, new_basename, os.path.splitext(path)[1].lower())
+        if name in names:
+            break
+        names.add(name)
+        try:
+            dest_path, same_content = main.choose_destination(path, dest_dir, new_basename)
+            planned_result = "duplicate" if same_content else "moved"
+        except OSError as e:
+            logger.error("移動先を決められません: %s (%s)", path, e)
+            dest_path = planned_result = None
+        planned.append((file_id, path, dest_dir, new_basename, shard, state, dest_path, planned_result))
+    return planned
+
+
+def move_shard_files(rows, deadline=None):
+    """
+    plan_shard_moves で移動先を決めた1つのシャードのファイルを順番に移動し、(id, 結果) のリストを返す。
+    deadline(time.monotonic() の値)を過ぎると残りのファイルには手を付けずに戻る(結果のリストは処理した分だけ)。
+    移動元がないファイルは、記録された移動先(予定の結果が "duplicate" なら同一内容の既存ファイル)が
+    あれば前の担当者が処理済みとみなし、予定の結果を返す。それ以外は失敗にする。
+    """
+    results = []
+    for file_id, path, dest_dir, new_basename, _, state, dest_path, planned_result in rows:
+        if deadline is not None and results and time.monotonic() >= deadline:
+            break
+        if planned_result is None:
+            results.append((file_id, "failed"))
+            continue
+        if not os.path.exists(path):
+            if state == 'moving' and os.path.exists(dest_path):
+                logger.info("前の担当者が処理済みのファイルです: %s -> %s (%s)", path, dest_path, planned_result)
+                results.append((file_id, planned_result))
+            else:
+                logger.error("移動元も記録された移動先も見つかりません: %s (%s)", path, dest_path)
+                results.append((file_id, "failed"))
+            continue
+        try:
+            res = main.move_media_with_sidecars(
+                path, dest_dir, new_basename, planned=(dest_path, planned_result == "duplicate"))
+        except Exception:
+            logger.exception("移動中に予期せぬエラー: %s", path)
+            res = "failed"
+        results.append((file_id, res))
+    return results
+
+
+def wait_with_heartbeat(queue, worker_id, futures, lease_seconds):
+    """futures の完了を待つ間、リースの期限が切れないよう一定間隔でリースを更新する"""
+    pending = set(futures)
+    while pending:
+        _, pending = wait(pending, timeout=lease_seconds * LEASE_RENEW_FRACTION, return_when=FIRST_COMPLETED)
+        if pending:
+            queue.heartbeat(worker_id, lease_seconds)
+
+
+def move_owned_files(queue, worker_id, rows, lease_seconds, executor, stop_event=None):
+    """
+    担当シャードのファイルを移動し、結果("moved" / "duplicate" / "failed")のリストを返す。
+    シャードごとに MOVE_SUB_BATCH_SIZE 件ずつ、リースを更新して担当を確認し、移動先を決めて記録してから移動し
+    (シャードの間は並列)、1回の移動はリースの LEASE_RENEW_FRACTION の時間で打ち切る。
+    担当を失ったシャードはそこで移動をやめる。
+    """
+    by_shard = {}
+    for row in rows:
+        by_shard.setdefault(row[4], []).append(row)
+    outcomes = []
+    while by_shard and (stop_event is None or not stop_event.is_set()):
+        owned = set(queue.renew_shards(worker_id, list(by_shard), lease_seconds))
+        for shard in list(by_shard):
+            if shard not in owned:
+                logger.warning("シャード %d の担当を失ったため移動を中止します(%d 件は他のワーカーが移動します)。",
+                               shard, len(by_shard[shard]))
+                del by_shard[shard]
+        if not by_shard:
+            break
+        # 移動先の決定(既存ファイルとの比較を含む)はシャードごとに並列に行う
+        shards = list(by_shard)
+        planned = dict(zip(shards, executor.map(
+            lambda shard: plan_shard_moves(by_shard[shard][:MOVE_SUB_BATCH_SIZE]), shards)))
+        sub_batches = {}
+        for shard in shards:
+            sub_batch = planned[shard]
+            plans = [(row[0], row[6], row[7]) for row in sub_batch if row[5] != 'moving' or os.path.exists(row[1])]
+            if not queue.mark_moving(worker_id, shard, plans):
+                logger.warning("シャード %d の担当を失ったため移動を中止します(%d 件は他のワーカーが移動します)。",
+                               shard, len(by_shard[shard]))
+                del by_shard[shard]
+                continue
+            sub_batches[shard] = sub_batch
+        if not sub_batches:
+            break
+        deadline = time.monotonic() + lease_seconds * LEASE_RENEW_FRACTION
+        shards = list(sub_batches)
+        for shard, results in zip(shards, executor.map(
+                lambda shard: move_shard_files(sub_batches[shard], deadline), shards)):
+            if not queue.mark_moved(worker_id, shard, results):
+                logger.warning("シャード %d の担当を失ったため、移動結果を記録せずに中止します。", shard)
+                del by_shard[shard]
+                continue
+            outcomes.extend(res for _, res in results)
+            del by_shard[shard][:len(results)]
+            if not by_shard[shard]:
+                del by_shard[shard]
+    return outcomes
+
+
+def run_worker(queue, worker_id=None, batch_size=DEFAULT_BATCH_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS,
+               idle_interval=DEFAULT_IDLE_INTERVAL, exit_when_drained=False, stop_event=None):
+    """
+    キューからファイルをリースして日時を取得し、担当シャードのファイルを移動する処理を繰り返す。
+    exit_when_drained が真ならキューが空になった時点で、そうでなければ stop_event(threading.Event)が
+    セットされるまで動作する。処理した件数の辞書を返す。
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    dest_root = queue.get_meta("dest_root")
+    if dest_root is None:
+        raise ValueError("キューに移動先が設定されていません。先に enqueue を実行してください。")
+    shard_count = int(queue.get_meta("shard_count"))
+    tz_policy = main.TimezonePolicy.load_default()
+    num_threads = main.thread_count()
+    executor = ThreadPoolExecutor(max_workers=num_threads)
+    totals = {"moved": 0, "duplicate": 0, "failed": 0, "skipped": 0, "retried": 0}
+    main.stage_metrics.reset()
+    logger.info("ワーカー %s を開始します(移動先: %s)", worker_id, dest_root)
+    try:
+        while stop_event is None or not stop_event.is_set():
+            queue.heartbeat(worker_id, lease_seconds)
+            did_work = False
+
+            # 日時の取得(どのワーカーでも行える)
+            batch = queue.lease_batch(worker_id, batch_size, lease_seconds)
+            if batch:
+                did_work = True
+                futures = [
+                    (file_id, path, executor.submit(extract_destination, path, dest_root, tz_policy))
+                    for file_id, path in batch
+                ]
+                wait_with_heartbeat(queue, worker_id, [future for _, _, future in futures], lease_seconds)
+                extracted = []
+                for file_id, path, future in futures:
+                    try:
+                        dest_dir, value = future.result()
+                    except Exception as e:
+                        logger.exception("日時取得中に予期せぬエラー: %s", path)
+                        queue.mark_retry(file_id, repr(e))
+                        totals["retried"] += 1
+                        continue
+                    if dest_dir is None:
+                        logger.info("日付情報なし: %s をスキップします。", path)
+                        totals["skipped"] += 1
+                    extracted.append((file_id, dest_dir, value))
+                queue.mark_extracted(extracted, shard_count)
+
+            # 移動(担当シャードのファイルだけを、シャードごとに直列で行う)
+            max_shards = math.ceil(shard_count / max(queue.live_workers(lease_seconds), 1))
+            owned = queue.claim_shards(worker_id, max_shards, lease_seconds)
+            rows = queue.fetch_movable(owned, batch_size * 4)
+            if rows:
+                did_work = True
+                for res in move_owned_files(queue, worker_id, rows, lease_seconds, executor, stop_event):
+                    totals[res if res in totals else "failed"] += 1
+            queue.release_idle_shards(worker_id)
+
+            if not did_work:
+                if exit_when_drained and queue.is_drained():
+                    break
+                if stop_event is not None:
+                    stop_event.wait(idle_interval)
+                else:
+                    time.sleep(idle_interval)
+            else:
+                logger.info(
+                    "累計: 移動 %d / 重複 %d / スキップ %d / 失敗 %d",
+                    totals["moved"], totals["duplicate"], totals["skipped"], totals["failed"],
+                )
+    finally:
+        executor.shutdown(wait=True)
+        main.close_exiftool_workers()
+        queue.release_worker(worker_id)
+        main.stage_metrics.write_reports()
+    return totals
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="SQLite の作業キューで整理処理を複数のワーカーに分担させる")
+    parser.add_argument("--journal-mode", default="delete", choices=["delete", "wal"],
+                        help="SQLite のジャーナルモード(NAS上のキューでは delete)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    enq = sub.add_parser("enqueue", help="ソースフォルダーのメディアファイルを登録する")
+    enq.add_argument("queue")
+    enq.add_argument("source")
+    enq.add_argument("dest")
+    enq.add_argument("--shards", type=int, default=main.DEST_SHARD_COUNT, help="移動先シャード数")
+    work = sub.add_parser("work", help="ワーカーとして処理する")
+    work.add_argument("queue")
+    work.add_argument("--worker-id")
+    work.add_argument("--batch", type=int, default=DEFAULT_BATCH_SIZE)
+    work.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS, help="リースの有効期間(秒)")
+    work.add_argument("--idle-interval", type=float, default=DEFAULT_IDLE_INTERVAL)
+    work.add_argument("--exit-when-drained", action="store_true", help="キューが空になったら終了する")
+    status = sub.add_parser("status", help="状態ごとの件数を表示する")
+    status.add_argument("queue")
+    retry = sub.add_parser("retry-failed", help="失敗したファイルを未処理に戻す")
+    retry.add_argument("queue")
+    args = parser.parse_args()
+
+    main.setup_logging()
+    queue = WorkQueue(args.queue, journal_mode=args.journal_mode)
+    try:
+        if args.command == "enqueue":
+            queue.configure(args.dest, args.shards)
+            added = queue.enqueue(scan_media_files(args.source))
+            logger.info("%d 個のファイルを登録しました。", added)
+        elif args.command == "work":
+            totals = run_worker(
+                queue, worker_id=args.worker_id, batch_size=args.batch, lease_seconds=args.lease,
+                idle_interval=args.idle_interval, exit_when_drained=args.exit_when_drained,
+            )
+            logger.info("ワーカーを終了しました: %s", totals)
+        elif args.command == "status":
+            for state, count in sorted(queue.counts().items()):
+                print(f"{state:<12}{count:>10}")
+        elif args.command == "retry-failed":
+            logger.info("%d 個のファイルを未処理に戻しました。", queue.retry_failed())
+    except ValueError as e:
+        logger.error("%s", e)
+        return 1
+    except KeyboardInterrupt:
+        logger.info("中断しました。")
+        return 130
+    finally:
+        queue.close()
+        main.shutdown_logging()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())